@@ -1,10 +1,13 @@
 import boto3
 import logging
-import json
 
 from config import *
-from rds_handler import SqlHandler
-from credentials import get_secret
+from rds_handler import SqlHandler, read_statement
+from credentials import LazySecret
+from sqs_dispatcher import SqsDispatcher
+from rate_controller import RateController, Stage
+from scheduling import order_scenarios, parse_year_weights
+from instrumentation import instrumented, timed
 
 if logging.getLogger().hasHandlers():
     # The Lambda environment pre-configures a handler logging to stderr. If a handler is already configured,
@@ -13,13 +16,34 @@ if logging.getLogger().hasHandlers():
 else:
     logging.basicConfig(level=logging.INFO)
 
-secret = json.loads(get_secret(DATABASE_SECRET_NAME))
+secret = LazySecret(DATABASE_SECRET_NAME)
 if ENVIRONMENT == 'local':
     secret["host"] = 'host.docker.internal'
 
 sqs_client = boto3.client('sqs')
 
+# Downstream stages in chain order, see RateController
+STAGES = [
+    Stage('esdl', ESDL_QUEUE_URL, 1, None),
+    Stage('etm', ETM_QUEUE_URL, 1, 'esdl'),
+    Stage('esdlUpdater', ESDL_UPDATER_QUEUE_URL, 1, 'etm'),
+    Stage('essim', ESSIM_QUEUE_URL, 1, 'esdlUpdater'),
+    Stage('essimExport', ESSIM_EXPORT_QUEUE_URL, 1, 'essim'),
+    Stage('tennetPostProcessing', TENNET_POST_PROCESSING_QUEUE_URL, TENNET_NETWORKS_PER_SCENARIO, 'essimExport'),
+    Stage('tennetLoadflow', TENNET_LOADFLOW_QUEUE_URL, TENNET_NETWORKS_PER_SCENARIO, 'tennetPostProcessing'),
+    Stage('gasuniePostProcessing', GASUNIE_POST_PROCESSING_QUEUE_URL, 1, 'essimExport'),
+    Stage('gasunieLoadflow', GASUNIE_LOADFLOW_QUEUE_URL, GASUNIE_NETWORKS_PER_SCENARIO, 'gasuniePostProcessing'),
+    Stage('stedinLoadflow', STEDIN_LOADFLOW_QUEUE_URL, 1, 'essimExport'),
+]
+rate_controller = RateController(STAGES)
+year_weights = parse_year_weights(KICK_OFF_YEAR_WEIGHTS)
 
+CANDIDATE_SCENARIOS_SQL = read_statement('sql/candidate_scenarios.sql')
+LOCK_SCENARIO_ROWS_SQL = read_statement('sql/lock_scenario_rows.sql')
+UPDATE_SCENARIO_SQL = read_statement('sql/update_scenario.sql')
+
+
+@instrumented('kick_off')
 def lambda_handler(event, context):
     """
     Grid master Kick Off lambda to initialize calculation of a scenario, limits based on ETM request limit
@@ -33,42 +57,23 @@ def lambda_handler(event, context):
         Lambda Context runtime methods and attributes
         Context doc: https://docs.aws.amazon.com/lambda/latest/dg/python-context-object.html
     """
-    # check messages in following queue to confirm no pile-up
-
-    etm_queue_attributes = sqs_client.get_queue_attributes(
-        QueueUrl=ETM_QUEUE_URL,
-        AttributeNames=['ApproximateNumberOfMessages']
-    )
-    essim_queue_attributes = sqs_client.get_queue_attributes(
-        QueueUrl=ESSIM_QUEUE_URL,
-        AttributeNames=['ApproximateNumberOfMessages']
-    )
-    if int(etm_queue_attributes['Attributes']['ApproximateNumberOfMessages']) > 20:
-        logging.info('Too many messages in ETM queue, skipping kick-off. Number of messages: ' +
-                     str(etm_queue_attributes['Attributes']['ApproximateNumberOfMessages'])
-                     )
+    # admit as many scenarios as the downstream stages can take without building a backlog
+    with timed('rateControl'):
+        admit = rate_controller.admit()
+    if admit == 0:
+        logging.info('Rate controller admits no scenarios, skipping kick-off')
         return
-    elif int(essim_queue_attributes['Attributes']['ApproximateNumberOfMessages']) > ETM_REQUEST_LIMIT_PER_MINUTE:
-        logging.info('Too many messages in ESSIM queue, skipping kick-off. Number of messages: ' +
-                     str(etm_queue_attributes['Attributes']['ApproximateNumberOfMessages'])
-                     )
-        return
-
-    # retrieve a scenarios from db where state = free
-    sql_handler = SqlHandler(secret)
-    with open('sql/get_new_scenarios.sql', 'r') as f:
-        sql_stmt = f.read()
-    sql_stmt = sql_stmt.format('essimExported', round(ETM_REQUEST_LIMIT_PER_MINUTE/6))
-    scenarios = sql_handler.generic_fetchall(sql_stmt)
-    # send every new scenario to the ETM queue
 
-    # Update scenario state in DB
-    with open('sql/update_scenario.sql', 'r') as f:
-        sql_stmt = f.read()
-    sql_handler.update_scenario_state(sql_stmt, scenarios)
+    # claim scenarios from db where state = free and mark them as kicked off in the same transaction, the admitted
+    # scenarios are picked from a larger window of candidates so similar scenarios run back to back
+    with timed('claim'):
+        sql_handler = SqlHandler(secret)
+        scenarios = sql_handler.claim_scenarios(CANDIDATE_SCENARIOS_SQL, LOCK_SCENARIO_ROWS_SQL, UPDATE_SCENARIO_SQL, {
+            'calculationState': KICK_OFF_CLAIM_STATE,
+            'limit': admit * KICK_OFF_CANDIDATE_FACTOR
+        }, select=lambda candidates: order_scenarios(candidates, admit, year_weights))
 
-    for scenario in scenarios:
-        response = sqs_client.send_message(
-            QueueUrl=ESDL_QUEUE_URL,
-            MessageBody=json.dumps(scenario, default=str),
-        )
+    # send every new scenario to the ESDL queue
+    with timed('dispatch'), SqsDispatcher(sqs_client, ESDL_QUEUE_URL) as dispatcher:
+        for scenario in scenarios:
+            dispatcher.send(scenario)
@@ -7,3 +7,38 @@ ESDL_QUEUE_URL = os.environ['ESDL_QUEUE_URL']
 ETM_REQUEST_LIMIT_PER_MINUTE = int(os.environ['ETM_REQUEST_LIMIT_PER_MINUTE'])
 DATABASE_SECRET_NAME = os.environ['DATABASE_SECRET_NAME']
 ENVIRONMENT = os.environ['ENVIRONMENT']
+BUCKET_NAME = os.environ['BUCKET_NAME']
+
+# Downstream queues watched by the rate controller, stages without a queue url are ignored
+ESDL_UPDATER_QUEUE_URL = os.environ.get('ESDL_UPDATER_QUEUE_URL', '')
+ESSIM_EXPORT_QUEUE_URL = os.environ.get('ESSIM_EXPORT_QUEUE_URL', '')
+TENNET_POST_PROCESSING_QUEUE_URL = os.environ.get('TENNET_POST_PROCESSING_QUEUE_URL', '')
+TENNET_LOADFLOW_QUEUE_URL = os.environ.get('TENNET_LOADFLOW_QUEUE_URL', '')
+GASUNIE_POST_PROCESSING_QUEUE_URL = os.environ.get('GASUNIE_POST_PROCESSING_QUEUE_URL', '')
+GASUNIE_LOADFLOW_QUEUE_URL = os.environ.get('GASUNIE_LOADFLOW_QUEUE_URL', '')
+STEDIN_LOADFLOW_QUEUE_URL = os.environ.get('STEDIN_LOADFLOW_QUEUE_URL', '')
+# Messages one scenario creates on the TenneT and GasUnie network queues
+TENNET_NETWORKS_PER_SCENARIO = int(os.environ.get('TENNET_NETWORKS_PER_SCENARIO', 39))
+GASUNIE_NETWORKS_PER_SCENARIO = int(os.environ.get('GASUNIE_NETWORKS_PER_SCENARIO', 1))
+
+KICK_OFF_INTERVAL_MINUTES = float(os.environ.get('KICK_OFF_INTERVAL_MINUTES', 1))
+# Scenarios per minute assumed for a stage before anything was observed, and the lowest estimate allowed
+KICK_OFF_INITIAL_RATE = float(os.environ.get('KICK_OFF_INITIAL_RATE', round(ETM_REQUEST_LIMIT_PER_MINUTE / 6)))
+KICK_OFF_MIN_RATE = float(os.environ.get('KICK_OFF_MIN_RATE', 1))
+# Every admitted scenario makes an ETM request, so a kick-off never admits more than the ETM limit allows within
+# its interval, KICK_OFF_MAX_ADMIT can only lower that cap
+KICK_OFF_ADMIT_LIMIT = int(ETM_REQUEST_LIMIT_PER_MINUTE * KICK_OFF_INTERVAL_MINUTES)
+KICK_OFF_MAX_ADMIT = min(int(os.environ.get('KICK_OFF_MAX_ADMIT', KICK_OFF_ADMIT_LIMIT)), KICK_OFF_ADMIT_LIMIT)
+# Scenarios admitted when the stage queues cannot be read, the fixed admission of the kick-off before the controller
+KICK_OFF_FALLBACK_ADMIT = int(os.environ.get('KICK_OFF_FALLBACK_ADMIT', round(ETM_REQUEST_LIMIT_PER_MINUTE / 6)))
+RATE_CONTROLLER_WINDOW_MINUTES = int(os.environ.get('RATE_CONTROLLER_WINDOW_MINUTES', 5))
+RATE_CONTROLLER_BUFFER_MINUTES = float(os.environ.get('RATE_CONTROLLER_BUFFER_MINUTES', 2))
+RATE_CONTROLLER_MAX_AGE_SECONDS = int(os.environ.get('RATE_CONTROLLER_MAX_AGE_SECONDS', 3600))
+RATE_CONTROLLER_STATE_KEY = os.environ.get('RATE_CONTROLLER_STATE_KEY', 'kickOff/rateController.json')
+
+# calculationState of the scenarios the kick-off claims
+KICK_OFF_CLAIM_STATE = os.environ.get('KICK_OFF_CLAIM_STATE', 'essimExported')
+# Scenarios claimed as candidates per admitted scenario, the scheduler picks the admitted ones among them
+KICK_OFF_CANDIDATE_FACTOR = int(os.environ.get('KICK_OFF_CANDIDATE_FACTOR', 4))
+# Relative downstream cost per scenario year, e.g. '2030:1,2050:2'
+KICK_OFF_YEAR_WEIGHTS = os.environ.get('KICK_OFF_YEAR_WEIGHTS', '')
@@ -0,0 +1,195 @@
+import json
+import logging
+import math
+import time
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+import boto3
+from botocore.exceptions import ClientError
+
+from config import *
+
+# A downstream stage watched by the controller. fanout is the number of messages one scenario creates on the
+# queue of the stage, parent the name of the stage feeding it (None for the first stage after the kick-off)
+Stage = namedtuple('Stage', ['name', 'queue_url', 'fanout', 'parent'])
+
+sqs_client = boto3.client('sqs')
+cloudwatch_client = boto3.client('cloudwatch')
+s3_client = boto3.client('s3')
+
+
+def queue_name(queue_url):
+    return queue_url.rstrip('/').split('/')[-1]
+
+
+def observe_stages(stages, window_minutes=RATE_CONTROLLER_WINDOW_MINUTES, sqs=sqs_client, cloudwatch=cloudwatch_client):
+    """Current depth of every stage queue and its age and drain over the last window_minutes
+
+    Depth comes from the queue attributes, the age of the oldest message and the number of deleted (processed)
+    messages come from the SQS CloudWatch metrics since the queue attributes do not expose them. When the metrics
+    cannot be read (GetMetricData denied or throttled) age and drain are None, so the persisted estimates are kept.
+    """
+    observations = {}
+    for stage in stages:
+        attributes = sqs.get_queue_attributes(
+            QueueUrl=stage.queue_url,
+            AttributeNames=['ApproximateNumberOfMessages', 'ApproximateNumberOfMessagesNotVisible']
+        )['Attributes']
+        observations[stage.name] = {
+            'visible': int(attributes['ApproximateNumberOfMessages']),
+            'inFlight': int(attributes['ApproximateNumberOfMessagesNotVisible']),
+            'ageSeconds': 0.0,
+            'deletedPerMinute': 0.0,
+        }
+
+    queries = []
+    for number, stage in enumerate(stages):
+        for metric, stat in [('ApproximateAgeOfOldestMessage', 'Maximum'), ('NumberOfMessagesDeleted', 'Sum')]:
+            queries.append({
+                'Id': '{}_{}'.format('age' if stat == 'Maximum' else 'deleted', number),
+                'MetricStat': {
+                    'Metric': {'Namespace': 'AWS/SQS', 'MetricName': metric,
+                               'Dimensions': [{'Name': 'QueueName', 'Value': queue_name(stage.queue_url)}]},
+                    'Period': 60,
+                    'Stat': stat,
+                },
+            })
+    end = datetime.utcnow()
+    try:
+        response = cloudwatch.get_metric_data(MetricDataQueries=queries,
+                                              StartTime=end - timedelta(minutes=window_minutes), EndTime=end)
+    except ClientError as ex:
+        logging.warning('Could not read the stage metrics, keeping the drain estimates: {}'.format(ex))
+        for observation in observations.values():
+            observation['ageSeconds'] = observation['deletedPerMinute'] = None
+        return observations
+    for result in response['MetricDataResults']:
+        kind, number = result['Id'].split('_')
+        stage = stages[int(number)]
+        if not result['Values']:
+            continue
+        if kind == 'age':
+            # Values are ordered newest first
+            observations[stage.name]['ageSeconds'] = float(result['Values'][0])
+        else:
+            observations[stage.name]['deletedPerMinute'] = sum(result['Values']) / window_minutes
+    return observations
+
+
+class RateController:
+    """Decides how many scenarios the kick-off admits so the slowest stage stays busy without building a backlog.
+
+    Every stage has a drain rate estimate in messages per minute. While a stage has a backlog its observed drain
+    is its capacity and the estimate follows it as an exponentially weighted average. A stage without backlog
+    only shows the supplied load, so the estimate is kept and raised by probe_gain when the stage keeps up with
+    it, to discover spare capacity. The number of scenarios admitted is the smallest headroom over all stages:
+    the work a stage can drain within the kick-off interval plus buffer_minutes, minus the scenarios already
+    queued at or upstream of it. Estimates are persisted in S3 between invocations. When the queues cannot be
+    read at all, fallback_admit scenarios are admitted.
+    """
+
+    def __init__(self, stages, state_key=RATE_CONTROLLER_STATE_KEY, bucket=BUCKET_NAME,
+                 interval_minutes=KICK_OFF_INTERVAL_MINUTES, buffer_minutes=RATE_CONTROLLER_BUFFER_MINUTES,
+                 max_age_seconds=RATE_CONTROLLER_MAX_AGE_SECONDS, initial_rate=KICK_OFF_INITIAL_RATE,
+                 min_rate=KICK_OFF_MIN_RATE, max_admit=KICK_OFF_MAX_ADMIT, fallback_admit=KICK_OFF_FALLBACK_ADMIT,
+                 smoothing=0.3, probe_gain=0.1):
+        self.stages = [stage for stage in stages if stage.queue_url]
+        self.state_key = state_key
+        self.bucket = bucket
+        self.interval_minutes = interval_minutes
+        self.buffer_minutes = buffer_minutes
+        self.max_age_seconds = max_age_seconds
+        self.initial_rate = initial_rate
+        self.min_rate = min_rate
+        self.max_admit = max_admit
+        self.fallback_admit = fallback_admit
+        self.smoothing = smoothing
+        self.probe_gain = probe_gain
+
+    def load_state(self):
+        try:
+            response = s3_client.get_object(Bucket=self.bucket, Key=self.state_key)
+            return json.loads(response['Body'].read())
+        except ClientError as ex:
+            if ex.response['Error']['Code'] != 'NoSuchKey':
+                logging.warning('Could not load rate controller state: {}'.format(ex))
+        except ValueError as ex:
+            logging.warning('Ignoring unreadable rate controller state: {}'.format(ex))
+        return {'drainRates': {}}
+
+    def save_state(self, state):
+        try:
+            s3_client.put_object(Bucket=self.bucket, Key=self.state_key, Body=json.dumps(state).encode('utf-8'))
+        except ClientError as ex:
+            # The next run starts from the previous estimates, this run still admits what was decided
+            logging.warning('Could not save rate controller state: {}'.format(ex))
+
+    def update_drain_rate(self, stage, previous, observation):
+        """Drain rate estimate of a stage in messages per minute"""
+        floor = self.min_rate * stage.fanout
+        if previous is None:
+            previous = self.initial_rate * stage.fanout
+        observed = observation['deletedPerMinute']
+        if observed is None:
+            # Nothing observed, keep the estimate
+            rate = previous
+        elif observation['visible'] > 0:
+            # Saturated, the observed drain is what the stage can do
+            rate = self.smoothing * observed + (1 - self.smoothing) * previous
+        elif observed >= 0.8 * previous:
+            # Kept up with everything it was given, probe for more
+            rate = max(previous, observed) * (1 + self.probe_gain)
+        else:
+            rate = previous
+        return max(rate, floor)
+
+    def upstream(self, stage):
+        by_name = {stage.name: stage for stage in self.stages}
+        path = [stage]
+        while path[-1].parent in by_name:
+            path.append(by_name[path[-1].parent])
+        return path
+
+    def decide(self, state, observations):
+        """Returns the number of scenarios to admit, the new state and the decision record to log"""
+        drain_rates = {stage.name: self.update_drain_rate(stage, state['drainRates'].get(stage.name),
+                                                          observations[stage.name])
+                       for stage in self.stages}
+
+        headroom = {}
+        for stage in self.stages:
+            # Scenarios that will still pass through this stage
+            pending = sum((observations[s.name]['visible'] + observations[s.name]['inFlight']) / s.fanout
+                          for s in self.upstream(stage))
+            capacity = drain_rates[stage.name] / stage.fanout * (self.interval_minutes + self.buffer_minutes)
+            if (observations[stage.name]['ageSeconds'] or 0) > self.max_age_seconds:
+                capacity = 0
+            headroom[stage.name] = capacity - pending
+
+        bottleneck = min(headroom, key=headroom.get) if headroom else None
+        admit = self.max_admit if bottleneck is None else headroom[bottleneck]
+        admit = int(min(max(math.floor(admit), 0), self.max_admit))
+
+        new_state = {'updated': time.time(), 'drainRates': drain_rates, 'admitted': admit}
+        decision = {
+            'admit': admit,
+            'bottleneck': bottleneck,
+            'stages': {name: dict(observations[name], drainRate=round(drain_rates[name], 3),
+                                  headroom=round(headroom[name], 3)) for name in headroom},
+        }
+        return admit, new_state, decision
+
+    def admit(self):
+        state = self.load_state()
+        try:
+            observations = observe_stages(self.stages)
+        except ClientError as ex:
+            # Without queue depths there is no headroom to compute, admit the fixed amount of the legacy kick-off
+            admit = min(self.fallback_admit, self.max_admit)
+            logging.warning('Could not observe the stages, admitting {} scenarios: {}'.format(admit, ex))
+            return admit
+        admit, new_state, decision = self.decide(state, observations)
+        logging.info('Rate controller decision: {}'.format(json.dumps(decision)))
+        self.save_state(new_state)
+        return admit
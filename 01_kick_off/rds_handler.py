@@ -1,10 +1,37 @@
 import pymysql
+from functools import lru_cache
 from pymysql.cursors import DictCursor
 
+# One connection per container, reused across warm invocations
+connections = {}
+
+
+@lru_cache(maxsize=None)
+def read_statement(path):
+    with open(path, 'r') as f:
+        return f.read()
+
 
 class SqlHandler:
     def __init__(self, db_secret):
-        self.connection = self.connect(db_secret)
+        self.connection = self.get_connection(db_secret)
+
+    @classmethod
+    def get_connection(cls, secret):
+        """Reuse the connection of this container, a ping checks it and reconnects when it was dropped"""
+        key = (secret['host'], secret['port'], secret['username'])
+        connection = connections.get(key)
+        if connection is not None:
+            try:
+                connection.ping(reconnect=True)
+                # End whatever an earlier invocation left open so reads do not see an old snapshot
+                connection.rollback()
+                return connection
+            except pymysql.MySQLError:
+                # Reconnecting failed, open a fresh connection
+                pass
+        connection = connections[key] = cls.connect(secret)
+        return connection
 
     @staticmethod
     def connect(secret):
@@ -33,3 +60,37 @@ class SqlHandler:
             cursor.executemany(update_stmt, scenarios)
 
         self.connection.commit()
+
+    def claim_scenarios(self, candidate_stmt, lock_stmt, update_stmt, parameters, select=None):
+        """Select and update scenarios in a single transaction.
+
+        candidate_stmt reads up to parameters['limit'] distinct scenarioUuids in the claimed state with the number
+        of rows of each. lock_stmt then locks every row of one scenarioUuid (FOR UPDATE SKIP LOCKED), a
+        scenarioUuid is only claimed when all its rows could be locked, so overlapping kick-offs never share or
+        wait for a row. select can narrow down and order the claimed scenarios (the first row of every
+        scenarioUuid), update_stmt is executed per primary key for all rows of the selected ones. Rows of the
+        scenarios left out are released again on commit.
+        """
+        try:
+            self.connection.begin()
+            with self.connection.cursor() as cursor:
+                cursor.execute(candidate_stmt, parameters)
+                candidates = cursor.fetchall()
+                rows = {}
+                for candidate in candidates:
+                    cursor.execute(lock_stmt, dict(parameters, scenarioUuid=candidate['scenarioUuid']))
+                    locked = cursor.fetchall()
+                    # Some rows are held by another kick-off or changed state since the candidates were read
+                    if locked and len(locked) == candidate['rowCount']:
+                        rows[candidate['scenarioUuid']] = locked
+                scenarios = [locked[0] for locked in rows.values()]
+                if select is not None:
+                    scenarios = select(scenarios)
+                updates = [row for scenario in scenarios for row in rows[scenario['scenarioUuid']]]
+                if updates:
+                    cursor.executemany(update_stmt, updates)
+            self.connection.commit()
+        except Exception:
+            self.connection.rollback()
+            raise
+        return scenarios
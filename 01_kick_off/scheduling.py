@@ -0,0 +1,54 @@
+from collections import OrderedDict, deque
+
+
+def parse_year_weights(text):
+    """Parse '2030:1,2050:2.5' into {'2030': 1.0, '2050': 2.5}"""
+    weights = {}
+    for item in filter(None, (part.strip() for part in text.split(','))):
+        year, weight = item.split(':')
+        weights[year.strip()] = float(weight)
+    return weights
+
+
+def group_scenarios(scenarios):
+    """Group scenarios sharing year, ETM scenario and base ESDL, oldest group first.
+
+    Scenarios of a group hit the same TenneT networks and investment mapping, ETM curves and base ESDL, so
+    running them back to back lets downstream containers reuse what they loaded for the previous one. The
+    context scenario location stands in for the ETM scenario id, which is only known after reading it from S3.
+    """
+    groups = OrderedDict()
+    for scenario in sorted(scenarios, key=lambda s: s['scenarioId']):
+        key = (str(scenario['scenarioYear']), scenario['contextScenarioLocation'], scenario['baseEsdlLocation'])
+        groups.setdefault(key, []).append(scenario)
+    return list(groups.values())
+
+
+def order_scenarios(scenarios, limit, year_weights=None):
+    """Pick up to limit scenarios and order them for cache reuse and an even downstream load.
+
+    Groups are kept together and taken round robin from the years in heaviest, lightest, second heaviest,
+    second lightest, ... order, so the loadflow stages see a mix of expensive and cheap years rather than a
+    run of heavy ones while every waiting year gets its turn. Years without a weight count as 1.
+    """
+    year_weights = year_weights or {}
+    by_year = OrderedDict()
+    for group in group_scenarios(scenarios):
+        by_year.setdefault(str(group[0]['scenarioYear']), deque()).append(group)
+
+    by_weight = deque(sorted(by_year, key=lambda year: year_weights.get(year, 1.0), reverse=True))
+    years = []
+    while by_weight:
+        years.append(by_weight.popleft())
+        if by_weight:
+            years.append(by_weight.pop())
+
+    ordered = []
+    while years and len(ordered) < limit:
+        for year in list(years):
+            ordered.extend(by_year[year].popleft())
+            if not by_year[year]:
+                years.remove(year)
+            if len(ordered) >= limit:
+                break
+    return ordered[:limit]
@@ -0,0 +1,6 @@
+SELECT scenarioUuid, COUNT(*) AS rowCount
+FROM scenario_overview
+WHERE calculationState = %(calculationState)s
+GROUP BY scenarioUuid
+ORDER BY MIN(scenarioId)
+LIMIT %(limit)s
\ No newline at end of file
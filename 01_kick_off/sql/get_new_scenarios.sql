@@ -1,5 +0,0 @@
-SELECT *
-FROM scenario_overview
-WHERE calculationState = '{}'
-GROUP BY scenarioUuid
-LIMIT {}
\ No newline at end of file
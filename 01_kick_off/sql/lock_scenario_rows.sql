@@ -0,0 +1,5 @@
+SELECT *
+FROM scenario_overview
+WHERE calculationState = %(calculationState)s AND scenarioUuid = %(scenarioUuid)s
+ORDER BY scenarioId
+FOR UPDATE SKIP LOCKED
\ No newline at end of file
@@ -0,0 +1,3 @@
+-- Lets the kick-off read the scenarioUuids in the requested state from the index alone, with their oldest
+-- scenarioId, and lock the rows of one scenarioUuid without scanning the others
+CREATE INDEX idx_scenario_overview_state_uuid ON scenario_overview (calculationState, scenarioUuid, scenarioId);
@@ -1,3 +1,3 @@
 UPDATE scenario_overview
 SET calculationState= 'kickedOff'
-WHERE scenarioUuid = %(scenarioUuid)s
\ No newline at end of file
+WHERE scenarioId = %(scenarioId)s
\ No newline at end of file
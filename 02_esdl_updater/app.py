@@ -5,10 +5,18 @@ import os
 from io import StringIO
 
 from config import *
-from esdl_updater import update_esdl, update_profiles
+from esdl_updater import EsdlPipeline, update_esdl, update_profiles, ELECTRICITY_PRICE_CSV
+from etm_client import EtmClient
+from profile_store import make_profile_store
 from helper import *
-from credentials import get_secret
-from rds_handler import SqlHandler
+from s3_io import S3StreamWriter
+from sqs_dispatcher import SqsDispatcher
+from sqs_batch import BatchItemFailures
+from instrumentation import instrumented, timed
+from profiling import profiled
+from credentials import LazySecret
+from rds_handler import read_statement
+from state_updates import StateUpdater
 
 if logging.getLogger().hasHandlers():
     # The Lambda environment pre-configures a handler logging to stderr. If a handler is already configured,
@@ -17,13 +25,50 @@ if logging.getLogger().hasHandlers():
 else:
     logging.basicConfig(level=logging.INFO)
 
-secret = json.loads(get_secret(DATABASE_SECRET_NAME))
+secret = LazySecret(DATABASE_SECRET_NAME)
 if ENVIRONMENT == 'local':
     secret["host"] = 'host.docker.internal'
 
 sqs_client = boto3.client('sqs')
+etm_client = EtmClient()
 
+UPDATE_SCENARIO_SQL = read_statement('sql/update_scenario.sql')
+state_updater = StateUpdater('esdl_updated', UPDATE_SCENARIO_SQL, secret, sqs_client)
 
+
+def update_scenario_esdl(body, price_curve, dispatcher, message_id):
+    """Update the base ESDL of a scenario with its ETM results and queue it for ESSIM"""
+    logging.info('starting esdl update for scenarioId: {}'.format(body['scenarioId']))
+    logging.info(json.dumps(body))
+
+    with timed('download'):
+        esdl_string = get_esdl_from_s3(body['baseEsdlLocation'])
+        etm_dict = get_tar_gz_files(body['etmResultLocation'])
+
+    profile_store = make_profile_store('scenario_{}'.format(body['scenarioId']))
+    pipeline = EsdlPipeline()
+    pipeline.add_step(update_esdl, price_curve, profile_store)
+    pipeline.add_step(update_profiles, etm_dict['merit_order.csv'], profile_store)
+
+    # write updated esdl to s3 while it is serialized
+    s3_key = body['bucketFolder'] + 'updatedEsdl.esdl'
+    with timed('update'), S3StreamWriter(s3_key) as esdl_sink:
+        pipeline.run(esdl_string, esdl_sink)
+    # Externally stored profiles must exist before ESSIM picks up the ESDL
+    with timed('storeProfiles'):
+        profile_store.flush()
+
+    # Push message to next queue
+    body['calculationState'] = 'esdlUpdated'
+    body['updatedEsdlLocation'] = s3_key
+
+    logging.info('Successfully updated the esdl with scenarioId: {}'.format(body['scenarioId']))
+    state_updater.update([body])
+    dispatcher.send(body, key=message_id)
+
+
+@instrumented('esdl_updater')
+@profiled('esdl_updater')
 def lambda_handler(event, context):
     """Sample pure Lambda function
 
@@ -38,32 +83,35 @@ def lambda_handler(event, context):
         Context doc: https://docs.aws.amazon.com/lambda/latest/dg/python-context-object.html
     """
     logging.debug(json.dumps(event))
-    sql_handler = SqlHandler(secret)
+    failures = BatchItemFailures()
+    bodies, etm_scenarios = {}, {}
     for record in event['Records']:
-        body = json.loads(record['body'])
-        logging.info('starting esdl update for scenarioId: {}'.format(body['scenarioId']))
-        logging.info(json.dumps(body))
+        with failures.record(record):
+            body = json.loads(record['body'])
+            with timed('download'):
+                etm_scenarios[record['messageId']] = get_json_from_s3(body['contextScenarioLocation'])['contextScenario']
+            bodies[record['messageId']] = body
 
-        esdl_string = get_esdl_from_s3(body['baseEsdlLocation'])
-        context_scenario = get_json_from_s3(body['contextScenarioLocation'])
-        etm_dict = get_tar_gz_files(body['etmResultLocation'])
+    # Fetch the price curves of all distinct ETM scenarios in this batch at once, a curve that could not be
+    # fetched only fails the messages of its scenario
+    with timed('priceCurves'):
+        price_curves = etm_client.get_curves(etm_scenarios.values(), ELECTRICITY_PRICE_CSV)
 
-        updated_esdl = update_esdl(context_scenario['contextScenario'], esdl_string)
-        updated_esdl_with_profiles = update_profiles(updated_esdl, etm_dict['merit_order.csv'])
-
-        # write updated esdl to s3
-        s3_key = body['bucketFolder'] + 'updatedEsdl.esdl'
-        save_to_s3(s3_key, updated_esdl_with_profiles.getvalue())
-
-        # Push message to next queue
-        body['calculationState'] = 'esdlUpdated'
-        body['updatedEsdlLocation'] = s3_key
-
-        logging.info('Successfully updated the esdl with scenarioId: {}'.format(body['scenarioId']))
-        with open('sql/update_scenario.sql', 'r') as f:
-            sql_stmt = f.read()
-        sql_handler.update_scenario_state(sql_stmt, [body])
-        response = sqs_client.send_message(
-            QueueUrl=ESSIM_QUEUE_URL,
-            MessageBody=json.dumps(body, default=str),
-        )
+    # Messages are sent in batches once every record has been processed
+    dispatcher = SqsDispatcher(sqs_client, ESSIM_QUEUE_URL)
+    for record in event['Records']:
+        if record in failures:
+            continue
+        with failures.record(record):
+            price_curve = price_curves[etm_scenarios[record['messageId']]]
+            if isinstance(price_curve, Exception):
+                raise price_curve
+            update_scenario_esdl(bodies[record['messageId']], price_curve, dispatcher, record['messageId'])
+    # Records that failed are redelivered, their messages are sent then. A message that could not be sent only
+    # fails the record it was created for
+    dispatcher.discard(failures.failed)
+    unsent = dispatcher.flush()
+    for record in event['Records']:
+        if record['messageId'] in unsent:
+            failures.fail(record, unsent[record['messageId']])
+    return failures.response()
@@ -4,6 +4,20 @@ ENVIRONMENT = os.environ['ENVIRONMENT']
 ESSIM_QUEUE_URL = os.environ['ESSIM_QUEUE_URL']
 BUCKET_NAME = os.environ['BUCKET_NAME']
 INFLUX_DB_IP = os.environ['INFLUX_DB_IP']
+INFLUX_DB_PORT = int(os.environ.get('INFLUX_DB_PORT', 8086))
+INFLUX_PROFILE_DATABASE = os.environ.get('INFLUX_PROFILE_DATABASE', 'gridmaster_profiles')
 DATABASE_SECRET_NAME = os.environ['DATABASE_SECRET_NAME']
 DATABASE_SCHEMA_NAME = os.environ['DATABASE_SCHEMA_NAME']
-
+# Storage of generated curves, 'inline' (ProfileElements in the ESDL) or 'influxdb' (InfluxDBProfile references)
+PROFILE_STORAGE = os.environ.get('PROFILE_STORAGE', 'inline')
+ETM_API_URL = os.environ.get('ETM_API_URL', 'https://beta-engine.energytransitionmodel.com/api/v3')
+ETM_REQUEST_LIMIT_PER_MINUTE = int(os.environ.get('ETM_REQUEST_LIMIT_PER_MINUTE', 30))
+ETM_REQUEST_TIMEOUT = int(os.environ.get('ETM_REQUEST_TIMEOUT', 30))
+ETM_MAX_WORKERS = int(os.environ.get('ETM_MAX_WORKERS', 4))
+ETM_CACHE_TTL = int(os.environ.get('ETM_CACHE_TTL', 24 * 3600))
+# If script is running in AWS lambda use /tmp storage folder
+ETM_CACHE_DIR = '/tmp/etm_cache' if os.environ.get('AWS_LAMBDA_FUNCTION_NAME') else 'tmp/etm_cache'
+# FIFO queue of the state writer, scenario state is written directly when empty
+STATE_UPDATE_QUEUE_URL = os.environ.get('STATE_UPDATE_QUEUE_URL', '')
+# Profile every invocation, single messages can ask for it with "profile": true
+PROFILE_HANDLER = os.environ.get('PROFILE_HANDLER', 'false').lower() == 'true'
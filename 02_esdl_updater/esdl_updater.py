@@ -1,24 +1,13 @@
-import copy
-import traceback
-
-import requests
 import pandas as pd
-from pathlib import Path
+from collections import defaultdict
 from uuid import uuid4
-from io import StringIO
 from esdl.esdl_handler import EnergySystemHandler
-from datetime import datetime as dt, timedelta as td
-from esdl import DateTimeProfile, QuantityAndUnitType, PhysicalQuantityEnum, UnitEnum, MultiplierEnum, ProfileElement, \
-    ElectricityCommodity, PowerPlant, EnergySystem, Services, DrivenByProfile, InPort, DrivenByDemand, Service, ProfileReference
+from pyecore.resources import URI
+from esdl import DateTimeProfile, QuantityAndUnitType, PhysicalQuantityEnum, UnitEnum, MultiplierEnum, \
+    ElectricityCommodity, PowerPlant, EnergySystem, DrivenByProfile, InPort, ProfileReference
 
 # Constants
-ETM_url = 'https://beta-engine.energytransitionmodel.com/api/v3/scenarios/{}/curves/{}'
 ELECTRICITY_PRICE_CSV = 'electricity_price.csv'
-MERIT_ORDER_CSV = 'merit_order.csv'
-TIME_FORMAT = '%Y-%m-%d %H:%M'
-TIME_FORMAT_merit = '%d-%m-%Y %H:%M'
-base_date = dt.strptime("2018-12-31 23:00", TIME_FORMAT)
-time_step = td(hours=1)
 powerplant_profiles = ["Power Plant Biomass", "Power Plant Coal", "Power Plant Gas Small", "Power Plant Gas Large",
                        "Power Plant Nuclear", "Power Plant Other"]
 carrier_ids = ["RTLH_ODO", "RTLG_ODO", "RTLH_NODO", "RTLG_NODO", "HTLH", "HTLG",
@@ -43,9 +32,76 @@ def make_reference(profile: DateTimeProfile):
     return ProfileReference(id=str(uuid4()), name='Profile reference to {}'.format(profile.name), reference=profile)
 
 
-def update_profiles(ESDL_string, merit_order):
-    esh = EnergySystemHandler()
-    es = esh.load_from_string(ESDL_string)
+def normalize_profiles(profiles: pd.DataFrame, headroom: float = 1.1, zero_floor: float = 0.0001):
+    """Scale every column to its maximum times headroom and replace zeros by zero_floor"""
+    normalized = profiles.div(profiles.max() * headroom, axis=1)
+    # NaN (an all-zero column) compares unequal to 0 and is kept, as in the cell-wise implementation
+    return normalized.where(normalized != 0, zero_floor)
+
+
+class StreamURI(URI):
+    """URI that lets pyecore serialize a resource straight into an open binary stream"""
+
+    def __init__(self, stream, name='updated.esdl'):
+        super().__init__(name)
+        self.stream = stream
+
+    def create_instream(self):
+        raise NotImplementedError('StreamURI can only be used for writing')
+
+    def create_outstream(self):
+        return self.stream
+
+    def close_stream(self):
+        # The owner of the stream decides when it is complete
+        pass
+
+
+class EsdlIndex:
+    """Lookup of the objects in an EnergySystem by type.
+
+    Built with a single walk over the model, objects that a step adds and later steps need to find
+    should be registered with add().
+    """
+
+    def __init__(self, es: EnergySystem):
+        self.by_type = defaultdict(list)
+        for obj in es.eAllContents():
+            self.add(obj)
+
+    def add(self, obj):
+        self.by_type[type(obj)].append(obj)
+
+    def instances(self, eclass):
+        """All objects that are an instance of eclass, including its subclasses"""
+        return [obj for cls, objs in self.by_type.items() if issubclass(cls, eclass) for obj in objs]
+
+
+class EsdlPipeline:
+    """Apply registered transformation steps to a single loaded EnergySystem.
+
+    Each step is called as step(es, index, *args, **kwargs) with the EsdlIndex of the loaded model and
+    modifies the EnergySystem in place, the model is parsed once before the first step and serialized once
+    into output after the last one.
+    """
+
+    def __init__(self):
+        self.steps = []
+
+    def add_step(self, step, *args, **kwargs):
+        self.steps.append((step, args, kwargs))
+        return self
+
+    def run(self, ESDL_string: str, output):
+        esh = EnergySystemHandler()
+        es = esh.load_from_string(ESDL_string)
+        index = EsdlIndex(es)
+        for step, args, kwargs in self.steps:
+            step(es, index, *args, **kwargs)
+        esh.resource.save(output=StreamURI(output))
+
+
+def update_profiles(es: EnergySystem, index: EsdlIndex, merit_order, profile_store):
     # Dataframe. This is equal for all scenario's and years
     grouping_dict = {
         "energy_chp_ultra_supercritical_coal.output (MW)": "Power Plant Coal",
@@ -85,84 +141,52 @@ def update_profiles(ESDL_string, merit_order):
         "industry_chp_wood_pellets.output (MW)": "Power Plant Other",
     }
 
-    # Sum and make deepcopy of merit order
+    # Sum and normalize the grouped merit order
     merit_order_grouped = merit_order.groupby(grouping_dict, axis=1).sum()
-    merit_order_grouped_copy = copy.deepcopy(merit_order_grouped)
-
-    # Normalize value in the copied dataframe
-    for name, column in merit_order_grouped.items():
-        for index, value in column.iteritems():
-            column_max = column.max() * 1.1
-            normalized_value = value / column_max
-            if normalized_value == 0:
-                normalized_value = 0.0001
-            merit_order_grouped_copy.at[index, name] = normalized_value
-
-    time_range = pd.date_range('2018-12-31 23:00:00', periods=8760, freq='H', name='Time')
-    merit_order_grouped_copy.index = time_range
+    merit_order_normalized = normalize_profiles(merit_order_grouped)
 
     profile_dict = {}
     processed_profiles = []
 
     for powerplant_profile in powerplant_profiles:
-        dt_profile = DateTimeProfile(id=str(uuid4()), name=powerplant_profile)
         percent_per_hour = QuantityAndUnitType(id=str(uuid4()), description='ProductionInPercentage',
                                                physicalQuantity=PhysicalQuantityEnum.COEFFICIENT,
                                                unit=UnitEnum.PERCENT, perMultiplier=MultiplierEnum.NONE)
-        dt_profile.profileQuantityAndUnit = percent_per_hour
-        # Process dataframe to add elements to DateTimeProfile
-        for date, value in merit_order_grouped_copy[powerplant_profile].iteritems():
-            from_time = date
-            to_time = from_time + time_step
-            dt_profile.element.append(ProfileElement(from_=from_time, to=to_time, value=float(value)))
-        profile_dict[powerplant_profile] = dt_profile
-
-    for asset in es.eAllContents():
-        if isinstance(asset, PowerPlant):
-            if asset.port[0].carrier.id not in carrier_ids:
-                continue
-
-            pp_outport = None
-            for port in asset.port:
-                if isinstance(port, InPort):
-                    port_carrier = port.carrier.id
-                    carrier_id = essim_etm_mapping[port_carrier]
-                    pp_inport = port
-                if port.carrier.name == 'Electricity':
-                    pp_outport = port
-                    break
-            if pp_outport is None:
-                print('PowerPlant {} has no electricity out ports... skipping!'.format(asset.id))
-                continue
-
-            dbp = DrivenByProfile(id='DbP_{}'.format(asset.id))
-            dbp.energyAsset = asset
-            dbp.port = pp_inport
-            profile = profile_dict[carrier_id]
-            if profile in processed_profiles:
-                profile = make_reference(profile)
-            else:
-                processed_profiles.append(profile)
-            dbp.profile = profile
-            es.services.service.append(dbp)
-            asset.controlStrategy = dbp
-
-    return esh.to_bytesio()
-
-
-def update_esdl(scenario_id: int, ESDL_string: str):
-    # Retrieve scenario-specific electricity price CSV from ETM
-    r = requests.get(ETM_url.format(scenario_id, ELECTRICITY_PRICE_CSV))
-    if r.status_code != 200:
-        raise ValueError('Could not get price information for scenario {}'.format(scenario_id))
-    lines = r.text.splitlines()
-
-    # Remove header row
-    lines.pop(0)
-
-    # Open ESDL file for processing
-    esh = EnergySystemHandler()
-    es = esh.load_from_string(ESDL_string)
+        profile_dict[powerplant_profile] = profile_store.create_profile(
+            powerplant_profile, merit_order_normalized[powerplant_profile].values, percent_per_hour)
+
+    for asset in index.instances(PowerPlant):
+        if asset.port[0].carrier.id not in carrier_ids:
+            continue
+
+        pp_outport = None
+        for port in asset.port:
+            if isinstance(port, InPort):
+                port_carrier = port.carrier.id
+                carrier_id = essim_etm_mapping[port_carrier]
+                pp_inport = port
+            if port.carrier.name == 'Electricity':
+                pp_outport = port
+                break
+        if pp_outport is None:
+            print('PowerPlant {} has no electricity out ports... skipping!'.format(asset.id))
+            continue
+
+        dbp = DrivenByProfile(id='DbP_{}'.format(asset.id))
+        dbp.energyAsset = asset
+        dbp.port = pp_inport
+        profile = profile_dict[carrier_id]
+        if profile in processed_profiles:
+            profile = make_reference(profile)
+        else:
+            processed_profiles.append(profile)
+        dbp.profile = profile
+        es.services.service.append(dbp)
+        asset.controlStrategy = dbp
+        index.add(dbp)
+
+
+def update_esdl(es: EnergySystem, index: EsdlIndex, prices, profile_store):
     if es.energySystemInformation is None:
         raise ValueError('Energy System Information missing in this ESDL')
     if es.energySystemInformation.carriers is None:
@@ -177,23 +201,10 @@ def update_esdl(scenario_id: int, ESDL_string: str):
     if electricity_carrier is None:
         raise ValueError('No Electricity commodity defined in this ESDL')
 
-    # Create a DateTimeProfile with quantity and unit set to Eur per MW
-    dt_profile = DateTimeProfile(id=str(uuid4()), name='ElectricityPriceProfile')
+    # Create a price profile with quantity and unit set to Eur per MW
     euro_per_mw = QuantityAndUnitType(id=str(uuid4()), description='PriceInEuros',
                                       physicalQuantity=PhysicalQuantityEnum.COST,
                                       unit=UnitEnum.EURO, perMultiplier=MultiplierEnum.MEGA, perUnit=UnitEnum.WATT)
-    dt_profile.profileQuantityAndUnit = euro_per_mw
-    profile_time = base_date
-
-    # Process CSV to add elements to DateTimeProfile
-    for line in lines:
-        data = line.split(',')
-        from_time = profile_time
-        to_time = from_time + time_step
-        dt_profile.element.append(ProfileElement(from_=from_time, to=to_time, value=float(data[1])))
-        profile_time = to_time
+    dt_profile = profile_store.create_profile('ElectricityPriceProfile', prices, euro_per_mw)
     # Attach price profile to ElectricityCommodity's cost attribute
     electricity_carrier.cost = dt_profile
-
-    # Save as modified ESDL file
-    return esh.to_string()
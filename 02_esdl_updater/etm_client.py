@@ -0,0 +1,136 @@
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from config import *
+
+
+def parse_price_curve(text):
+    lines = text.splitlines()
+    # Remove header row
+    lines.pop(0)
+    return [float(line.split(',')[1]) for line in lines]
+
+
+class RateBudget:
+    """Sliding window limit on the number of requests started per minute, shared by all threads"""
+
+    def __init__(self, requests_per_minute):
+        self.requests_per_minute = requests_per_minute
+        self.started = deque()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                while self.started and now - self.started[0] >= 60:
+                    self.started.popleft()
+                if len(self.started) < self.requests_per_minute:
+                    self.started.append(now)
+                    return
+                wait = 60 - (now - self.started[0])
+            logging.info('ETM request budget exhausted, waiting {:.1f}s'.format(wait))
+            time.sleep(wait)
+
+
+class EtmClient:
+    """Fetches curves from the ETM API with a pooled session, retries and a TTL cache.
+
+    ETM curves of a scenario do not change, so parsed curves are kept in memory and in cache_dir for
+    cache_ttl seconds. Keep one client per container to reuse connections and cache between invocations.
+    """
+
+    def __init__(self, base_url=ETM_API_URL, requests_per_minute=ETM_REQUEST_LIMIT_PER_MINUTE,
+                 cache_dir=ETM_CACHE_DIR, cache_ttl=ETM_CACHE_TTL, max_workers=ETM_MAX_WORKERS,
+                 timeout=ETM_REQUEST_TIMEOUT):
+        self.base_url = base_url.rstrip('/')
+        self.cache_dir = cache_dir
+        self.cache_ttl = cache_ttl
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self.budget = RateBudget(requests_per_minute)
+        self.memory_cache = {}
+
+        retry = Retry(total=4, backoff_factor=1, status_forcelist=(429, 500, 502, 503, 504),
+                      allowed_methods=frozenset(['GET']), respect_retry_after_header=True)
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_workers, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def curve_url(self, scenario_id, curve_name):
+        return '{}/scenarios/{}/curves/{}'.format(self.base_url, scenario_id, curve_name)
+
+    def get_curve(self, scenario_id, curve_name, parser=parse_price_curve):
+        key = (str(scenario_id), curve_name)
+        cached = self._read_cache(key)
+        if cached is not None:
+            return cached
+
+        self.budget.acquire()
+        response = self.session.get(self.curve_url(scenario_id, curve_name), timeout=self.timeout)
+        if response.status_code != 200:
+            raise ValueError('Could not get {} for scenario {}'.format(curve_name, scenario_id))
+        curve = parser(response.text)
+        self._write_cache(key, curve)
+        return curve
+
+    def get_curves(self, scenario_ids, curve_name, parser=parse_price_curve):
+        """Fetch a curve for every distinct scenario id concurrently, returns a dict keyed by scenario id.
+
+        A curve that could not be fetched is returned as the exception it raised, so the caller can fail only
+        the work that needs it.
+        """
+        def fetch(scenario_id):
+            try:
+                return self.get_curve(scenario_id, curve_name, parser)
+            except Exception as ex:
+                logging.warning('Could not fetch {} for ETM scenario {}: {}'.format(curve_name, scenario_id, ex))
+                return ex
+
+        scenario_ids = list(dict.fromkeys(scenario_ids))
+        if not scenario_ids:
+            return {}
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            return dict(zip(scenario_ids, executor.map(fetch, scenario_ids)))
+
+    def _cache_path(self, key):
+        return os.path.join(self.cache_dir, '{}_{}.json'.format(*key))
+
+    def _read_cache(self, key):
+        entry = self.memory_cache.get(key)
+        if entry is not None and entry[0] > time.time():
+            return entry[1]
+
+        path = self._cache_path(key)
+        try:
+            expires = os.path.getmtime(path) + self.cache_ttl
+            if expires <= time.time():
+                return None
+            with open(path, 'r') as f:
+                curve = json.load(f)
+        except (OSError, ValueError):
+            return None
+        self.memory_cache[key] = (expires, curve)
+        return curve
+
+    def _write_cache(self, key, curve):
+        self.memory_cache[key] = (time.time() + self.cache_ttl, curve)
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            # Write to a temporary file first so concurrent readers never see a partial curve
+            path = self._cache_path(key)
+            with open(path + '.tmp', 'w') as f:
+                json.dump(curve, f)
+            os.replace(path + '.tmp', path)
+        except OSError as ex:
+            logging.warning('Could not write ETM curve cache: {}'.format(ex))
@@ -2,16 +2,13 @@ import tarfile
 from io import BytesIO
 import pandas as pd
 import json
-import boto3
 
 from config import *
-
-s3_client = boto3.client('s3')
+from s3_io import get_bytes, put_bytes
 
 
 def get_tar_gz_files(key):
-    input_tar_file = s3_client.get_object(Bucket=BUCKET_NAME, Key=key)
-    input_tar_content = input_tar_file['Body'].read()
+    input_tar_content = get_bytes(key)
     etm_dict = {}
     with tarfile.open(fileobj=BytesIO(input_tar_content)) as tar:
         for tar_resource in tar:
@@ -22,27 +19,15 @@ def get_tar_gz_files(key):
 
 
 def get_json_from_s3(key):
-    response = s3_client.get_object(
-        Bucket=BUCKET_NAME,
-        Key=key
-    )
-    return json.loads(response['Body'].read().decode('utf-8'))
+    return json.loads(get_bytes(key).decode('utf-8'))
 
 
 def get_esdl_from_s3(key):
-    response = s3_client.get_object(
-        Bucket=BUCKET_NAME,
-        Key=key
-    )
-    esdl_string = response['Body'].read().decode('utf-8')
+    esdl_string = get_bytes(key).decode('utf-8')
     if 'host="http://influxdb"' in esdl_string:
         esdl_string = esdl_string.replace('host="http://influxdb"', 'host="http://{}"'.format(INFLUX_DB_IP))
     return esdl_string
 
 
 def save_to_s3(s3_key, body):
-    response = s3_client.put_object(
-        Bucket=BUCKET_NAME,
-        Key=s3_key,
-        Body=body
-    )
+    put_bytes(s3_key, body)
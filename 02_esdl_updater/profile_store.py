@@ -0,0 +1,85 @@
+import pandas as pd
+from uuid import uuid4
+from influxdb import DataFrameClient
+from esdl import DateTimeProfile, InfluxDBProfile, ProfileElement
+
+from config import *
+
+PROFILE_START = pd.Timestamp('2018-12-31 23:00')
+PROFILE_FREQUENCY = 'H'
+# ESSIM simulates a whole year, every curve needs a value per hour
+PROFILE_HOURS = 8760
+
+
+def profile_time_range(periods):
+    return pd.date_range(PROFILE_START, periods=periods, freq=PROFILE_FREQUENCY)
+
+
+def profile_values(name, values):
+    values = [float(value) for value in values]
+    if len(values) != PROFILE_HOURS:
+        raise ValueError('Profile {} has {} values instead of {}'.format(name, len(values), PROFILE_HOURS))
+    return values
+
+
+class InlineProfileStore:
+    """Stores curves inside the ESDL as a DateTimeProfile with one ProfileElement per hour"""
+
+    def create_profile(self, name, values, quantity_and_unit):
+        values = profile_values(name, values)
+        times = profile_time_range(len(values) + 1).to_pydatetime()
+        dt_profile = DateTimeProfile(id=str(uuid4()), name=name)
+        dt_profile.profileQuantityAndUnit = quantity_and_unit
+        for from_time, to_time, value in zip(times[:-1], times[1:], values):
+            dt_profile.element.append(ProfileElement(from_=from_time, to=to_time, value=value))
+        return dt_profile
+
+    def flush(self):
+        pass
+
+
+class InfluxProfileStore:
+    """Stores curves as fields of an InfluxDB measurement and references them with an InfluxDBProfile.
+
+    Curves are buffered by create_profile and written in a single request by flush, which has to be
+    called before the ESDL is handed to ESSIM.
+    """
+
+    def __init__(self, measurement, host=INFLUX_DB_IP, port=INFLUX_DB_PORT, database=INFLUX_PROFILE_DATABASE):
+        self.measurement = measurement
+        self.host = host
+        self.port = port
+        self.database = database
+        self.fields = {}
+
+    def create_profile(self, name, values, quantity_and_unit):
+        values = profile_values(name, values)
+        self.fields[name] = values
+        times = profile_time_range(len(values) + 1)
+        profile = InfluxDBProfile(id=str(uuid4()), name=name, host='http://' + self.host, port=self.port,
+                                  database=self.database, measurement=self.measurement, field=name,
+                                  startDate=times[0].to_pydatetime(), endDate=times[-1].to_pydatetime(),
+                                  multiplier=1.0)
+        profile.profileQuantityAndUnit = quantity_and_unit
+        return profile
+
+    def flush(self):
+        if not self.fields:
+            return
+        frame = pd.DataFrame(self.fields)
+        frame.index = profile_time_range(len(frame)).tz_localize('UTC')
+        client = DataFrameClient(host=self.host, port=self.port, database=self.database)
+        try:
+            client.create_database(self.database)
+            client.write_points(frame, self.measurement, protocol='line', batch_size=10000)
+        finally:
+            client.close()
+        self.fields = {}
+
+
+def make_profile_store(measurement):
+    if PROFILE_STORAGE == 'influxdb':
+        return InfluxProfileStore(measurement)
+    elif PROFILE_STORAGE == 'inline':
+        return InlineProfileStore()
+    raise ValueError('Unknown profile storage {}'.format(PROFILE_STORAGE))
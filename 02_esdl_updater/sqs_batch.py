@@ -0,0 +1,33 @@
+import logging
+from contextlib import contextmanager
+
+
+class BatchItemFailures:
+    """Collects the records of an SQS batch that failed, so only those messages are redelivered.
+
+    Requires ReportBatchItemFailures in the FunctionResponseTypes of the event source mapping. Process every
+    record inside `with failures.record(record):` and return failures.response() from the handler.
+    """
+
+    def __init__(self):
+        self.failed = []
+
+    @contextmanager
+    def record(self, record):
+        try:
+            yield
+        except Exception:
+            logging.exception('Processing message {} failed, it will be redelivered'.format(record['messageId']))
+            self.failed.append(record['messageId'])
+
+    def fail(self, record, reason):
+        """Fail a record after its block completed, e.g. when the messages it produced could not be sent"""
+        logging.error('Processing message {} failed, it will be redelivered: {}'.format(record['messageId'], reason))
+        if record['messageId'] not in self.failed:
+            self.failed.append(record['messageId'])
+
+    def __contains__(self, record):
+        return record['messageId'] in self.failed
+
+    def response(self):
+        return {'batchItemFailures': [{'itemIdentifier': message_id} for message_id in self.failed]}
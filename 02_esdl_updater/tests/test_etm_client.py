@@ -0,0 +1,148 @@
+"""EtmClient against a local stand-in of the ETM curve API.
+
+Run from 02_esdl_updater with the requirements of the stage installed:
+
+    python -m unittest discover tests
+"""
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+
+# config reads these when the client is imported
+for name in ('ENVIRONMENT', 'ESSIM_QUEUE_URL', 'BUCKET_NAME', 'INFLUX_DB_IP', 'DATABASE_SECRET_NAME',
+             'DATABASE_SCHEMA_NAME'):
+    os.environ.setdefault(name, 'test')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from etm_client import EtmClient, RateBudget  # noqa: E402
+
+CURVE = 'Time,Price (Euros)\n1-00:00,41.5\n1-01:00,39.25\n1-02:00,44.0\n'
+
+
+class EtmStandIn:
+    """Serves CURVE for every scenario, except the ids in missing (404) and failures (503 that many times)"""
+
+    def __init__(self, missing=(), failures=None):
+        self.missing = set(missing)
+        self.failures = dict(failures or {})
+        self.requests = []
+        stand_in = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                scenario_id = self.path.strip('/').split('/')[3]
+                stand_in.requests.append(scenario_id)
+                if scenario_id in stand_in.missing:
+                    self.send_error(404)
+                    return
+                if stand_in.failures.get(scenario_id):
+                    stand_in.failures[scenario_id] -= 1
+                    self.send_error(503)
+                    return
+                content = CURVE.encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/csv')
+                self.send_header('Content-Length', str(len(content)))
+                self.end_headers()
+                self.wfile.write(content)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    @property
+    def url(self):
+        return 'http://127.0.0.1:{}/api/v3'.format(self.server.server_address[1])
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class EtmClientTest(unittest.TestCase):
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.cache_dir, ignore_errors=True)
+
+    def client(self, stand_in, **kwargs):
+        kwargs.setdefault('cache_ttl', 3600)
+        return EtmClient(base_url=stand_in.url, cache_dir=self.cache_dir, requests_per_minute=100, **kwargs)
+
+    def serve(self, **kwargs):
+        stand_in = EtmStandIn(**kwargs)
+        self.addCleanup(stand_in.stop)
+        return stand_in
+
+    def test_curve_is_parsed_and_cached_in_memory(self):
+        stand_in = self.serve()
+        client = self.client(stand_in)
+        self.assertEqual(client.get_curve(1, 'electricity_price.csv'), [41.5, 39.25, 44.0])
+        self.assertEqual(client.get_curve(1, 'electricity_price.csv'), [41.5, 39.25, 44.0])
+        self.assertEqual(stand_in.requests, ['1'])
+
+    def test_disk_cache_is_shared_between_clients(self):
+        stand_in = self.serve()
+        self.client(stand_in).get_curve(1, 'electricity_price.csv')
+        self.assertEqual(self.client(stand_in).get_curve(1, 'electricity_price.csv'), [41.5, 39.25, 44.0])
+        self.assertEqual(stand_in.requests, ['1'])
+
+    def test_expired_cache_is_fetched_again(self):
+        stand_in = self.serve()
+        self.client(stand_in, cache_ttl=60).get_curve(1, 'electricity_price.csv')
+        path = os.path.join(self.cache_dir, '1_electricity_price.csv.json')
+        os.utime(path, (time.time() - 120, time.time() - 120))
+        self.client(stand_in, cache_ttl=60).get_curve(1, 'electricity_price.csv')
+        self.assertEqual(stand_in.requests, ['1', '1'])
+
+        client = self.client(stand_in, cache_ttl=60)
+        client.get_curve(2, 'electricity_price.csv')
+        with mock.patch('etm_client.time.time', return_value=time.time() + 120):
+            client.get_curve(2, 'electricity_price.csv')
+        self.assertEqual(stand_in.requests, ['1', '1', '2', '2'])
+
+    def test_server_errors_are_retried(self):
+        stand_in = self.serve(failures={'1': 2})
+        self.assertEqual(self.client(stand_in).get_curve(1, 'electricity_price.csv'), [41.5, 39.25, 44.0])
+        self.assertEqual(stand_in.requests, ['1', '1', '1'])
+
+    def test_get_curves_fetches_distinct_scenarios_and_returns_failures(self):
+        stand_in = self.serve(missing={'3'})
+        curves = self.client(stand_in).get_curves([1, 2, 1, 3], 'electricity_price.csv')
+        self.assertEqual(curves[1], [41.5, 39.25, 44.0])
+        self.assertEqual(curves[2], [41.5, 39.25, 44.0])
+        self.assertIsInstance(curves[3], ValueError)
+        self.assertEqual(sorted(stand_in.requests), ['1', '2', '3'])
+        self.assertFalse(os.path.exists(os.path.join(self.cache_dir, '3_electricity_price.csv.json')))
+
+
+class RateBudgetTest(unittest.TestCase):
+    def test_waits_until_the_oldest_request_leaves_the_window(self):
+        clock = [1000.0]
+        sleeps = []
+
+        def sleep(seconds):
+            sleeps.append(seconds)
+            clock[0] += seconds
+
+        budget = RateBudget(2)
+        with mock.patch('etm_client.time.monotonic', lambda: clock[0]), mock.patch('etm_client.time.sleep', sleep):
+            budget.acquire()
+            clock[0] += 10
+            budget.acquire()
+            self.assertEqual(sleeps, [])
+            budget.acquire()
+        self.assertEqual(sleeps, [50.0])
+        self.assertEqual(clock[0], 1060.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
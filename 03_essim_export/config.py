@@ -7,6 +7,7 @@ BUCKET_NAME = os.environ['BUCKET_NAME']
 INFLUX_DB_IP = os.environ['INFLUX_DB_IP']
 DATABASE_SECRET_NAME = os.environ['DATABASE_SECRET_NAME']
 DATABASE_SCHEMA_NAME = os.environ['DATABASE_SCHEMA_NAME']
+EXPORT_MAX_WORKERS = int(os.environ.get('EXPORT_MAX_WORKERS', 5))
 
 
 MAPPING_DATA = read_excel('hic_description_final.xlsx', sheet_name='Site_mapping', header=0, index_col=None,
@@ -31,3 +32,9 @@ H2_CARRIER_IDS = ['H2_new']
 H2_ASSET_NAMES = ['ImportH2_MV', 'ExportH2_Per', 'ExportH2_new_Hinterland']
 CO2_CLASS = 'GConnection'
 CO2_CARRIER_IDS = ['CO2_F', 'CO2_B', 'CO2_P']
+# FIFO queue of the state writer, scenario state is written directly when empty
+STATE_UPDATE_QUEUE_URL = os.environ.get('STATE_UPDATE_QUEUE_URL', '')
+# Skip runs whose completion marker matches the inputs and code, set to false to force recomputing
+SKIP_COMPLETED_STAGES = os.environ.get('SKIP_COMPLETED_STAGES', 'true').lower() == 'true'
+# Profile every invocation, single messages can ask for it with "profile": true
+PROFILE_HANDLER = os.environ.get('PROFILE_HANDLER', 'false').lower() == 'true'
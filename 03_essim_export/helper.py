@@ -1,24 +1,15 @@
+import gzip
 import pandas as pd
-from io import BytesIO
-import boto3
+from io import BytesIO, TextIOWrapper
+from concurrent.futures import ThreadPoolExecutor
 import tarfile
 
 from config import *
-
-s3_client = boto3.client('s3')
-
-
-def save_to_s3(key, bytestream):
-    s3_client.put_object(
-        Bucket=BUCKET_NAME,
-        Key=key,
-        Body=bytestream.getvalue()
-    )
+from s3_io import S3StreamWriter, get_bytes
 
 
 def get_tar_gz_files(key):
-    input_tar_file = s3_client.get_object(Bucket=BUCKET_NAME, Key=key)
-    input_tar_content = input_tar_file['Body'].read()
+    input_tar_content = get_bytes(key)
     file_dict = {}
     with tarfile.open(fileobj=BytesIO(input_tar_content)) as tar:
         for tar_resource in tar:
@@ -108,12 +99,50 @@ def structure_table(original_influxdb_dataframe):
     return df
 
 
-def df_to_buffer(df, compression='infer'):
+def df_to_buffer(df, compression='infer', index=True):
     buffer = BytesIO()
-    df.to_csv(buffer, compression=compression, sep=';', decimal='.')
+    df.to_csv(buffer, compression=compression, sep=';', index=index, decimal='.')
     buffer.seek(0)
     return buffer
 
 
-def pandasify_s3_key(s3_key):
-    return 's3://' + BUCKET_NAME + '/' + s3_key
+def split_co2_frame(co2_df):
+    # Derive the CO2 carrier from the asset name once and partition the frame in a single pass
+    carrier_pattern = '(' + '|'.join(CO2_CARRIER_IDS) + ')'
+    carrier = co2_df['assetName'].str.extract(carrier_pattern, expand=False)
+    carrier = pd.Categorical(carrier, categories=CO2_CARRIER_IDS)
+    positions = co2_df.groupby(carrier, observed=True).indices
+    return {carrier_id: co2_df.iloc[positions.get(carrier_id, [])] for carrier_id in CO2_CARRIER_IDS}
+
+
+def write_csv_gzip(df, sink, index=True):
+    # Compress while writing so the uncompressed csv is never held in memory
+    with gzip.GzipFile(fileobj=sink, mode='wb') as gzip_file, \
+            TextIOWrapper(gzip_file, encoding='utf-8', newline='') as text:
+        df.to_csv(text, sep=';', index=index, decimal='.')
+
+
+def write_gasunie_tarball(essim_methane, essim_hydrogen, sink):
+    essim_methane_buffer = df_to_buffer(essim_methane)
+    essim_hydrogen_buffer = df_to_buffer(essim_hydrogen)
+    # Stream mode, the compressed archive is written straight into the sink
+    with tarfile.open(fileobj=sink, mode='w|gz') as tar:
+        info = tarfile.TarInfo('methane.csv')
+        info.size = essim_methane_buffer.getbuffer().nbytes  # this is crucial
+        tar.addfile(info, essim_methane_buffer)
+        info = tarfile.TarInfo('hydrogen.csv')
+        info.size = essim_hydrogen_buffer.getbuffer().nbytes
+        tar.addfile(info, fileobj=essim_hydrogen_buffer)
+
+
+def export_artifacts(artifacts, max_workers=EXPORT_MAX_WORKERS):
+    """Serialize and upload artifacts concurrently, artifacts maps an s3 key to a callable writing into a sink"""
+    def serialize_and_save(key, serializer):
+        with S3StreamWriter(key) as sink:
+            serializer(sink)
+        return key
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(serialize_and_save, key, serializer) for key, serializer in artifacts.items()]
+        # Surface the first failed upload instead of silently dropping it
+        return [future.result() for future in futures]
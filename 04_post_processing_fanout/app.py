@@ -1,9 +1,11 @@
 import json
 import logging
 import boto3
-from copy import deepcopy
 
 from config import *
+from sqs_dispatcher import SqsDispatcher
+from sqs_batch import BatchItemFailures
+from instrumentation import instrumented
 
 if logging.getLogger().hasHandlers():
     # The Lambda environment pre-configures a handler logging to stderr. If a handler is already configured,
@@ -16,6 +18,7 @@ s3_client = boto3.client('s3')
 sqs_client = boto3.client('sqs')
 
 
+@instrumented('post_processing_fanout')
 def lambda_handler(event, context):
     """Sample pure Lambda function
 
@@ -29,18 +32,17 @@ def lambda_handler(event, context):
         Lambda Context runtime methods and attributes
         Context doc: https://docs.aws.amazon.com/lambda/latest/dg/python-context-object.html
     """
-    logging.info(json.dumps(event))
+    logging.debug(json.dumps(event))
+    failures = BatchItemFailures()
     for record in event['Records']:
-        sns_body = json.loads(record['body'])
-        body = json.loads(sns_body['Message'])
-        logging.debug(json.dumps(body))
-        logging.info('Starting TenneT fanout for scenarioId: {}'.format(body['scenarioId']))
-
-        for investment_path, network_id in INVESTMENT_MODEL_MAP[str(body['scenarioYear'])].iteritems():
-            temp_body = deepcopy(body)
-            temp_body['networkId'] = network_id
-            temp_body['tennetInvestmentPath'] = investment_path
-            response = sqs_client.send_message(
-                QueueUrl=TENNET_POST_PROCESSING_QUEUE_URL,
-                MessageBody=json.dumps(temp_body, default=str),
-            )
+        with failures.record(record):
+            sns_body = json.loads(record['body'])
+            body = json.loads(sns_body['Message'])
+            logging.debug(json.dumps(body))
+            logging.info('Starting TenneT fanout for scenarioId: {}'.format(body['scenarioId']))
+
+            with SqsDispatcher(sqs_client, TENNET_POST_PROCESSING_QUEUE_URL) as dispatcher:
+                for investment_path, network_id in INVESTMENT_MODEL_MAP[str(body['scenarioYear'])].iteritems():
+                    # The body only holds flat values, a shallow copy per investment path is enough
+                    dispatcher.send(dict(body, networkId=network_id, tennetInvestmentPath=investment_path))
+    return failures.response()
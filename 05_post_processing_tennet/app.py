@@ -1,12 +1,18 @@
 import json
 import logging
 import boto3
-import pandas as pd
+from copy import deepcopy
 
 from helper import *
-from credentials import get_secret
-from rds_handler import SqlHandler
+from idempotency import StageRun
+from credentials import LazySecret
+from rds_handler import read_statement
+from state_updates import StateUpdater
 from config import *
+from sqs_dispatcher import SqsDispatcher
+from sqs_batch import BatchItemFailures
+from instrumentation import instrumented, timed
+from profiling import profiled
 
 
 if logging.getLogger().hasHandlers():
@@ -18,11 +24,41 @@ else:
 
 sqs_client = boto3.client('sqs')
 
-secret = json.loads(get_secret(DATABASE_SECRET_NAME))
+secret = LazySecret(DATABASE_SECRET_NAME)
 if ENVIRONMENT == 'local':
     secret["host"] = 'host.docker.internal'
 
+UPDATE_SCENARIO_SQL = read_statement('sql/update_scenario.sql')
+state_updater = StateUpdater('tennet_post_processed', UPDATE_SCENARIO_SQL, secret, sqs_client)
 
+
+def post_process_tennet(body, s3_key, networks):
+    """Nodal electricity curves of a scenario on its TenneT network, networks caches the networks of a batch"""
+    with timed('download'):
+        # Fetch ETM data
+        etm_dict = get_tar_gz_files(body['etmResultLocation'])
+        logging.info('Retrieved ETM curves, found {}'.format(len(etm_dict)))
+        # Fetch electricity ESSIM data
+        essim_df = read_csv(body['essimExportTennetLocation'], compression='gzip', sep=';', decimal='.', index_col='hour')
+        # Process Electricity Load flow stuff
+        investment_model_map, cat, reg = get_static_data()
+
+        sites = get_essim_sites(body)
+        if body['networkId'] not in networks:
+            networks[body['networkId']] = get_network_database(body['networkId'])
+        network = deepcopy(networks[body['networkId']])
+    with timed('compute'):
+        power = electricity_post_processing(sites, etm_dict['merit_order.csv'], essim_df, cat, reg, network)
+    with timed('upload'):
+        to_csv(power, s3_key, compression='gzip', sep=';', decimal='.')
+    return {
+        'calculationState': 'postProcessingDone',
+        'postProcessingTennetLocation': s3_key,
+    }
+
+
+@instrumented('post_processing_tennet')
+@profiled('post_processing_tennet')
 def lambda_handler(event, context):
     """
     Parameters
@@ -35,46 +71,46 @@ def lambda_handler(event, context):
         Lambda Context runtime methods and attributes
         Context doc: https://docs.aws.amazon.com/lambda/latest/dg/python-context-object.html
     """
-    logging.info(json.dumps(event))
-    sql_handler = SqlHandler(secret)
+    logging.debug(json.dumps(event))
+    failures = BatchItemFailures()
+    networks = {}
+    # Messages are sent in batches once every record has been processed
+    dispatcher = SqsDispatcher(sqs_client, TENNET_LOADFLOW_QUEUE_URL)
     for record in event['Records']:
-        body = json.loads(record['body'])
-        logging.debug(json.dumps(body))
-        logging.info('starting post processing with scenarioId: {}'.format(body['scenarioId']))
+        with failures.record(record):
+            body = json.loads(record['body'])
+            logging.debug(json.dumps(body))
+            logging.info('starting post processing with scenarioId: {}'.format(body['scenarioId']))
 
-        # Fetch ETM data
-        etm_dict = get_tar_gz_files(body['etmResultLocation'])
-        logging.info('Retrieved ETM curves, found {}'.format(len(etm_dict)))
-        # Fetch electricity ESSIM data
-        essim_s3_key = pandasify_s3_key(body['essimExportTennetLocation'])
-        essim_df = pd.read_csv(essim_s3_key, compression='gzip', sep=';', decimal='.', index_col='hour')
-        # Process Electricity Load flow stuff
-        investment_model_map, cat, reg = get_static_data()
+            output_folder = body['bucketFolder'] + 'tennetInvestmentModels/' + body['tennetInvestmentPath'] + '/'
+            inputs = [body['etmResultLocation'], body['essimExportTennetLocation'],
+                      (body['bucketName'], essim_sites_key(body)), (NETWORK_BUCKET_NAME, body['networkId'] + '.sqlite')]
+            run = StageRun('tennet_post_processing', output_folder + 'postProcessedTennet.done.json', inputs)
+            outputs = run.completed()
+            if outputs is None:
+                try:
+                    outputs = post_process_tennet(body, output_folder + 'postProcessedTennet.csv.gz', networks)
+                except ValueError as ex:
+                    # The input data of this scenario can not be processed, retrying will not help
+                    logging.error(ex)
+                    logging.error('Post processing failed for scenarioId {}'.format(body['scenarioId']))
+                    continue
+                run.complete(outputs)
 
-        sites = get_essim_sites(body)
-        network = get_network_database(body['networkId'])
-        try:
-            power = electricity_post_processing(sites, etm_dict['merit_order.csv'], essim_df, cat, reg, network)
-        except ValueError as ex:
-            logging.error(ex)
-            logging.error('Post processing failed for scenarioId {}'.format(body['scenarioId']))
-            return
-        s3_key = body['bucketFolder'] + 'tennetInvestmentModels/' + body['tennetInvestmentPath'] + '/postProcessedTennet.csv.gz'
-        pandas_s3_key = pandasify_s3_key(s3_key)
-        power.to_csv(pandas_s3_key, compression='gzip', sep=';', decimal='.')
-
-        update_list = []
-        body['calculationState'] = 'postProcessingDone'
-        body['postProcessingTennetLocation'] = s3_key
-
-        response = sqs_client.send_message(
-            QueueUrl=TENNET_LOADFLOW_QUEUE_URL,
-            MessageBody=json.dumps(body, default=str),
-        )
-        logging.info(
-            'Successfully calculated TenneT post processing with scenarioId: {} and network name {}'.format(
-                body['scenarioId'], body['networkId']))
-
-        with open('sql/update_scenario.sql', 'r') as f:
-            sql_stmt = f.read()
-        sql_handler.update_scenario_state(sql_stmt, update_list)
+            update_list = []
+            body.update(outputs)
+
+            dispatcher.send(body, key=record['messageId'])
+            logging.info(
+                'Successfully calculated TenneT post processing with scenarioId: {} and network name {}'.format(
+                    body['scenarioId'], body['networkId']))
+
+            state_updater.update(update_list)
+    # Records that failed are redelivered, their messages are sent then. A message that could not be sent only
+    # fails the record it was created for
+    dispatcher.discard(failures.failed)
+    unsent = dispatcher.flush()
+    for record in event['Records']:
+        if record['messageId'] in unsent:
+            failures.fail(record, unsent[record['messageId']])
+    return failures.response()
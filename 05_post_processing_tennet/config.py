@@ -6,3 +6,9 @@ NETWORK_BUCKET_NAME = os.environ['NETWORK_BUCKET_NAME']
 DATABASE_SECRET_NAME = os.environ['DATABASE_SECRET_NAME']
 DATABASE_SCHEMA_NAME = os.environ['DATABASE_SCHEMA_NAME']
 TENNET_LOADFLOW_QUEUE_URL = os.environ['TENNET_LOADFLOW_QUEUE_URL']
+# FIFO queue of the state writer, scenario state is written directly when empty
+STATE_UPDATE_QUEUE_URL = os.environ.get('STATE_UPDATE_QUEUE_URL', '')
+# Skip runs whose completion marker matches the inputs and code, set to false to force recomputing
+SKIP_COMPLETED_STAGES = os.environ.get('SKIP_COMPLETED_STAGES', 'true').lower() == 'true'
+# Profile every invocation, single messages can ask for it with "profile": true
+PROFILE_HANDLER = os.environ.get('PROFILE_HANDLER', 'false').lower() == 'true'
@@ -3,12 +3,11 @@ import pandapower as pp
 from io import BytesIO
 import tarfile
 import logging
-import boto3
+from functools import lru_cache
 
 from networktools.postprocessing import make_nodal_ecurves
 from config import *
-
-s3_client = boto3.client('s3')
+from s3_io import get_bytes, read_csv, to_csv
 
 
 def electricity_post_processing(sites, etm_curve, essim_df, cat, reg, network):
@@ -35,15 +34,17 @@ def electricity_post_processing(sites, etm_curve, essim_df, cat, reg, network):
 
 def save_power_to_s3(body, power, network_name):
     s3_tennet_key = body['bucketFolder'] + 'tennetLoadFlow/' + network_name + '/postProcessedTennet.csv.gz'
-    s3_client.put_object(
-        Bucket=BUCKET_NAME,
-        Key=s3_tennet_key,
-        Body=df_to_buffer(power)
-    )
+    to_csv(power, s3_tennet_key, compression='gzip', sep=';', decimal='.')
     return s3_tennet_key
 
 
 def get_static_data():
+    # Parsed once per container, every caller gets its own copy
+    return tuple(df.copy() for df in read_static_data())
+
+
+@lru_cache()
+def read_static_data():
     investment_model_map = pd.read_csv('data/investments_investments_model_mapping.csv', sep=';', index_col='index', dtype=str)
     cat = pd.read_csv('data/etm_curves_categorization.csv', sep=';', decimal=',', index_col=0)
     reg = pd.read_csv('data/etm_ecurves_regionalization.csv', sep=';', decimal=',', index_col=0)
@@ -51,31 +52,20 @@ def get_static_data():
 
 
 def get_network_database(network_name):
-    response = s3_client.get_object(
-        Bucket=NETWORK_BUCKET_NAME,
-        Key=network_name + '.sqlite'
-    )
+    content = get_bytes(network_name + '.sqlite', bucket=NETWORK_BUCKET_NAME)
     # If script is running in AWS lambda use /tmp storage folder, max 500 MB ephemeral storage
     if os.environ.get('AWS_LAMBDA_FUNCTION_NAME'):
         write_path = '/tmp/network.sqlite'
     else:
         write_path = 'tmp/network.sqlite'
     with open(write_path, 'wb') as f:
-        f.write(response['Body'].read())
+        f.write(content)
     net = pp.from_sqlite(write_path)
     return net
 
 
-def df_to_buffer(df):
-    buffer = BytesIO()
-    df.to_csv(buffer, compression='gzip', sep=';', decimal='.')
-    buffer.seek(0)
-    return buffer.getvalue()
-
-
 def get_tar_gz_files(key):
-    input_tar_file = s3_client.get_object(Bucket=BUCKET_NAME, Key=key)
-    input_tar_content = input_tar_file['Body'].read()
+    input_tar_content = get_bytes(key)
     etm_dict = {}
     with tarfile.open(fileobj=BytesIO(input_tar_content)) as tar:
         for tar_resource in tar:
@@ -85,20 +75,18 @@ def get_tar_gz_files(key):
     return etm_dict
 
 
+def essim_sites_key(body):
+    return body['bucketFolder'] + 'tennetInvestmentModels/' + body['tennetInvestmentPath'] + '/essim_sites.csv.gz'
+
+
 def get_essim_sites(body):
-    s3_essim_sites_key = 's3://'+body['bucketName']+'/'+body['bucketFolder'] + 'tennetInvestmentModels/'\
-                         + body['tennetInvestmentPath'] + '/essim_sites.csv.gz'
-    sites = pd.read_csv(s3_essim_sites_key, index_col=0, decimal='.', sep=';')
+    sites = read_csv(essim_sites_key(body), bucket=body['bucketName'], index_col=0, decimal='.', sep=';')
     if "substation [t-1]" in sites.columns:
         sites = sites.rename(columns={"substation [t-1]": "substation"})
     sites['sector'] = sites['sector'].apply(lambda x: x.replace('_', ' '))
     return sites
 
 
-def pandasify_s3_key(s3_key):
-    return 's3://' + BUCKET_NAME + '/' + s3_key
-
-
 def determine_investment_paths(network_name):
     investment_model_map = pd.read_csv('data/investments_investments_model_mapping.csv', sep=';', index_col='index', dtype=str, decimal='.')
     investment_list = investment_model_map[investment_model_map.apply(lambda row: row.str.contains(network_name).any(), axis=1)].index.tolist()
@@ -0,0 +1,36 @@
+import re
+
+from config import *
+from rds_handler import SqlHandler
+from sqs_dispatcher import SqsDispatcher
+
+PARAMETER_PATTERN = re.compile(r'%\((\w+)\)s')
+
+
+class StateUpdater:
+    """Records the scenario state changes of a stage.
+
+    With STATE_UPDATE_QUEUE_URL set every row is sent as a {'statement': ..., 'params': ...} event to that FIFO
+    queue, grouped per scenarioId so the state writer (10_state_writer) applies the changes of a scenario in
+    order and in bulk. Without it the statement is executed on the database right away.
+    """
+
+    def __init__(self, statement_name, statement, secret, sqs_client, queue_url=STATE_UPDATE_QUEUE_URL):
+        self.statement_name = statement_name
+        self.statement = statement
+        self.parameters = sorted(set(PARAMETER_PATTERN.findall(statement)))
+        self.secret = secret
+        self.sqs_client = sqs_client
+        self.queue_url = queue_url
+
+    def update(self, rows):
+        if not rows:
+            return
+        if not self.queue_url:
+            SqlHandler(self.secret).update_scenario_state(self.statement, rows)
+            return
+        with SqsDispatcher(self.sqs_client, self.queue_url) as dispatcher:
+            for row in rows:
+                # Only send what the statement uses
+                params = {name: row.get(name) for name in self.parameters}
+                dispatcher.send({'statement': self.statement_name, 'params': params}, group_id=str(row['scenarioId']))
@@ -1,12 +1,17 @@
 import json
 import logging
 import boto3
-from copy import deepcopy
 
 from helper import *
+from s3_io import s3_client, to_csv
 from config import *
-from credentials import get_secret
-from rds_handler import SqlHandler
+from credentials import LazySecret
+from rds_handler import read_statement
+from state_updates import StateUpdater
+from sqs_dispatcher import SqsDispatcher
+from sqs_batch import BatchItemFailures
+from instrumentation import instrumented, timed
+from profiling import profiled
 
 if logging.getLogger().hasHandlers():
     # The Lambda environment pre-configures a handler logging to stderr. If a handler is already configured,
@@ -15,14 +20,18 @@ if logging.getLogger().hasHandlers():
 else:
     logging.basicConfig(level=logging.INFO)
 
-s3_client = boto3.client('s3')
 sqs_client = boto3.client('sqs')
 
-secret = json.loads(get_secret(DATABASE_SECRET_NAME))
+secret = LazySecret(DATABASE_SECRET_NAME)
 if ENVIRONMENT == 'local':
     secret["host"] = 'host.docker.internal'
 
+UPDATE_SCENARIO_SQL = read_statement('sql/update_scenario.sql')
+state_updater = StateUpdater('gasunie_post_processed', UPDATE_SCENARIO_SQL, secret, sqs_client)
 
+
+@instrumented('post_processing_gasunie')
+@profiled('post_processing_gasunie')
 def lambda_handler(event, context):
     """
 
@@ -36,50 +45,58 @@ def lambda_handler(event, context):
         Lambda Context runtime methods and attributes
         Context doc: https://docs.aws.amazon.com/lambda/latest/dg/python-context-object.html
     """
-    sql_handler = SqlHandler(secret)
+    logging.debug(json.dumps(event))
+    failures = BatchItemFailures()
+    # Messages are sent in batches once every record has been processed
+    dispatcher = SqsDispatcher(sqs_client, GASUNIE_LOADFLOW_QUEUE_URL)
     for record in event['Records']:
-        sns_body = json.loads(record['body'])
-        body = json.loads(sns_body['Message'])
-        logging.info(json.dumps(event))
-        logging.info('starting GasUnie post processing with scenarioId: {}'.format(body['scenarioId']))
+        with failures.record(record):
+            sns_body = json.loads(record['body'])
+            body = json.loads(sns_body['Message'])
+            logging.info('starting GasUnie post processing with scenarioId: {}'.format(body['scenarioId']))
 
-        etm_dict = get_tar_gz_files(body['etmResultLocation'], data_type='etm')
-        # Get ESSIM export for Methane/Hydrogen
-        essim_gas = get_tar_gz_files(body['essimExportGasunieLocation'], data_type='normal')  # [24:]
-        # Process Gasunie loadflow stuff
-        essim_gas = fix_essim_df(essim_gas)
+            with timed('download'):
+                etm_dict = get_tar_gz_files(body['etmResultLocation'], data_type='etm')
+                # Get ESSIM export for Methane/Hydrogen
+                essim_gas = get_tar_gz_files(body['essimExportGasunieLocation'], data_type='normal')  # [24:]
+            # Process Gasunie loadflow stuff
+            essim_gas = fix_essim_df(essim_gas)
 
-        # Find which networks have been initialized in the bucket and calculate them
-        paginator = s3_client.get_paginator('list_objects_v2')
-        result = paginator.paginate(Bucket=BUCKET_NAME, Prefix=body['bucketFolder'] +'gasunieInvestmentModels/', Delimiter='/')
-        network_list = []
-        for prefix in result.search('CommonPrefixes'):
-            network_list.append(prefix.get('Prefix'))
-        update_list = []
-        for network in network_list:
-            temp_body = deepcopy(body)
-            try:
-                assignment_csv, s3_gasunie_assignment_key, mca, s3_gasunie_mca_key = mca_post_processing(network, body,
-                    essim_gas['methane.csv'], etm_dict['network_gas.csv'], essim_gas['hydrogen.csv'], etm_dict['hydrogen.csv'])
-            except FileNotFoundError:
-                continue
-            mca.to_csv(pandasify_s3_key(s3_gasunie_mca_key), compression='gzip', sep=';', decimal='.')
-            assignment_csv.to_csv(pandasify_s3_key(s3_gasunie_assignment_key), compression='gzip',
-                                  index=False, sep=';', decimal='.')
-            network_id = network.split('/')[-2]
-            investment_model, network_id = network_id.split('_')
-            temp_body['networkId'] = network_id
-            temp_body['gasunieInvestmentModel'] = investment_model
-            temp_body['calculationState'] = 'postProcessingDone'
-            temp_body['postProcessingGasunieLocation'] = s3_gasunie_mca_key
-            temp_body['postProcessingGasunieAssignmentLocation'] = s3_gasunie_assignment_key
-            update_list.append(temp_body)
-            response = sqs_client.send_message(
-                QueueUrl=GASUNIE_LOADFLOW_QUEUE_URL,
-                MessageBody=json.dumps(temp_body, default=str),
-            )
+            # Find which networks have been initialized in the bucket and calculate them
+            paginator = s3_client.get_paginator('list_objects_v2')
+            result = paginator.paginate(Bucket=BUCKET_NAME, Prefix=body['bucketFolder'] +'gasunieInvestmentModels/', Delimiter='/')
+            network_list = []
+            for prefix in result.search('CommonPrefixes'):
+                network_list.append(prefix.get('Prefix'))
+            update_list = []
+            for network in network_list:
+                temp_body = dict(body)
+                try:
+                    with timed('compute'):
+                        assignment_csv, s3_gasunie_assignment_key, mca, s3_gasunie_mca_key = mca_post_processing(network, body,
+                            essim_gas['methane.csv'], etm_dict['network_gas.csv'], essim_gas['hydrogen.csv'], etm_dict['hydrogen.csv'])
+                except FileNotFoundError:
+                    continue
+                with timed('upload'):
+                    to_csv(mca, s3_gasunie_mca_key, compression='gzip', sep=';', decimal='.')
+                    to_csv(assignment_csv, s3_gasunie_assignment_key, compression='gzip', index=False, sep=';', decimal='.')
+                network_id = network.split('/')[-2]
+                investment_model, network_id = network_id.split('_')
+                temp_body['networkId'] = network_id
+                temp_body['gasunieInvestmentModel'] = investment_model
+                temp_body['calculationState'] = 'postProcessingDone'
+                temp_body['postProcessingGasunieLocation'] = s3_gasunie_mca_key
+                temp_body['postProcessingGasunieAssignmentLocation'] = s3_gasunie_assignment_key
+                update_list.append(temp_body)
+                dispatcher.send(temp_body, key=record['messageId'])
 
-        logging.info('Successfully calculated GasUnie post processing with scenarioId: {}'.format(body['scenarioId']))
-        with open('sql/update_scenario.sql', 'r') as f:
-            sql_stmt = f.read()
-        sql_handler.update_scenario_state(sql_stmt, update_list)
+            logging.info('Successfully calculated GasUnie post processing with scenarioId: {}'.format(body['scenarioId']))
+            state_updater.update(update_list)
+    # Records that failed are redelivered, their messages are sent then. A message that could not be sent only
+    # fails the record it was created for
+    dispatcher.discard(failures.failed)
+    unsent = dispatcher.flush()
+    for record in event['Records']:
+        if record['messageId'] in unsent:
+            failures.fail(record, unsent[record['messageId']])
+    return failures.response()
@@ -5,3 +5,7 @@ BUCKET_NAME = os.environ['BUCKET_NAME']
 DATABASE_SECRET_NAME = os.environ['DATABASE_SECRET_NAME']
 DATABASE_SCHEMA_NAME = os.environ['DATABASE_SCHEMA_NAME']
 GASUNIE_LOADFLOW_QUEUE_URL = os.environ['GASUNIE_LOADFLOW_QUEUE_URL']
+# FIFO queue of the state writer, scenario state is written directly when empty
+STATE_UPDATE_QUEUE_URL = os.environ.get('STATE_UPDATE_QUEUE_URL', '')
+# Profile every invocation, single messages can ask for it with "profile": true
+PROFILE_HANDLER = os.environ.get('PROFILE_HANDLER', 'false').lower() == 'true'
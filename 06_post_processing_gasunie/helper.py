@@ -1,12 +1,9 @@
 import pandas as pd
 from io import BytesIO
 import tarfile
-import boto3
 
 from networktools.postprocessing import make_MCA_input_frame
-from config import *
-
-s3_client = boto3.client('s3')
+from s3_io import get_bytes, get_many, read_csv
 
 
 def mca_post_processing(network, body, essim_methane, etm_mcurve, essim_hydrogen, etm_hcurve):
@@ -66,8 +63,7 @@ def mca_post_processing(network, body, essim_methane, etm_mcurve, essim_hydrogen
 
 
 def get_tar_gz_files(key, data_type):
-    input_tar_file = s3_client.get_object(Bucket=BUCKET_NAME, Key=key)
-    input_tar_content = input_tar_file['Body'].read()
+    input_tar_content = get_bytes(key)
     file_dict = {}
     with tarfile.open(fileobj=BytesIO(input_tar_content)) as tar:
         for tar_resource in tar:
@@ -90,12 +86,13 @@ def loadflow_assigment_contructor(network):
 
 
 def get_essim_sites(body, network):
-    s3_essim_msites_key = 's3://' + body['bucketName'] + '/' + network + 'essim_msites.csv.gz'
-    methane_sites = pd.read_csv(s3_essim_msites_key, index_col=0, decimal='.', sep=';')
+    s3_essim_msites_key = network + 'essim_msites.csv.gz'
+    s3_essim_hsites_key = network + 'essim_hsites.csv.gz'
+    contents = get_many([s3_essim_msites_key, s3_essim_hsites_key], bucket=body['bucketName'])
+    methane_sites = read_csv(s3_essim_msites_key, content=contents[s3_essim_msites_key], index_col=0, decimal='.', sep=';')
     if "substation" not in methane_sites.columns:
         methane_sites = methane_sites.rename(columns={methane_sites.columns[0]: "substation"})
-    s3_essim_hsites_key = 's3://' + body['bucketName'] + '/' + network + 'essim_hsites.csv.gz'
-    hydrogen_sites = pd.read_csv(s3_essim_hsites_key, index_col=0, decimal='.', sep=';')
+    hydrogen_sites = read_csv(s3_essim_hsites_key, content=contents[s3_essim_hsites_key], index_col=0, decimal='.', sep=';')
     if "substation" not in hydrogen_sites.columns:
         hydrogen_sites = hydrogen_sites.rename(columns={hydrogen_sites.columns[0]: "substation"})
     return methane_sites, hydrogen_sites
@@ -108,10 +105,6 @@ def df_to_buffer(df, compression='infer', index=True):
     return buffer
 
 
-def pandasify_s3_key(s3_key):
-    return 's3://' + BUCKET_NAME + '/' + s3_key
-
-
 def fix_essim_df(essim_gas):
     # Temporary fix for the gasunie output of essim. To make sure the demand/prod is balanced, due to missing nodes in essim.
     essim_methane = essim_gas['methane.csv']
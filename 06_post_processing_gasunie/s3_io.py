@@ -0,0 +1,194 @@
+import gzip
+import io
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+import boto3
+import pandas as pd
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
+from botocore.exceptions import ClientError
+
+from config import *
+from instrumentation import record_io
+
+# S3 requires every part except the last one of a multipart upload to be at least 5 MiB
+MULTIPART_PART_SIZE = 8 * 1024 * 1024
+# Concurrent requests per transfer and for get_many/put_many, the connection pool is sized to match
+TRANSFER_CONCURRENCY = 10
+
+# One client per container shared by every S3 call of the stage, safe to use from multiple threads
+s3_client = boto3.client('s3', config=Config(max_pool_connections=2 * TRANSFER_CONCURRENCY,
+                                             retries={'max_attempts': 6, 'mode': 'adaptive'}))
+TRANSFER_CONFIG = TransferConfig(multipart_threshold=MULTIPART_PART_SIZE, multipart_chunksize=MULTIPART_PART_SIZE,
+                                 max_concurrency=TRANSFER_CONCURRENCY)
+
+
+def get_bytes(key, bucket=BUCKET_NAME, part_size=MULTIPART_PART_SIZE):
+    """Content of an object. The first part_size bytes come with the first request, the remainder of a larger
+    object is fetched as parallel ranged GETs pinned to the ETag of that first response.
+
+    A missing object raises FileNotFoundError, like reading an s3:// path with pandas does.
+    """
+    try:
+        response = s3_client.get_object(Bucket=bucket, Key=key, Range='bytes=0-{}'.format(part_size - 1))
+    except ClientError as ex:
+        code = ex.response['Error']['Code']
+        if code == 'InvalidRange':
+            # Empty object
+            return b''
+        if code == 'NoSuchKey':
+            raise FileNotFoundError('s3://{}/{}'.format(bucket, key)) from ex
+        raise
+    first = response['Body'].read()
+    size = int(response['ContentRange'].split('/')[-1])
+    record_io(read=len(first))
+    if size <= len(first):
+        return first
+
+    def get_range(start):
+        end = min(start + part_size, size) - 1
+        content = s3_client.get_object(Bucket=bucket, Key=key, Range='bytes={}-{}'.format(start, end),
+                                       IfMatch=response['ETag'])['Body'].read()
+        record_io(read=len(content))
+        return content
+
+    with ThreadPoolExecutor(max_workers=TRANSFER_CONCURRENCY) as executor:
+        return first + b''.join(executor.map(get_range, range(len(first), size, part_size)))
+
+
+def put_bytes(key, body, bucket=BUCKET_NAME):
+    """Store an object, bodies above the multipart threshold are uploaded as parallel parts"""
+    if len(body) <= MULTIPART_PART_SIZE:
+        s3_client.put_object(Bucket=bucket, Key=key, Body=body)
+    else:
+        s3_client.upload_fileobj(io.BytesIO(body), bucket, key, Config=TRANSFER_CONFIG)
+    record_io(written=len(body))
+    return key
+
+
+def get_many(keys, bucket=BUCKET_NAME):
+    """Content of several objects fetched concurrently, as a dict keyed by object key"""
+    keys = list(dict.fromkeys(keys))
+    with ThreadPoolExecutor(max_workers=TRANSFER_CONCURRENCY) as executor:
+        return dict(zip(keys, executor.map(lambda key: get_bytes(key, bucket), keys)))
+
+
+def put_many(objects, bucket=BUCKET_NAME):
+    """Store several objects concurrently, objects maps an object key to its content"""
+    with ThreadPoolExecutor(max_workers=TRANSFER_CONCURRENCY) as executor:
+        futures = [executor.submit(put_bytes, key, body, bucket) for key, body in objects.items()]
+        return [future.result() for future in futures]
+
+
+def is_gzip(key, compression):
+    return compression == 'gzip' or (compression == 'infer' and key.endswith('.gz'))
+
+
+def read_csv(key, bucket=BUCKET_NAME, content=None, **kwargs):
+    """pandas.read_csv of an object, content can be passed when it was already fetched with get_many"""
+    compression = kwargs.pop('compression', 'infer')
+    if content is None:
+        content = get_bytes(key, bucket)
+    return pd.read_csv(io.BytesIO(content), compression='gzip' if is_gzip(key, compression) else None, **kwargs)
+
+
+def to_csv(df, key, bucket=BUCKET_NAME, **kwargs):
+    """DataFrame.to_csv into an object, gzip compressed when asked for or when the key ends with .gz"""
+    compression = kwargs.pop('compression', 'infer')
+    with S3StreamWriter(key, bucket) as sink:
+        if is_gzip(key, compression):
+            with gzip.GzipFile(fileobj=sink, mode='wb') as gzip_file, \
+                    io.TextIOWrapper(gzip_file, encoding='utf-8', newline='') as text:
+                df.to_csv(text, **kwargs)
+        else:
+            text = io.TextIOWrapper(sink, encoding='utf-8', newline='')
+            df.to_csv(text, **kwargs)
+            text.flush()
+            # Leave closing the sink to the writer
+            text.detach()
+    return key
+
+
+class S3StreamWriter(io.BufferedIOBase):
+    """Write-only file-like sink that streams into an S3 object.
+
+    Data is buffered until part_size is reached, from then on it is sent as a multipart upload so at most
+    one part is held in memory. Smaller objects are written with a single put_object on close. When used as
+    a context manager the upload is aborted if the block raises.
+    """
+
+    def __init__(self, key, bucket=BUCKET_NAME, part_size=MULTIPART_PART_SIZE, client=s3_client):
+        super().__init__()
+        self.key = key
+        self.bucket = bucket
+        self.part_size = part_size
+        self.client = client
+        self.pending = bytearray()
+        self.upload_id = None
+        self.parts = []
+        self.bytes_written = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        if self.closed:
+            raise ValueError('write to closed S3StreamWriter for {}'.format(self.key))
+        self.pending += data
+        self.bytes_written += len(data)
+        record_io(written=len(data))
+        while len(self.pending) >= self.part_size:
+            self._upload_part(bytes(self.pending[:self.part_size]))
+            del self.pending[:self.part_size]
+        return len(data)
+
+    def _upload_part(self, chunk):
+        if self.upload_id is None:
+            response = self.client.create_multipart_upload(Bucket=self.bucket, Key=self.key)
+            self.upload_id = response['UploadId']
+        part_number = len(self.parts) + 1
+        response = self.client.upload_part(Bucket=self.bucket, Key=self.key, PartNumber=part_number,
+                                           UploadId=self.upload_id, Body=chunk)
+        self.parts.append({'ETag': response['ETag'], 'PartNumber': part_number})
+
+    def close(self):
+        if self.closed:
+            return
+        try:
+            if self.upload_id is None:
+                self.client.put_object(Bucket=self.bucket, Key=self.key, Body=bytes(self.pending))
+            else:
+                if self.pending:
+                    self._upload_part(bytes(self.pending))
+                self.client.complete_multipart_upload(Bucket=self.bucket, Key=self.key, UploadId=self.upload_id,
+                                                      MultipartUpload={'Parts': self.parts})
+        except Exception:
+            self.abort()
+            raise
+        finally:
+            self.pending = bytearray()
+            super().close()
+
+    def abort(self):
+        if self.upload_id is not None:
+            try:
+                self.client.abort_multipart_upload(Bucket=self.bucket, Key=self.key, UploadId=self.upload_id)
+            except Exception as ex:
+                logging.warning('Could not abort multipart upload of {}: {}'.format(self.key, ex))
+            self.upload_id = None
+        self.pending = bytearray()
+        if not self.closed:
+            super().close()
+
+    def __del__(self):
+        # Never publish a partially written object from the garbage collector
+        if not self.closed:
+            self.abort()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is not None:
+            self.abort()
+        else:
+            self.close()
+        return False
@@ -2,9 +2,14 @@ import json
 import logging
 import boto3
 
-from helper import get_loadflow_input, tennet_loadflow, upload_loadflow_to_s3
-from credentials import get_secret
-from rds_handler import SqlHandler
+from helper import get_loadflow_input, tennet_loadflow, upload_loadflow_to_s3, loadflow_folder
+from idempotency import StageRun
+from credentials import LazySecret
+from rds_handler import read_statement
+from state_updates import StateUpdater
+from sqs_batch import BatchItemFailures
+from instrumentation import instrumented, timed
+from profiling import profiled
 from config import *
 
 if logging.getLogger().hasHandlers():
@@ -14,14 +19,18 @@ if logging.getLogger().hasHandlers():
 else:
     logging.basicConfig(level=logging.INFO)
 
-s3_client = boto3.client('s3')
 sqs_client = boto3.client('sqs')
 
-secret = json.loads(get_secret(DATABASE_SECRET_NAME))
+secret = LazySecret(DATABASE_SECRET_NAME)
 if ENVIRONMENT == 'local':
     secret["host"] = 'host.docker.internal'
 
+UPDATE_SCENARIO_SQL = read_statement('sql/update_scenario.sql')
+state_updater = StateUpdater('tennet_loadflow_done', UPDATE_SCENARIO_SQL, secret, sqs_client)
 
+
+@instrumented('loadflow_tennet')
+@profiled('loadflow_tennet')
 def lambda_handler(event, context):
     """Sample pure Lambda function
 
@@ -36,23 +45,35 @@ def lambda_handler(event, context):
         Context doc: https://docs.aws.amazon.com/lambda/latest/dg/python-context-object.html
     """
 
-    sql_handler = SqlHandler(secret)
-    logging.info(json.dumps(event))
+    logging.debug(json.dumps(event))
+    failures = BatchItemFailures()
+    networks = {}
     for record in event['Records']:
-        body = json.loads(record['body'])
-        logging.info('starting Tennet Loadflow with scenarioId: {}'.format(body['scenarioId']))
-
-        # The required PandaPower network will not be shared, user will have to generate their own, ref:
-        # https://pandapower.readthedocs.io/en/v2.9.0/elements.html
-        power, network = get_loadflow_input(s3_client, body)
-        load, performance = tennet_loadflow(network, power)
-
-        load_s3_key, metrics_s3_key = upload_loadflow_to_s3(body, load, performance)
-        body['calculationState'] = 'TennetLoadFlowProcessed'
-        body['tennetLoadFlowLocation'] = load_s3_key
-        body['investmentPlan'] = body['tennetInvestmentPath']
-        body['tennetMetricslocation'] = metrics_s3_key
-
-        with open('sql/update_scenario.sql', 'r') as f:
-            sql_stmt = f.read()
-        sql_handler.update_scenario_state(sql_stmt, [body])
+        with failures.record(record):
+            body = json.loads(record['body'])
+            logging.info('starting Tennet Loadflow with scenarioId: {}'.format(body['scenarioId']))
+
+            inputs = [body['postProcessingTennetLocation'], ('gridmaster-networks', body['networkId'] + '.sqlite')]
+            run = StageRun('tennet_loadflow', loadflow_folder(body) + 'loadFlow/loadFlowTennet.done.json', inputs)
+            outputs = run.completed()
+            if outputs is None:
+                # The required PandaPower network will not be shared, user will have to generate their own, ref:
+                # https://pandapower.readthedocs.io/en/v2.9.0/elements.html
+                with timed('download'):
+                    power, network = get_loadflow_input(body, networks)
+                with timed('compute'):
+                    load, performance = tennet_loadflow(network, power)
+
+                with timed('upload'):
+                    load_s3_key, metrics_s3_key = upload_loadflow_to_s3(body, load, performance)
+                outputs = {
+                    'calculationState': 'TennetLoadFlowProcessed',
+                    'tennetLoadFlowLocation': load_s3_key,
+                    'investmentPlan': body['tennetInvestmentPath'],
+                    'tennetMetricslocation': metrics_s3_key,
+                }
+                run.complete(outputs)
+            body.update(outputs)
+
+            state_updater.update([body])
+    return failures.response()
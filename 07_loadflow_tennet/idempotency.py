@@ -0,0 +1,109 @@
+import hashlib
+import json
+import logging
+import os
+import time
+
+from botocore.exceptions import ClientError
+
+from config import *
+from s3_io import s3_client, put_bytes, get_bytes
+
+STAGE_ROOT = os.path.dirname(os.path.abspath(__file__))
+# Everything deployed with a stage that can change its results
+CODE_DIRECTORIES = ('', 'sql', 'data', 'networktools')
+CODE_EXTENSIONS = ('.py', '.sql', '.csv', '.json', '.xlsx')
+
+_code_version = None
+
+
+def code_version():
+    """Hash of the deployed sources and data of the stage, or CODE_VERSION when the deployment sets one"""
+    global _code_version
+    if _code_version is None:
+        _code_version = os.environ.get('CODE_VERSION') or hash_sources(STAGE_ROOT)
+    return _code_version
+
+
+def hash_sources(root):
+    digest = hashlib.sha256()
+    for directory in CODE_DIRECTORIES:
+        top = os.path.join(root, directory)
+        if not os.path.isdir(top):
+            continue
+        for path, dirs, files in os.walk(top):
+            dirs[:] = sorted(name for name in dirs if name != '__pycache__') if directory else []
+            for name in sorted(files):
+                if name.endswith(CODE_EXTENSIONS):
+                    file_path = os.path.join(path, name)
+                    digest.update(os.path.relpath(file_path, root).encode('utf-8'))
+                    with open(file_path, 'rb') as f:
+                        digest.update(hashlib.sha256(f.read()).digest())
+    return digest.hexdigest()
+
+
+def object_etag(bucket, key):
+    try:
+        return s3_client.head_object(Bucket=bucket, Key=key)['ETag']
+    except ClientError as ex:
+        if ex.response['Error']['Code'] in ('404', 'NoSuchKey', 'NotFound'):
+            return None
+        raise
+
+
+class StageRun:
+    """Completion marker of one stage run, stored as json next to the outputs.
+
+    The fingerprint covers the stage name, the code version, the ETag of every input object and the message
+    fields the results depend on. When a redelivered or re-run message finds a marker with the same fingerprint
+    the results are already in place: the stored message fields can be re-emitted without recomputing.
+    Inputs are keys in BUCKET_NAME or (bucket, key) tuples.
+    """
+
+    def __init__(self, stage, marker_key, inputs, params=None, bucket=BUCKET_NAME):
+        self.stage = stage
+        self.marker_key = marker_key
+        self.inputs = [item if isinstance(item, tuple) else (BUCKET_NAME, item) for item in inputs]
+        self.params = params or {}
+        self.bucket = bucket
+        self._fingerprint = None
+
+    @property
+    def fingerprint(self):
+        if self._fingerprint is None:
+            description = {
+                'stage': self.stage,
+                'code': code_version(),
+                'inputs': [[bucket, key, object_etag(bucket, key)] for bucket, key in self.inputs],
+                'params': self.params,
+            }
+            self._fingerprint = hashlib.sha256(json.dumps(description, sort_keys=True).encode('utf-8')).hexdigest()
+        return self._fingerprint
+
+    def completed(self):
+        """Message fields stored by an earlier identical run, None when the stage has to run"""
+        # Fingerprint the inputs as they are read by this run, before they could change
+        fingerprint = self.fingerprint
+        if not SKIP_COMPLETED_STAGES:
+            return None
+        try:
+            marker = json.loads(get_bytes(self.marker_key, self.bucket).decode('utf-8'))
+        except FileNotFoundError:
+            return None
+        except ValueError:
+            logging.warning('Ignoring unreadable completion marker {}'.format(self.marker_key))
+            return None
+        if marker.get('fingerprint') != fingerprint:
+            return None
+        logging.info('{} already completed at {} for these inputs, skipping'.format(self.stage, marker['completedAt']))
+        return marker['outputs']
+
+    def complete(self, outputs):
+        """Record the message fields the stage produced, only once every output has been written"""
+        marker = {
+            'stage': self.stage,
+            'fingerprint': self.fingerprint,
+            'completedAt': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+            'outputs': outputs,
+        }
+        put_bytes(self.marker_key, json.dumps(marker).encode('utf-8'), self.bucket)
@@ -0,0 +1,100 @@
+import json
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Limits of a single SendMessageBatch call
+MAX_BATCH_ENTRIES = 10
+MAX_BATCH_BYTES = 256 * 1024
+
+
+def compact_json(body):
+    return json.dumps(body, default=str, separators=(',', ':'))
+
+
+class SqsDispatcher:
+    """Buffers messages for one queue and sends them with send_message_batch.
+
+    Batches of up to 10 messages are sent concurrently on flush, entries that fail are retried with
+    backoff. A message sent with a key that keeps failing is returned by flush, so the caller can fail
+    what it belongs to, for a message without a key an error is raised. Used as a context manager the
+    buffer is flushed when the block completes without an exception.
+    """
+
+    def __init__(self, sqs_client, queue_url, max_workers=4, max_attempts=4):
+        self.sqs_client = sqs_client
+        self.queue_url = queue_url
+        self.max_workers = max_workers
+        self.max_attempts = max_attempts
+        self.pending = []
+
+    def send(self, body, group_id=None, key=None):
+        """Queue a message, group_id is the MessageGroupId required by FIFO queues, key is returned by flush
+        when the message could not be sent, e.g. the messageId of the record it was created for"""
+        self.pending.append((compact_json(body), group_id, key))
+
+    def discard(self, keys):
+        """Drop the queued messages of keys, e.g. of records that failed after queueing them"""
+        keys = set(keys)
+        self.pending = [message for message in self.pending if message[2] not in keys]
+
+    def flush(self):
+        """Send the queued messages, returns the keys of the messages that could not be sent with the reason"""
+        messages, self.pending = self.pending, []
+        batches = self._make_batches(messages)
+        if not batches:
+            return {}
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(batches))) as executor:
+            failed = [failure for failures in executor.map(self._send_batch, batches) for failure in failures]
+        logging.info('Sent {} messages in {} batches to {}'.format(len(messages) - len(failed), len(batches),
+                                                                   self.queue_url))
+        unkeyed = [reason for key, reason in failed if key is None]
+        if unkeyed:
+            raise RuntimeError('Could not send {} messages to {}: {}'.format(len(unkeyed), self.queue_url, unkeyed))
+        return dict(failed)
+
+    @staticmethod
+    def _make_batches(messages):
+        batches = []
+        batch, batch_bytes = [], 0
+        for message in messages:
+            size = len(message[0].encode('utf-8'))
+            if batch and (len(batch) == MAX_BATCH_ENTRIES or batch_bytes + size > MAX_BATCH_BYTES):
+                batches.append(batch)
+                batch, batch_bytes = [], 0
+            batch.append(message)
+            batch_bytes += size
+        if batch:
+            batches.append(batch)
+        return batches
+
+    def _send_batch(self, messages):
+        """Send one batch, returns the key and the reason of every message that could not be sent"""
+        entries, keys = {}, {}
+        for number, (message, group_id, key) in enumerate(messages):
+            entries[str(number)] = {'Id': str(number), 'MessageBody': message}
+            if group_id is not None:
+                entries[str(number)]['MessageGroupId'] = group_id
+            keys[str(number)] = key
+        rejected = []
+        for attempt in range(self.max_attempts):
+            response = self.sqs_client.send_message_batch(QueueUrl=self.queue_url, Entries=list(entries.values()))
+            failed = response.get('Failed', [])
+            # Resending does not help when SQS rejects the message itself
+            rejected += [(keys[failure['Id']], 'rejected: {}'.format(failure.get('Message', failure['Code'])))
+                         for failure in failed if failure.get('SenderFault')]
+            # Only resend the entries that failed
+            entries = {failure['Id']: entries[failure['Id']] for failure in failed if not failure.get('SenderFault')}
+            if not entries:
+                return rejected
+            logging.warning('Retrying {} failed messages for {}'.format(len(entries), self.queue_url))
+            time.sleep(0.2 * 2 ** attempt)
+        return rejected + [(keys[number], 'failed after {} attempts'.format(self.max_attempts)) for number in entries]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.flush()
+        return False
@@ -1,7 +1,5 @@
-import pandas as pd
-
 from networktools.substations import evaluate_mv_substations, evaluate_substation_overload
-from config import *
+from s3_io import get_many, to_csv, read_csv
 
 
 def stedin_loadflow(essim_curves, essim_sites, essim_substations):
@@ -10,24 +8,26 @@ def stedin_loadflow(essim_curves, essim_sites, essim_substations):
     return flow, overload
 
 
-def get_data_from_s3(s3_prefix):
-    pandas_s3_key_base = 's3://' + BUCKET_NAME + '/' + s3_prefix
-    essim_substations = pd.read_csv(pandas_s3_key_base + 'essim_substations.csv.gz', compression='gzip', index_col=1, decimal='.', sep=';')
-    essim_sites = pd.read_csv(pandas_s3_key_base + 'essim_sites.csv.gz', compression='gzip', index_col=0, decimal='.', sep=';')
-    if 'substation [t-1]' in essim_sites.columns:
-        essim_sites = essim_sites.rename(columns={'substation [t-1]': 'substation'})
-    return essim_substations, essim_sites
+def get_data_from_s3(s3_prefixes):
+    """Substations and sites of every station design, all fetched concurrently, keyed by design prefix"""
+    contents = get_many([s3_prefix + name for s3_prefix in s3_prefixes
+                         for name in ('essim_substations.csv.gz', 'essim_sites.csv.gz')])
+    design_data = {}
+    for s3_prefix in s3_prefixes:
+        substations_key = s3_prefix + 'essim_substations.csv.gz'
+        sites_key = s3_prefix + 'essim_sites.csv.gz'
+        essim_substations = read_csv(substations_key, content=contents[substations_key], compression='gzip', index_col=1, decimal='.', sep=';')
+        essim_sites = read_csv(sites_key, content=contents[sites_key], compression='gzip', index_col=0, decimal='.', sep=';')
+        if 'substation [t-1]' in essim_sites.columns:
+            essim_sites = essim_sites.rename(columns={'substation [t-1]': 'substation'})
+        design_data[s3_prefix] = essim_substations, essim_sites
+    return design_data
 
 
 def upload_result_to_s3(s3_prefix, flow, overload):
-    pandas_s3_key_base = 's3://' + BUCKET_NAME + '/' + s3_prefix
-    flow_s3_key = pandas_s3_key_base + 'flow/flow.csv.gz'
-    overload_s3_key = pandas_s3_key_base + 'overload/overload.csv.gz'
+    flow_s3_key = s3_prefix + 'flow/flow.csv.gz'
+    overload_s3_key = s3_prefix + 'overload/overload.csv.gz'
 
-    flow.to_csv(flow_s3_key, compression='gzip', sep=';', decimal='.')
-    overload.to_csv(overload_s3_key, compression='gzip', sep=';', decimal='.')
+    to_csv(flow, flow_s3_key, compression='gzip', sep=';', decimal='.')
+    to_csv(overload, overload_s3_key, compression='gzip', sep=';', decimal='.')
     return flow_s3_key, overload_s3_key
-
-
-def pandasify_s3_key(s3_key):
-    return 's3://' + BUCKET_NAME + '/' + s3_key
\ No newline at end of file
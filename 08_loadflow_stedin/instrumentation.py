@@ -0,0 +1,160 @@
+"""Per stage performance metrics, written to the log as CloudWatch embedded metric format (EMF) lines.
+
+Decorate the handler with @instrumented('<stage>') and wrap its parts in `with timed('<phase>'):`. Every
+invocation prints one line with dimension Stage and one line per phase with dimensions Stage and Phase,
+holding wall time, CPU time, peak RSS and the S3 bytes read and written (counted by s3_io). The scenarioIds
+of the records and the request id are added as properties, so the lines can be searched per scenario in
+CloudWatch Logs Insights.
+"""
+import functools
+import json
+import resource
+import threading
+import time
+from contextlib import contextmanager
+
+NAMESPACE = 'Gridmaster'
+UNITS = {
+    'WallTime': 'Milliseconds',
+    'CpuTime': 'Milliseconds',
+    'MaxRss': 'Kilobytes',
+    'BytesRead': 'Bytes',
+    'BytesWritten': 'Bytes',
+    'RecordCount': 'Count',
+    'FailedRecordCount': 'Count',
+}
+
+
+class Usage:
+    """Resources used by an invocation or one of its phases"""
+
+    def __init__(self):
+        self.wall = 0.0
+        self.cpu = 0.0
+        self.bytes_read = 0
+        self.bytes_written = 0
+
+    def metrics(self):
+        return {
+            'WallTime': round(self.wall * 1000, 1),
+            'CpuTime': round(self.cpu * 1000, 1),
+            # Peak of the process so far, kilobytes on Linux
+            'MaxRss': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+            'BytesRead': self.bytes_read,
+            'BytesWritten': self.bytes_written,
+        }
+
+
+class Invocation:
+    def __init__(self, stage):
+        self.stage = stage
+        self.total = Usage()
+        self.phases = {}
+        # Phases currently running, bytes transferred by any thread count towards all of them
+        self.running = []
+        self.lock = threading.Lock()
+
+
+current = None
+
+
+@contextmanager
+def measure(usage):
+    wall, cpu = time.perf_counter(), time.process_time()
+    try:
+        yield usage
+    finally:
+        usage.wall += time.perf_counter() - wall
+        usage.cpu += time.process_time() - cpu
+
+
+@contextmanager
+def timed(phase):
+    """Add the resources used inside the block to a phase of the running invocation, repeated use accumulates"""
+    invocation = current
+    if invocation is None:
+        yield
+        return
+    with invocation.lock:
+        usage = invocation.phases.setdefault(phase, Usage())
+        invocation.running.append(usage)
+    try:
+        with measure(usage):
+            yield
+    finally:
+        with invocation.lock:
+            invocation.running.remove(usage)
+
+
+def record_io(read=0, written=0):
+    invocation = current
+    if invocation is None:
+        return
+    with invocation.lock:
+        # A phase nested in itself counts once
+        for usage in [invocation.total] + list(set(invocation.running)):
+            usage.bytes_read += read
+            usage.bytes_written += written
+
+
+def scenario_ids(records):
+    """scenarioId of every SQS record, whether it carries the message, an SNS notification or a state update"""
+    ids = []
+    for record in records:
+        try:
+            body = json.loads(record['body'])
+            if 'scenarioId' not in body and 'Message' in body:
+                body = json.loads(body['Message'])
+            if 'scenarioId' not in body and 'params' in body:
+                body = body['params']
+            ids.append(body['scenarioId'])
+        except (KeyError, TypeError, ValueError):
+            continue
+    return ids
+
+
+def emit(metrics, dimensions, properties):
+    document = dict(properties, **dimensions, **metrics)
+    document['_aws'] = {
+        'Timestamp': int(time.time() * 1000),
+        'CloudWatchMetrics': [{
+            'Namespace': NAMESPACE,
+            'Dimensions': [list(dimensions)],
+            'Metrics': [{'Name': name, 'Unit': UNITS[name]} for name in metrics],
+        }],
+    }
+    # EMF lines have to be plain json, without the prefix the logging handler of Lambda adds
+    print(json.dumps(document, default=str), flush=True)
+
+
+def instrumented(stage):
+    """Handler decorator emitting the metrics of every invocation"""
+    def decorate(handler):
+        @functools.wraps(handler)
+        def wrapper(event, context):
+            global current
+            invocation = current = Invocation(stage)
+            records = event.get('Records', []) if isinstance(event, dict) else []
+            response = error = None
+            try:
+                with measure(invocation.total):
+                    response = handler(event, context)
+                return response
+            except Exception as ex:
+                error = type(ex).__name__
+                raise
+            finally:
+                current = None
+                properties = {
+                    'requestId': getattr(context, 'aws_request_id', None),
+                    'scenarioIds': scenario_ids(records),
+                    'error': error,
+                }
+                metrics = dict(invocation.total.metrics(), RecordCount=len(records))
+                if isinstance(response, dict) and 'batchItemFailures' in response:
+                    metrics['FailedRecordCount'] = len(response['batchItemFailures'])
+                emit(metrics, {'Stage': stage}, properties)
+                for phase, usage in invocation.phases.items():
+                    emit(usage.metrics(), {'Stage': stage, 'Phase': phase}, properties)
+        return wrapper
+    return decorate
@@ -121,7 +121,7 @@ def aggregate_essim_sectorcurves(curves, sites, exceptions=None):
     if exceptions is not None:
         # map expections
         regular = dict(zip(sites.sector, sites.sector))
-        regular.update(exceptions['Supply'])
+        regular.update(exceptions.get('Supply', {}))
 
         # update supply sectors
         supply.columns = supply.columns.map(regular)
@@ -129,7 +129,7 @@ def aggregate_essim_sectorcurves(curves, sites, exceptions=None):
 
         # map expections
         regular = dict(zip(sites.sector, sites.sector))
-        regular.update(exceptions['Demand'])
+        regular.update(exceptions.get('Demand', {}))
 
         # update demand sectors
         demand.columns = demand.columns.map(regular)
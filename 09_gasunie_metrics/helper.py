@@ -1,12 +1,8 @@
 import pandas as pd
 from io import BytesIO
 import tarfile
-import boto3
 
-from config import *
-
-
-s3_client = boto3.client('s3')
+from s3_io import get_bytes
 
 # Constant
 factors = pd.read_csv('data/gasunie_factors.csv', sep=';', index_col=0, usecols=['name', 'length_km', 'from', 'to'])
@@ -60,8 +56,7 @@ def calculate_metrics(flow):
 
 
 def get_tar_gz_files(key, data_type):
-    input_tar_file = s3_client.get_object(Bucket=BUCKET_NAME, Key=key)
-    input_tar_content = input_tar_file['Body'].read()
+    input_tar_content = get_bytes(key)
     file_dict = {}
     with tarfile.open(fileobj=BytesIO(input_tar_content)) as tar:
         for tar_resource in tar:
@@ -80,8 +75,4 @@ def df_to_buffer(df, compression='infer', index=True):
     buffer = BytesIO()
     df.to_csv(buffer, compression=compression, sep=';', index=index)
     buffer.seek(0)
-    return buffer
-
-
-def pandasify_s3_key(s3_key):
-    return 's3://' + BUCKET_NAME + '/' + s3_key
\ No newline at end of file
+    return buffer
\ No newline at end of file
@@ -0,0 +1,103 @@
+"""Opt-in profiling of a stage handler.
+
+A run is profiled when PROFILE_HANDLER is true for the function, or when a message of the batch has "profile":
+true. Stages copy the message fields downstream, so a flagged scenario is profiled in every stage it passes.
+The handler then runs under cProfile with tracemalloc tracing allocations. Two objects are written to
+<bucketFolder>profiles/<stage>/ of the (first flagged) scenario:
+
+- <time>_<request id>.pstats, the cProfile statistics, load with pstats.Stats or snakeviz
+- <time>_<request id>.txt, the functions with the most cumulative time, the peak traced memory and the lines
+  holding the most memory when the handler returns
+
+cProfile only sees the handler thread, time spent in the S3 transfer threads shows up as waiting. Without
+either switch the handler is called directly, the only overhead is a substring check per record.
+"""
+import cProfile
+import functools
+import io
+import json
+import logging
+import marshal
+import pstats
+import time
+import tracemalloc
+
+from config import *
+from s3_io import put_bytes
+
+PROFILE_FLAG = 'profile'
+TOP_FUNCTIONS = 40
+TOP_ALLOCATIONS = 25
+# Frames of the profiling itself are left out of the allocation report
+IGNORED_ALLOCATIONS = (tracemalloc.Filter(False, tracemalloc.__file__),
+                       tracemalloc.Filter(False, cProfile.__file__),
+                       tracemalloc.Filter(False, __file__),
+                       tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+                       tracemalloc.Filter(False, '<unknown>'))
+
+
+def profile_folder(event):
+    """bucketFolder of the first message asking to be profiled, None when none does"""
+    for record in event.get('Records', []) if isinstance(event, dict) else []:
+        if PROFILE_FLAG not in record.get('body', ''):
+            continue
+        try:
+            body = json.loads(record['body'])
+            if 'Message' in body and 'scenarioId' not in body:
+                body = json.loads(body['Message'])
+        except (KeyError, TypeError, ValueError):
+            continue
+        if body.get(PROFILE_FLAG):
+            return body.get('bucketFolder', '')
+    return None
+
+
+def report(profiler, snapshot, peak):
+    text = io.StringIO()
+    text.write('Functions by cumulative time\n\n')
+    pstats.Stats(profiler, stream=text).sort_stats('cumulative').print_stats(TOP_FUNCTIONS)
+    text.write('\nPeak traced memory {:.1f} MiB\n'.format(peak / 2 ** 20))
+    text.write('\nLines by allocated memory still in use at the end of the handler\n\n')
+    for statistic in snapshot.filter_traces(IGNORED_ALLOCATIONS).statistics('lineno')[:TOP_ALLOCATIONS]:
+        text.write('{}\n'.format(statistic))
+    return text.getvalue()
+
+
+def store(stage, folder, request_id, profiler, snapshot, peak):
+    key = '{}profiles/{}/{}_{}'.format(folder, stage, time.strftime('%Y%m%dT%H%M%S', time.gmtime()), request_id)
+    profiler.create_stats()
+    # Same format as Profile.dump_stats
+    put_bytes(key + '.pstats', marshal.dumps(profiler.stats))
+    put_bytes(key + '.txt', report(profiler, snapshot, peak).encode('utf-8'))
+    logging.info('Stored the profile of this invocation at {}.pstats'.format(key))
+
+
+def profiled(stage):
+    """Handler decorator running the handler under the profilers when asked for"""
+    def decorate(handler):
+        @functools.wraps(handler)
+        def wrapper(event, context):
+            folder = profile_folder(event)
+            if folder is None:
+                if not PROFILE_HANDLER:
+                    return handler(event, context)
+                folder = ''
+
+            tracing = tracemalloc.is_tracing()
+            if not tracing:
+                tracemalloc.start()
+            profiler = cProfile.Profile()
+            try:
+                return profiler.runcall(handler, event, context)
+            finally:
+                snapshot = tracemalloc.take_snapshot()
+                peak = tracemalloc.get_traced_memory()[1]
+                if not tracing:
+                    tracemalloc.stop()
+                try:
+                    store(stage, folder, getattr(context, 'aws_request_id', 'local'), profiler, snapshot, peak)
+                except Exception as ex:
+                    # Never fail a message because its profile could not be stored
+                    logging.warning('Could not store the profile: {}'.format(ex))
+        return wrapper
+    return decorate
@@ -1,12 +1,39 @@
 import pymysql
+from functools import lru_cache
 from pymysql.cursors import DictCursor
 
 from config import *
 
+# One connection per container, reused across warm invocations
+connections = {}
+
+
+@lru_cache(maxsize=None)
+def read_statement(path):
+    with open(path, 'r') as f:
+        return f.read()
+
 
 class SqlHandler:
     def __init__(self, db_secret):
-        self.connection = self.connect(db_secret)
+        self.connection = self.get_connection(db_secret)
+
+    @classmethod
+    def get_connection(cls, secret):
+        """Reuse the connection of this container, a ping checks it and reconnects when it was dropped"""
+        key = (secret['host'], secret['port'], secret['username'])
+        connection = connections.get(key)
+        if connection is not None:
+            try:
+                connection.ping(reconnect=True)
+                # End whatever an earlier invocation left open so reads do not see an old snapshot
+                connection.rollback()
+                return connection
+            except pymysql.MySQLError:
+                # Reconnecting failed, open a fresh connection
+                pass
+        connection = connections[key] = cls.connect(secret)
+        return connection
 
     @staticmethod
     def connect(secret):
@@ -0,0 +1,44 @@
+import json
+import logging
+
+from config import *
+from credentials import LazySecret
+from rds_handler import SqlHandler
+from state_writer import coalesce, load_statements, write_batches
+from instrumentation import instrumented, timed
+
+if logging.getLogger().hasHandlers():
+    # The Lambda environment pre-configures a handler logging to stderr. If a handler is already configured,
+    # `.basicConfig` does not execute. Thus we set the level directly.
+    logging.getLogger().setLevel(logging.INFO)
+else:
+    logging.basicConfig(level=logging.INFO)
+
+secret = LazySecret(DATABASE_SECRET_NAME)
+if ENVIRONMENT == 'local':
+    secret["host"] = 'host.docker.internal'
+
+STATEMENT_SQL = load_statements('sql')
+
+
+@instrumented('state_writer')
+def lambda_handler(event, context):
+    """
+    Grid master state writer, applies the scenario state changes the stages emit in bulk
+
+    Parameters
+    ----------
+    event: dict, required
+        SQS FIFO Input Format, a maximum total of 10 records in 1 event
+        Event doc: https://docs.aws.amazon.com/lambda/latest/dg/with-sqs.html
+
+    context: object, required
+        Lambda Context runtime methods and attributes
+        Context doc: https://docs.aws.amazon.com/lambda/latest/dg/python-context-object.html
+    """
+    logging.debug(json.dumps(event))
+    events = [json.loads(record['body']) for record in event['Records']]
+    batches = coalesce(events)
+    with timed('write'):
+        written = write_batches(SqlHandler(secret).connection, batches, STATEMENT_SQL)
+    logging.info('Wrote {} state updates as {}'.format(len(events), json.dumps(written)))
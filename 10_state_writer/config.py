@@ -0,0 +1,5 @@
+import os
+
+ENVIRONMENT = os.environ['ENVIRONMENT']
+DATABASE_SECRET_NAME = os.environ['DATABASE_SECRET_NAME']
+DATABASE_SCHEMA_NAME = os.environ['DATABASE_SCHEMA_NAME']
@@ -0,0 +1,127 @@
+import base64
+import json
+import logging
+import threading
+import time
+from collections.abc import MutableMapping
+
+import boto3
+from botocore.config import Config
+
+REGION_NAME = 'eu-central-1'
+SECRET_TTL_SECONDS = 3600
+
+
+class SecretCache:
+    """Secrets Manager values kept in memory for ttl seconds.
+
+    Concurrent callers of a secret that is not cached share one request. An expired value is still returned
+    while a background thread refreshes it, so only the very first use of a secret waits for the network.
+    The client retries throttled requests with adaptive backoff.
+    """
+
+    def __init__(self, region_name=REGION_NAME, ttl=SECRET_TTL_SECONDS):
+        self.client = boto3.client('secretsmanager', region_name=region_name,
+                                   config=Config(retries={'max_attempts': 8, 'mode': 'adaptive'}))
+        self.ttl = ttl
+        self.values = {}
+        self.errors = {}
+        self.in_flight = {}
+        self.lock = threading.Lock()
+
+    def fetch(self, secret_name):
+        response = self.client.get_secret_value(SecretId=secret_name)
+        # Depending on whether the secret is a string or binary, one of these fields will be populated.
+        if 'SecretString' in response:
+            return json.loads(response['SecretString'])
+        return base64.b64decode(response['SecretBinary'])
+
+    def get(self, secret_name):
+        entry = self.values.get(secret_name)
+        if entry is None:
+            return self.load(secret_name)
+        expires, value = entry
+        if expires <= time.time():
+            self.prefetch(secret_name)
+        return value
+
+    def load(self, secret_name):
+        """Fetch a secret, or wait for the fetch another thread already started"""
+        with self.lock:
+            done = self.in_flight.get(secret_name)
+            leader = done is None
+            if leader:
+                done = self.in_flight[secret_name] = threading.Event()
+        if not leader:
+            done.wait()
+            if secret_name in self.values:
+                return self.values[secret_name][1]
+            raise self.errors[secret_name]
+
+        try:
+            value = self.fetch(secret_name)
+            self.values[secret_name] = (time.time() + self.ttl, value)
+            self.errors.pop(secret_name, None)
+            return value
+        except Exception as ex:
+            self.errors[secret_name] = ex
+            raise
+        finally:
+            with self.lock:
+                del self.in_flight[secret_name]
+            done.set()
+
+    def prefetch(self, secret_name):
+        """Start fetching a secret in the background unless that is already happening"""
+        if secret_name in self.in_flight:
+            return
+        threading.Thread(target=self._background_load, args=(secret_name,), daemon=True).start()
+
+    def _background_load(self, secret_name):
+        try:
+            self.load(secret_name)
+        except Exception as ex:
+            # The next caller fetches again and gets the error
+            logging.warning('Could not fetch secret {}: {}'.format(secret_name, ex))
+
+
+secret_cache = SecretCache()
+
+
+def get_secret(secret_name):
+    value = secret_cache.get(secret_name)
+    # Copy so callers can adjust their secret without changing the cached one
+    return dict(value) if isinstance(value, dict) else value
+
+
+class LazySecret(MutableMapping):
+    """Dict-like secret that is fetched in the background on creation and only waited for on first access.
+
+    Keys set on it override the values of the secret, e.g. a local database host.
+    """
+
+    def __init__(self, secret_name, cache=secret_cache):
+        self.secret_name = secret_name
+        self.cache = cache
+        self.overrides = {}
+        cache.prefetch(secret_name)
+
+    def value(self):
+        return dict(self.cache.get(self.secret_name), **self.overrides)
+
+    def __getitem__(self, key):
+        if key in self.overrides:
+            return self.overrides[key]
+        return self.cache.get(self.secret_name)[key]
+
+    def __setitem__(self, key, value):
+        self.overrides[key] = value
+
+    def __delitem__(self, key):
+        del self.overrides[key]
+
+    def __iter__(self):
+        return iter(self.value())
+
+    def __len__(self):
+        return len(self.value())
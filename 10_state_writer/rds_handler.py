@@ -0,0 +1,64 @@
+import pymysql
+from functools import lru_cache
+from pymysql.cursors import DictCursor
+
+from config import DATABASE_SCHEMA_NAME
+
+# One connection per container, reused across warm invocations
+connections = {}
+
+
+@lru_cache(maxsize=None)
+def read_statement(path):
+    with open(path, 'r') as f:
+        return f.read()
+
+
+class SqlHandler:
+    def __init__(self, db_secret):
+        self.connection = self.get_connection(db_secret)
+
+    @classmethod
+    def get_connection(cls, secret):
+        """Reuse the connection of this container, a ping checks it and reconnects when it was dropped"""
+        key = (secret['host'], secret['port'], secret['username'])
+        connection = connections.get(key)
+        if connection is not None:
+            try:
+                connection.ping(reconnect=True)
+                # End whatever an earlier invocation left open so reads do not see an old snapshot
+                connection.rollback()
+                return connection
+            except pymysql.MySQLError:
+                # Reconnecting failed, open a fresh connection
+                pass
+        connection = connections[key] = cls.connect(secret)
+        return connection
+
+    @staticmethod
+    def connect(secret):
+        return pymysql.connect(host=secret['host'],
+                               user=secret['username'],
+                               password=secret['password'],
+                               port=secret['port'],
+                               db=DATABASE_SCHEMA_NAME,
+                               charset='utf8',
+                               cursorclass=DictCursor)
+
+    def generic_execute_many(self, sql_stmt, data):
+        with self.connection.cursor() as cursor:
+            cursor.executemany(sql_stmt, data)
+
+        self.connection.commit()
+
+    def generic_fetchall(self, sql_stmt):
+        with self.connection.cursor() as cursor:
+            cursor.execute(sql_stmt)
+            data = cursor.fetchall()
+        return data
+
+    def update_scenario_state(self, update_stmt, scenarios):
+        with self.connection.cursor() as cursor:
+            cursor.executemany(update_stmt, scenarios)
+
+        self.connection.commit()
@@ -0,0 +1,3 @@
+UPDATE scenario_overview
+SET calculationState= 'esdlUpdated', updatedEsdlLocation=%(updatedEsdlLocation)s
+WHERE scenarioId = %(scenarioId)s
\ No newline at end of file
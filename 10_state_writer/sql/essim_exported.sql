@@ -0,0 +1,3 @@
+UPDATE scenario_overview
+SET calculationState= 'essimExported', essimExportGasunieLocation=%(essimExportGasunieLocation)s, essimExportTennetLocation=%(essimExportTennetLocation)s
+WHERE scenarioId = %(scenarioId)s
\ No newline at end of file
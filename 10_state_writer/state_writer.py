@@ -0,0 +1,68 @@
+import os
+from collections import OrderedDict, namedtuple
+
+# Table written by every statement of the state update events and the columns identifying a row in it
+Statement = namedtuple('Statement', ['table', 'key'])
+
+STATEMENTS = {
+    'esdl_updated': Statement('scenario_overview', ('scenarioId',)),
+    'essim_exported': Statement('scenario_overview', ('scenarioId',)),
+    'tennet_post_processed': Statement('loadflow_tennet', ('scenarioId', 'investmentPlan', 'networkId')),
+    'tennet_loadflow_done': Statement('loadflow_tennet', ('scenarioId', 'investmentPlan', 'networkId')),
+    'gasunie_post_processed': Statement('loadflow_gasunie', ('scenarioId', 'networkId', 'gasunieInvestmentModel')),
+    'gasunie_metrics_calculated': Statement('loadflow_gasunie', ('scenarioId', 'networkId', 'gasunieInvestmentModel')),
+    'stedin_loadflow_done': Statement('loadflow_stedin', ('scenarioId', 'stedinDesign')),
+}
+
+
+def load_statements(directory='sql'):
+    """SQL text of every known statement, read from <directory>/<name>.sql"""
+    statements = {}
+    for name in STATEMENTS:
+        with open(os.path.join(directory, name + '.sql'), 'r') as f:
+            statements[name] = f.read()
+    return statements
+
+
+def coalesce(events, statements=STATEMENTS):
+    """Merge consecutive events of the same statement into one batch of parameter rows.
+
+    Within such a run the last event per row key wins, so a row is written once with its latest values. Runs are
+    returned in event order, which keeps the order of the changes of a scenario.
+    """
+    batches = []
+    for event in events:
+        name = event['statement']
+        if name not in statements:
+            raise ValueError('Unknown state update statement: {}'.format(name))
+        if not batches or batches[-1][0] != name:
+            batches.append((name, OrderedDict()))
+        key = tuple(event['params'].get(column) for column in statements[name].key)
+        rows = batches[-1][1]
+        # Move an overwritten row to the end so it is written after the rows that came before its latest change
+        rows.pop(key, None)
+        rows[key] = event['params']
+    return [(name, list(rows.values())) for name, rows in batches]
+
+
+def write_batches(connection, batches, statement_sql, statements=STATEMENTS):
+    """Apply coalesced batches with one transaction per table.
+
+    Batches of a table are executed in their original order with executemany. Works with any DB-API connection
+    accepting the pyformat parameters of the statements.
+    """
+    by_table = OrderedDict()
+    for name, rows in batches:
+        by_table.setdefault(statements[name].table, []).append((name, rows))
+
+    for table, table_batches in by_table.items():
+        try:
+            cursor = connection.cursor()
+            for name, rows in table_batches:
+                cursor.executemany(statement_sql[name], rows)
+            cursor.close()
+            connection.commit()
+        except Exception:
+            connection.rollback()
+            raise
+    return {table: sum(len(rows) for _, rows in table_batches) for table, table_batches in by_table.items()}
@@ -1,5 +1,7 @@
 import os
 
+from scaling import Service
+
 ESSIM_CONTAINER_LIMIT = int(os.environ['ESSIM_CONTAINER_LIMIT'])
 ESSIM_QUEUE_URL = os.environ['ESSIM_QUEUE_URL']
 LOADFLOW_CONTAINER_LIMIT = int(os.environ['LOADFLOW_CONTAINER_LIMIT'])
@@ -12,4 +14,21 @@ ESDL_CONTAINER_LIMIT = int(os.environ['ESDL_CONTAINER_LIMIT'])
 ESDL_QUEUE_URL = os.environ['ESDL_QUEUE_URL']
 CONTAINER_SUBNET = os.environ['CONTAINER_SUBNET']
 ESSIM_CONTAINER_SG = os.environ['ESSIM_CONTAINER_SG']
-GENERAL_CONTAINER_SG = os.environ['GENERAL_CONTAINER_SG']
\ No newline at end of file
+GENERAL_CONTAINER_SG = os.environ['GENERAL_CONTAINER_SG']
+
+CLUSTER_NAME = os.environ.get('CLUSTER_NAME', 'Gridmaster')
+# Minutes in which the waiting messages of a service should be drained and the message age that is considered late
+SCALING_DRAIN_MINUTES = float(os.environ.get('SCALING_DRAIN_MINUTES', 5.75))
+SCALING_MAX_AGE_SECONDS = int(os.environ.get('SCALING_MAX_AGE_SECONDS', 1800))
+# Minutes of CloudWatch metrics used to observe the throughput of the services
+SCALING_METRIC_WINDOW_MINUTES = int(os.environ.get('SCALING_METRIC_WINDOW_MINUTES', 10))
+
+# Services scaled on their queue. Throughput (messages per task per minute) is a starting estimate, the observed
+# throughput is used once a service has been busy
+SERVICES = [
+    Service('esdl', 'gridmaster-esdl-generator', ESDL_QUEUE_URL, ESDL_CONTAINER_LIMIT, 2),
+    Service('init', 'gridmaster-init', INIT_QUEUE_URL, INIT_CONTAINER_LIMIT, 2),
+    Service('etm', 'gridmaster-etm-api', ETM_QUEUE_URL, ETM_CONTAINER_LIMIT, 1),
+    Service('essim', 'gridmaster-essim', ESSIM_QUEUE_URL, ESSIM_CONTAINER_LIMIT, 0.2),
+    Service('gasunieLoadflow', 'gridmaster-gasunie-loadflow', LOADFLOW_QUEUE_URL, LOADFLOW_CONTAINER_LIMIT, 1),
+]
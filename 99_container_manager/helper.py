@@ -1,5 +1,8 @@
 import boto3
 import logging
+from botocore.exceptions import ClientError
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
 
 from config import *
 
@@ -12,17 +15,19 @@ else:
 
 sqs_client = boto3.client('sqs')
 ecs_client = boto3.client('ecs')
+cloudwatch_client = boto3.client('cloudwatch')
 
 
-def get_task_count(cluster, family):
-    task_count = 0
+def get_task_counts(cluster, family):
+    """Tasks of a family that are running or starting, and how many of those are running already"""
+    task_arns = []
     response = ecs_client.list_tasks(
         cluster=cluster,
         family=family,
         maxResults=100,
         desiredStatus='RUNNING'
     )
-    task_count += len(response['taskArns'])
+    task_arns += response['taskArns']
     while response.get('nextToken'):
         response = ecs_client.list_tasks(
             cluster=cluster,
@@ -31,27 +36,42 @@ def get_task_count(cluster, family):
             desiredStatus='RUNNING',
             nextToken=response['nextToken']
         )
-        task_count += len(response['taskArns'])
-    return task_count
+        task_arns += response['taskArns']
 
+    running = 0
+    # describe_tasks takes at most 100 tasks per call
+    for start in range(0, len(task_arns), 100):
+        response = ecs_client.describe_tasks(cluster=cluster, tasks=task_arns[start:start + 100])
+        running += sum(task['lastStatus'] == 'RUNNING' for task in response['tasks'])
+    return len(task_arns), running
 
-def update_ecs_desired_count(cluster: str, family: str, task_definition: str, container_limit: int, container_delta: int):
-    response = ecs_client.list_tasks(
+
+def run_tasks(cluster: str, task_definition: str, count: int, security_groups, subnets):
+    return ecs_client.run_task(
         cluster=cluster,
-        family=family,
-        maxResults=100,
-        desiredStatus='RUNNING'
+        count=count,
+        enableECSManagedTags=True,
+        enableExecuteCommand=True,
+        taskDefinition=task_definition,
+        launchType='FARGATE',
+        networkConfiguration={
+            'awsvpcConfiguration': {
+                'subnets': subnets,
+                'securityGroups': security_groups,
+                'assignPublicIp': 'DISABLED'
+            }
+        }
     )
 
-    current_container_count = len(response['taskArns'])
+
+def update_ecs_desired_count(cluster: str, task_definition: str, container_limit: int, container_delta: int,
+                             current_container_count: int):
     if current_container_count <= container_limit:
         # spawn more containers based on limit and current messages in queue
         if (container_delta + current_container_count) > container_limit:
             containers_to_add = container_limit - current_container_count
         else:
             containers_to_add = container_delta
-        if containers_to_add <= 0 and current_container_count == 0:
-            containers_to_add = 1
 
         security_groups = determine_security_group(task_definition)
         subnets = determine_subnets(task_definition)
@@ -59,49 +79,65 @@ def update_ecs_desired_count(cluster: str, family: str, task_definition: str, co
             logging.info('No containers to add for {}'.format(task_definition))
         else:
             logging.info('Adding {} new containers for {}'.format(str(containers_to_add), task_definition))
-            # We can only add 10 container per API call, so loop if we need more.
+            # We can only add 10 container per API call, so launch the batches in parallel
             loop_range, modulus = divmod(containers_to_add, 10)
-            for i in range(loop_range):
-                response = ecs_client.run_task(
-                    cluster=cluster,
-                    count=10,
-                    enableECSManagedTags=True,
-                    enableExecuteCommand=True,
-                    taskDefinition=task_definition,
-                    launchType='FARGATE',
-                    networkConfiguration={
-                        'awsvpcConfiguration': {
-                            'subnets': subnets,
-                            'securityGroups': security_groups,
-                            'assignPublicIp': 'DISABLED'
-                        }
-                    }
-                )
-            if modulus > 0:
-                response = ecs_client.run_task(
-                    cluster=cluster,
-                    count=modulus,
-                    enableECSManagedTags=True,
-                    enableExecuteCommand=True,
-                    taskDefinition=task_definition,
-                    launchType='FARGATE',
-                    networkConfiguration={
-                        'awsvpcConfiguration': {
-                            'subnets': subnets,
-                            'securityGroups': security_groups,
-                            'assignPublicIp': 'DISABLED'
-                        }
-                    }
-                )
-
-
-def parse_queue_status(queue_url):
+            batches = [10] * loop_range + ([modulus] if modulus > 0 else [])
+            with ThreadPoolExecutor(max_workers=len(batches)) as executor:
+                futures = [executor.submit(run_tasks, cluster, task_definition, count, security_groups, subnets)
+                           for count in batches]
+                for future in futures:
+                    response = future.result()
+                    for failure in response.get('failures', []):
+                        logging.warning('Could not start task for {}: {}'.format(task_definition, failure))
+
+
+def get_queue_depth(queue_url):
     queue_attributes = sqs_client.get_queue_attributes(
         QueueUrl=queue_url,
-        AttributeNames=['ApproximateNumberOfMessages']
+        AttributeNames=['ApproximateNumberOfMessages', 'ApproximateNumberOfMessagesNotVisible']
     )
-    queue_length = int(queue_attributes['Attributes']['ApproximateNumberOfMessages'])
-    return queue_length, round(queue_length / 2)
+    return (int(queue_attributes['Attributes']['ApproximateNumberOfMessages']),
+            int(queue_attributes['Attributes']['ApproximateNumberOfMessagesNotVisible']))
+
+
+def get_queue_metrics(queue_urls, window_minutes):
+    """Age of the oldest message and messages deleted per minute for every queue, from CloudWatch
+
+    Both are 0 when the metrics cannot be read (GetMetricData denied or throttled), so the services are scaled on
+    their queue depth and configured throughput.
+    """
+    queries = []
+    for number, queue_url in enumerate(queue_urls):
+        queue_name = queue_url.rstrip('/').split('/')[-1]
+        for kind, metric, stat in [('age', 'ApproximateAgeOfOldestMessage', 'Maximum'),
+                                   ('deleted', 'NumberOfMessagesDeleted', 'Sum')]:
+            queries.append({
+                'Id': '{}_{}'.format(kind, number),
+                'MetricStat': {
+                    'Metric': {'Namespace': 'AWS/SQS', 'MetricName': metric,
+                               'Dimensions': [{'Name': 'QueueName', 'Value': queue_name}]},
+                    'Period': 60,
+                    'Stat': stat,
+                },
+            })
+    end = datetime.utcnow()
+    metrics = {queue_url: [0.0, 0.0] for queue_url in queue_urls}
+    try:
+        response = cloudwatch_client.get_metric_data(MetricDataQueries=queries,
+                                                     StartTime=end - timedelta(minutes=window_minutes), EndTime=end)
+    except ClientError as ex:
+        logging.warning('Could not read the queue metrics, scaling on queue depth only: {}'.format(ex))
+        return metrics
+    for result in response['MetricDataResults']:
+        kind, number = result['Id'].split('_')
+        if not result['Values']:
+            continue
+        if kind == 'age':
+            # Values are ordered newest first
+            metrics[queue_urls[int(number)]][0] = float(result['Values'][0])
+        else:
+            metrics[queue_urls[int(number)]][1] = sum(result['Values']) / window_minutes
+    return metrics
 
 
 def determine_subnets(task_definition):
@@ -0,0 +1,58 @@
+import math
+from collections import namedtuple
+
+# A service scaled by the container manager: ECS task family consuming queue_url, at most limit tasks.
+# throughput is the number of messages one busy task completes per minute, a higher observed rate replaces it
+Service = namedtuple('Service', ['name', 'family', 'queue_url', 'limit', 'throughput'])
+# Observed state of a service: queue depth, age of the oldest message, messages completed per minute over the
+# last metric window, the number of tasks running or starting and the number of those already running
+ServiceStatus = namedtuple('ServiceStatus', ['visible', 'in_flight', 'age_seconds', 'deleted_per_minute', 'tasks',
+                                             'running'])
+ScalingDecision = namedtuple('ScalingDecision', ['service', 'target', 'add', 'surplus', 'throughput', 'reason'])
+
+
+def task_throughput(service, status):
+    """Messages per minute one task completes.
+
+    Completed messages only show what the tasks can do while they had more work waiting than they were
+    processing, otherwise the configured throughput of the service is used. Only running tasks count, tasks
+    still starting have not completed anything yet. The metric window also covers minutes in which the tasks
+    were idle or not started, so an observed rate below the configured one is not taken as the task speed.
+    """
+    if status.running > 0 and status.visible > 0 and status.deleted_per_minute > 0:
+        return max(status.deleted_per_minute / status.running, service.throughput)
+    return service.throughput
+
+
+def decide(service, status, drain_minutes=5.75, max_age_seconds=1800):
+    """Target task count for a service so its waiting messages drain within drain_minutes.
+
+    The target covers the messages completed per minute over the metric window, the load the service already
+    carries, plus the visible messages spread over drain_minutes. In flight messages are being processed by a
+    task already and do not count. When the oldest message is older than max_age_seconds the drain time is
+    shortened proportionally to catch up. Tasks are only ever added here, running tasks stop by themselves when
+    their queue is empty, so a target below the running count is reported as surplus: a hint that the service
+    is over provisioned.
+    """
+    throughput = task_throughput(service, status)
+    minutes = drain_minutes
+    if status.age_seconds > max_age_seconds:
+        minutes = drain_minutes * max_age_seconds / status.age_seconds
+
+    target = 0
+    if status.visible > 0:
+        # Never leave waiting messages without a consumer
+        target = max(math.ceil((status.visible / minutes + status.deleted_per_minute) / throughput), 1)
+    target = min(target, service.limit)
+
+    add = max(target - status.tasks, 0)
+    surplus = max(status.tasks - target, 0)
+    if add:
+        reason = 'scaleUp'
+    elif status.tasks >= service.limit and status.visible > 0:
+        reason = 'limitReached'
+    elif surplus:
+        reason = 'scaleDownHint'
+    else:
+        reason = 'steady'
+    return ScalingDecision(service.name, target, add, surplus, throughput, reason)
@@ -0,0 +1,255 @@
+"""Offline replay of queue arrival traces against the container manager scaling policies.
+
+SQS and ECS are replaced by in-process stand-ins on a simulated clock: tasks take startup_seconds before they
+consume messages, process one message at a time at the configured per-task throughput and stop by themselves
+once their queue has been empty for idle_exit_seconds, like the Gridmaster containers do. Every
+manager_interval_seconds the policy sees the same status the container manager collects and decides how many
+tasks to launch.
+
+Run from this directory, without AWS access:
+
+    python simulate_scaling.py --synthetic --hours 12
+    python simulate_scaling.py --trace arrivals.csv --startup-seconds 90 --throughput essim=0.25
+
+A trace is a csv with the columns minute, service and arrivals (messages arriving on the queue of the service
+in that minute). Results are reported per policy as backlog-hours (message hours spent waiting or being
+processed), task-hours and the minutes until every queue was drained.
+"""
+import argparse
+import csv
+import json
+import random
+from collections import defaultdict, deque
+from functools import partial
+
+from scaling import Service, ServiceStatus, decide
+
+# Mirrors the services and container limits of the container manager in template.yaml
+DEFAULT_SERVICES = [
+    Service('esdl', 'gridmaster-esdl-generator', 'esdl', 20, 2),
+    Service('init', 'gridmaster-init', 'init', 10, 2),
+    Service('etm', 'gridmaster-etm-api', 'etm', 4, 1),
+    Service('essim', 'gridmaster-essim', 'essim', 100, 0.2),
+    Service('gasunieLoadflow', 'gridmaster-gasunie-loadflow', 'gasunieLoadflow', 100, 1),
+]
+
+
+class SimQueue:
+    """SQS stand-in keeping the arrival time of every message"""
+
+    def __init__(self):
+        self.visible = deque()
+        self.in_flight = 0
+        self.deleted = deque()
+
+    def send(self, now, count):
+        self.visible.extend([now] * count)
+
+    def receive(self):
+        if not self.visible:
+            return None
+        self.in_flight += 1
+        return self.visible.popleft()
+
+    def delete(self, now):
+        self.in_flight -= 1
+        self.deleted.append(now)
+
+    def age_seconds(self, now):
+        return now - self.visible[0] if self.visible else 0.0
+
+    def deleted_per_minute(self, now, window_minutes):
+        while self.deleted and self.deleted[0] < now - window_minutes * 60:
+            self.deleted.popleft()
+        return len(self.deleted) / window_minutes
+
+
+class SimTask:
+    def __init__(self, ready_at):
+        self.ready_at = ready_at
+        self.busy_until = None
+        self.idle_since = ready_at
+
+
+class SimCluster:
+    """ECS stand-in running the tasks of one service against its queue"""
+
+    def __init__(self, queue, throughput, startup_seconds, idle_exit_seconds):
+        self.queue = queue
+        self.service_seconds = 60.0 / throughput
+        self.startup_seconds = startup_seconds
+        self.idle_exit_seconds = idle_exit_seconds
+        self.tasks = []
+
+    def run_task(self, now, count):
+        self.tasks.extend(SimTask(now + self.startup_seconds) for _ in range(count))
+
+    def running(self, now):
+        return sum(task.ready_at <= now for task in self.tasks)
+
+    def step(self, now):
+        running = []
+        for task in self.tasks:
+            if task.busy_until is not None and task.busy_until <= now:
+                self.queue.delete(task.busy_until)
+                task.busy_until = None
+                task.idle_since = now
+            if task.busy_until is None and task.ready_at <= now:
+                if self.queue.receive() is not None:
+                    task.busy_until = now + self.service_seconds
+                elif now - task.idle_since >= self.idle_exit_seconds:
+                    # Queue stayed empty, the container stops itself
+                    continue
+            running.append(task)
+        self.tasks = running
+
+
+def legacy_policy(service, status):
+    """The threshold rule the container manager used before the scaling table"""
+    queue_length = status.visible
+    if not ((queue_length > 10 or (status.tasks == 0 and queue_length > 0)) and status.tasks < service.limit):
+        return 0
+    delta = round(queue_length / 2)
+    to_add = service.limit - status.tasks if delta + status.tasks > service.limit else delta
+    if to_add <= 0 and status.tasks == 0:
+        to_add = 1
+    return to_add
+
+
+def predictive_policy(service, status, drain_minutes=5.75, max_age_seconds=1800):
+    return decide(service, status, drain_minutes, max_age_seconds).add
+
+
+POLICIES = {
+    'legacy': legacy_policy,
+    'predictive': predictive_policy,
+}
+
+
+def read_trace(path):
+    """Arrivals per service per minute from a csv with the columns minute, service and arrivals"""
+    arrivals = defaultdict(lambda: defaultdict(int))
+    with open(path, newline='') as f:
+        for row in csv.DictReader(f):
+            arrivals[row['service']][int(row['minute'])] += int(row['arrivals'])
+    return arrivals
+
+
+def synthetic_trace(services, hours, seed=0):
+    """Bursty arrivals: a scenario batch every few minutes during working hours, quiet periods in between"""
+    rng = random.Random(seed)
+    arrivals = defaultdict(lambda: defaultdict(int))
+    for minute in range(int(hours * 60)):
+        active = (minute // 60) % 24 < 16
+        if active and rng.random() < 0.3:
+            batch = rng.randint(1, 8)
+            for service in services:
+                arrivals[service.name][minute] += batch
+    return arrivals
+
+
+def simulate(policy, services, arrivals, startup_seconds=120, idle_exit_seconds=300, step_seconds=5,
+             manager_interval_seconds=60, window_minutes=10, max_hours=72):
+    queues = {service.name: SimQueue() for service in services}
+    clusters = {service.name: SimCluster(queues[service.name], service.throughput, startup_seconds, idle_exit_seconds)
+                for service in services}
+    last_arrival = max((minute for trace in arrivals.values() for minute in trace), default=0) * 60
+    backlog_seconds = defaultdict(float)
+    task_seconds = defaultdict(float)
+    drained_at = {}
+
+    now = 0.0
+    while now <= max_hours * 3600:
+        minute, offset = divmod(int(now), 60)
+        for service in services:
+            queue, cluster = queues[service.name], clusters[service.name]
+            if offset < step_seconds:
+                queue.send(now, arrivals.get(service.name, {}).get(minute, 0))
+            cluster.step(now)
+
+            if int(now) % manager_interval_seconds < step_seconds:
+                status = ServiceStatus(len(queue.visible), queue.in_flight, queue.age_seconds(now),
+                                       queue.deleted_per_minute(now, window_minutes), len(cluster.tasks),
+                                       cluster.running(now))
+                to_add = policy(service, status)
+                if to_add > 0:
+                    cluster.run_task(now, to_add)
+
+            backlog_seconds[service.name] += (len(queue.visible) + queue.in_flight) * step_seconds
+            task_seconds[service.name] += len(cluster.tasks) * step_seconds
+            if now >= last_arrival and not queue.visible and not queue.in_flight:
+                drained_at.setdefault(service.name, now)
+            elif service.name in drained_at and (queue.visible or queue.in_flight):
+                del drained_at[service.name]
+
+        if len(drained_at) == len(services) and all(not cluster.tasks for cluster in clusters.values()):
+            break
+        now += step_seconds
+
+    return {
+        service.name: {
+            'backlogHours': round(backlog_seconds[service.name] / 3600, 2),
+            'taskHours': round(task_seconds[service.name] / 3600, 2),
+            'timeToDrainMinutes': (round(drained_at[service.name] / 60, 1) if service.name in drained_at else None),
+        }
+        for service in services
+    }
+
+
+def parse_overrides(values):
+    overrides = {}
+    for value in values or []:
+        name, number = value.split('=')
+        overrides[name] = float(number)
+    return overrides
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Replay queue arrivals against the container manager policies')
+    parser.add_argument('--trace', help='csv with the columns minute, service and arrivals')
+    parser.add_argument('--synthetic', action='store_true', help='generate a bursty synthetic trace')
+    parser.add_argument('--hours', type=float, default=24, help='length of the synthetic trace')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--policies', nargs='+', default=sorted(POLICIES), choices=sorted(POLICIES))
+    parser.add_argument('--startup-seconds', type=float, default=120, help='time before a new task consumes')
+    parser.add_argument('--idle-exit-seconds', type=float, default=300, help='idle time before a task stops')
+    parser.add_argument('--throughput', nargs='*', help='per task messages per minute, e.g. essim=0.25')
+    parser.add_argument('--limit', nargs='*', help='task limit per service, e.g. essim=50')
+    parser.add_argument('--drain-minutes', type=float, default=5.75, help='drain time of the predictive policy')
+    parser.add_argument('--max-age-seconds', type=float, default=1800, help='late message age of the predictive policy')
+    parser.add_argument('--json', help='also write the results to this file')
+    args = parser.parse_args()
+
+    throughput = parse_overrides(args.throughput)
+    limits = parse_overrides(args.limit)
+    services = [service._replace(throughput=throughput.get(service.name, service.throughput),
+                                 limit=int(limits.get(service.name, service.limit)))
+                for service in DEFAULT_SERVICES]
+    if args.trace:
+        arrivals = read_trace(args.trace)
+    elif args.synthetic:
+        arrivals = synthetic_trace(services, args.hours, args.seed)
+    else:
+        parser.error('either --trace or --synthetic is required')
+
+    policies = dict(POLICIES, predictive=partial(predictive_policy, drain_minutes=args.drain_minutes,
+                                                 max_age_seconds=args.max_age_seconds))
+    results = {name: simulate(policies[name], services, arrivals, args.startup_seconds, args.idle_exit_seconds)
+               for name in args.policies}
+
+    print('{:<12} {:<16} {:>14} {:>11} {:>15}'.format('policy', 'service', 'backlog-hours', 'task-hours',
+                                                      'drain-minutes'))
+    for name, per_service in results.items():
+        for service, result in per_service.items():
+            print('{:<12} {:<16} {:>14} {:>11} {:>15}'.format(name, service, result['backlogHours'],
+                                                              result['taskHours'], str(result['timeToDrainMinutes'])))
+        print('{:<12} {:<16} {:>14} {:>11}'.format(name, 'total',
+                                                   round(sum(r['backlogHours'] for r in per_service.values()), 2),
+                                                   round(sum(r['taskHours'] for r in per_service.values()), 2)))
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,20 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from helper import get_queue_depth, get_queue_metrics, get_task_counts
+from scaling import ServiceStatus
+
+
+def collect_status(cluster, services, window_minutes, max_workers=8):
+    """Queue depth, queue metrics and task counts of every service, fetched concurrently"""
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        metrics = executor.submit(get_queue_metrics, [service.queue_url for service in services], window_minutes)
+        depths = {service.name: executor.submit(get_queue_depth, service.queue_url) for service in services}
+        task_counts = {service.name: executor.submit(get_task_counts, cluster, service.family) for service in services}
+
+        status = {}
+        for service in services:
+            visible, in_flight = depths[service.name].result()
+            age_seconds, deleted_per_minute = metrics.result()[service.queue_url]
+            tasks, running = task_counts[service.name].result()
+            status[service.name] = ServiceStatus(visible, in_flight, age_seconds, deleted_per_minute, tasks, running)
+    return status
@@ -0,0 +1,316 @@
+"""Times and memory-profiles the numerically heavy functions of networktools on synthetic inputs.
+
+Every case runs one function of networktools, the ones the stages call, on inputs from workloads.py. A case is
+measured at a base size and again with one dimension at a time scaled up or down:
+
+    hours     hours of the curves (make_MCA_input_frame always takes a year)
+    nodes     nodes of the ETM regionalization
+    sites     ESSIM sites, the substations follow from them
+    stations  stations of the network, with a line per station and a trafo per fifth station
+
+The time of a case is the median of --repeat calls, its memory the peak memory tracemalloc traced during one
+more call. The inputs are built before and not counted. Run from this directory with the requirements of the
+stage whose networktools copy is measured:
+
+    python bench_networktools.py --output before.json
+    python bench_networktools.py --output after.json --baseline before.json
+    python bench_networktools.py --cases make_nodal_ecurves --quick
+
+networktools needs pandas older than 2 (tested with 1.5.3): under the copy-on-write of newer pandas the chained
+update in ecurves.aggregate_mv_substations fails, so the script stops on other pandas versions.
+
+With --baseline, the cases of both files are matched on their parameters and the ones more than --threshold
+slower or larger are reported as regressions, the exit code is then 1. The json holds the commit, the library
+versions and per case the parameters, the timings, the peak memory and the shape of the result.
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+import warnings
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+import workloads
+
+REPOSITORY = workloads.REPOSITORY
+# Cases scale one dimension at a time from the base size
+BASE = {'hours': 2190, 'nodes': 100, 'sites': 400, 'stations': 60}
+SCALES = {
+    'hours': [730, 2190, 8760],
+    'nodes': [25, 100, 400],
+    'sites': [100, 400, 1600],
+    'stations': [20, 60, 240],
+}
+QUICK_BASE = {'hours': 168, 'nodes': 20, 'sites': 50, 'stations': 20}
+QUICK_SCALES = {
+    'hours': [168, 730],
+    'nodes': [20, 80],
+    'sites': [50, 200],
+    'stations': [20, 80],
+}
+# Chunk size and overload arguments the stages pass
+ECURVES_CHUNK_SIZE = 750
+STEDIN_REDUNDANCY = 0
+STEDIN_FACTOR = 13.3
+GAS_NODES = 40
+
+# dimensions are scaled by the case, inputs are the parameters its inputs are built from
+Case = namedtuple('Case', ['name', 'function', 'dimensions', 'inputs', 'prepare'])
+
+
+def electricity_inputs(parameters, seed):
+    cat = workloads.categorization()
+    sites = workloads.sites(parameters['sites'], parameters['stations'], cat, seed=seed)
+    return {
+        'ETM': workloads.etm_merit_order(parameters['hours'], cat, seed=seed),
+        'ESSIM': workloads.essim_curves(sites, parameters['hours'], seed=seed),
+        'cat': cat,
+        'reg': workloads.regionalization(parameters['nodes'], cat, seed=seed),
+        'sites': sites,
+        'network': workloads.network(parameters['stations'], seed=seed),
+    }
+
+
+def prepare_nodal_ecurves(networktools, parameters, seed):
+    inputs = electricity_inputs(parameters, seed)
+    return lambda: networktools.postprocessing.make_nodal_ecurves(size=ECURVES_CHUNK_SIZE, **inputs)
+
+
+def prepare_discount(networktools, parameters, seed):
+    """Regionalized ETM and aggregated ESSIM curves of a whole run, discounted in one go"""
+    ecurves = networktools.postprocessing.ecurves
+    inputs = electricity_inputs(parameters, seed)
+    ETM = ecurves.process_ETM_curves(inputs['ETM'], inputs['cat'], inputs['reg'], workloads.CARRIER)
+    ESSIM = ecurves.process_ESSIM_ecurves(inputs['ESSIM'], inputs['sites'], inputs['network'])
+    return lambda: ecurves.discount_market_curves(ETM, ESSIM, workloads.ESSIM_NODE)
+
+
+def prepare_mca(networktools, parameters, seed):
+    msites = workloads.gas_sites(parameters['sites'], GAS_NODES, 'BAL_M', seed=seed)
+    hsites = workloads.gas_sites(parameters['sites'], GAS_NODES, 'BAL_H', seed=seed + 1)
+    mESSIM = workloads.essim_curves(msites, workloads.HOURS_PER_YEAR, seed=seed)
+    hESSIM = workloads.essim_curves(hsites, workloads.HOURS_PER_YEAR, seed=seed + 1)
+    return lambda: networktools.postprocessing.make_MCA_input_frame(mESSIM, msites, hESSIM, hsites)
+
+
+def prepare_network_overload(networktools, parameters, seed):
+    network = workloads.network(parameters['stations'], seed=seed)
+    flows = workloads.flows(network, parameters['hours'], seed=seed)
+    return lambda: networktools.loadflow.evaluate_network_overload(network, flows)
+
+
+def stedin_inputs(parameters, seed):
+    """Stedin designs only hold sites at MV substations"""
+    sites = workloads.sites(parameters['sites'], parameters['stations'], mv_share=1, seed=seed)
+    return sites, workloads.essim_curves(sites, parameters['hours'], seed=seed)
+
+
+def prepare_mv_substations(networktools, parameters, seed):
+    sites, ESSIM = stedin_inputs(parameters, seed)
+    return lambda: networktools.substations.evaluate_mv_substations(ESSIM, sites)
+
+
+def prepare_substation_overload(networktools, parameters, seed):
+    sites, ESSIM = stedin_inputs(parameters, seed)
+    substations = workloads.substations(sites, seed=seed)
+    flow = networktools.substations.evaluate_mv_substations(ESSIM, sites)
+    return lambda: networktools.substations.evaluate_substation_overload(substations, flow, STEDIN_REDUNDANCY,
+                                                                         STEDIN_FACTOR)
+
+
+CASES = [
+    Case('make_nodal_ecurves', 'postprocessing.make_nodal_ecurves', ('hours', 'nodes', 'sites'),
+         ('hours', 'nodes', 'sites', 'stations'), prepare_nodal_ecurves),
+    Case('discount_market_curves', 'postprocessing.discounter.discount_market_curves', ('hours', 'nodes', 'sites'),
+         ('hours', 'nodes', 'sites', 'stations'), prepare_discount),
+    Case('make_MCA_input_frame', 'postprocessing.make_MCA_input_frame', ('sites',), ('sites',), prepare_mca),
+    Case('evaluate_network_overload', 'loadflow.evaluate_network_overload', ('hours', 'stations'),
+         ('hours', 'stations'), prepare_network_overload),
+    Case('evaluate_mv_substations', 'substations.evaluate_mv_substations', ('hours', 'sites'),
+         ('hours', 'sites', 'stations'), prepare_mv_substations),
+    Case('evaluate_substation_overload', 'substations.evaluate_substation_overload', ('hours', 'sites'),
+         ('hours', 'sites', 'stations'), prepare_substation_overload),
+]
+
+
+def import_networktools(stage):
+    """networktools as copied into a stage directory, the copies can differ between stages"""
+    sys.path.insert(0, os.path.join(REPOSITORY, stage))
+    import networktools
+    import networktools.loadflow
+    import networktools.postprocessing
+    import networktools.postprocessing.ecurves
+    import networktools.substations
+    return networktools
+
+
+def parameter_sets(case, base, scales):
+    """The base parameters of the inputs of a case and every scaled variant of them, without duplicates"""
+    base = {dimension: base[dimension] for dimension in case.inputs}
+    sets = [base]
+    for dimension in case.dimensions:
+        for value in scales[dimension]:
+            parameters = dict(base, **{dimension: value})
+            if parameters not in sets:
+                sets.append(parameters)
+    return sets
+
+
+def shape(result):
+    if isinstance(result, tuple):
+        return [shape(item) for item in result]
+    return list(getattr(result, 'shape', ()))
+
+
+def measure(call, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = call()
+        timings.append(time.perf_counter() - start)
+        del result
+
+    tracemalloc.start()
+    try:
+        result = call()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return {
+        'seconds': {'min': min(timings), 'median': statistics.median(timings), 'max': max(timings)},
+        'repeat': repeat,
+        'peak_memory_mb': peak / 2 ** 20,
+        'result_shape': shape(result),
+    }
+
+
+def run_case(networktools, case, parameters, repeat, seed):
+    call = case.prepare(networktools, parameters, seed)
+    result = {'case': case.name, 'function': 'networktools.' + case.function, 'parameters': parameters}
+    result.update(measure(call, repeat))
+    return result
+
+
+def case_key(result):
+    return result['case'], json.dumps(result['parameters'], sort_keys=True)
+
+
+def git_commit():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=REPOSITORY, capture_output=True, text=True,
+                                check=True).stdout.strip()
+        status = subprocess.run(['git', 'status', '--porcelain'], cwd=REPOSITORY, capture_output=True, text=True,
+                                check=True).stdout
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+    return commit, bool(status.strip())
+
+
+def compare(current, baseline, threshold):
+    """Ratios of the median time and peak memory to the baseline, printed per case, returns the regressions"""
+    previous = {case_key(result): result for result in baseline['results']}
+    regressions = []
+    print('\nCompared with {} ({})'.format(baseline.get('commit') or 'unknown commit', baseline.get('created')))
+    for setting in ('stage', 'seed', 'python', 'pandas', 'numpy', 'machine'):
+        if baseline.get(setting) != current[setting]:
+            print('The baseline ran with {} {}, this run with {}'.format(setting, baseline.get(setting),
+                                                                         current[setting]))
+    print('{:<30} {:<40} {:>8} {:>8}'.format('case', 'parameters', 'time', 'memory'))
+    for result in current['results']:
+        before = previous.get(case_key(result))
+        if before is None:
+            continue
+        time_ratio = result['seconds']['median'] / max(before['seconds']['median'], 1e-9)
+        memory_ratio = result['peak_memory_mb'] / max(before['peak_memory_mb'], 1e-9)
+        regressed = time_ratio > 1 + threshold or memory_ratio > 1 + threshold
+        print('{:<30} {:<40} {:>7.2f}x {:>7.2f}x{}'.format(
+            result['case'], format_parameters(result['parameters']), time_ratio, memory_ratio,
+            '  REGRESSION' if regressed else ''))
+        if regressed:
+            regressions.append({'case': result['case'], 'parameters': result['parameters'],
+                                'time_ratio': time_ratio, 'memory_ratio': memory_ratio})
+    return regressions
+
+
+def format_parameters(parameters):
+    return ' '.join('{}={}'.format(dimension, value) for dimension, value in parameters.items())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--stage', default='05_post_processing_tennet',
+                        help='Stage directory whose networktools copy is measured')
+    parser.add_argument('--cases', help='Comma separated case names, default all: ' +
+                                        ', '.join(case.name for case in CASES))
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--quick', action='store_true', help='Small sizes, to check the benchmarks run')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='Write the results as json to this file')
+    parser.add_argument('--baseline', help='Results json of an earlier run to compare with')
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help='Fraction a case may be slower or larger than the baseline')
+    parser.add_argument('--log-level', default='ERROR')
+    args = parser.parse_args()
+    logging.basicConfig(level=args.log_level)
+    if int(pd.__version__.split('.')[0]) >= 2:
+        parser.error('networktools needs pandas older than 2, found pandas {}'.format(pd.__version__))
+    # networktools still uses pandas api that newer pandas versions deprecate, once per chunk
+    warnings.simplefilter('ignore', FutureWarning)
+
+    names = args.cases.split(',') if args.cases else [case.name for case in CASES]
+    unknown = set(names) - {case.name for case in CASES}
+    if unknown:
+        parser.error('unknown cases {}'.format(', '.join(sorted(unknown))))
+    base, scales = (QUICK_BASE, QUICK_SCALES) if args.quick else (BASE, SCALES)
+
+    networktools = import_networktools(args.stage)
+    commit, dirty = git_commit()
+    report = {
+        'commit': commit,
+        'dirty': dirty,
+        'created': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'stage': args.stage,
+        'quick': args.quick,
+        'seed': args.seed,
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'numpy': np.__version__,
+        'machine': platform.platform(),
+        'results': [],
+    }
+
+    print('{:<30} {:<40} {:>10} {:>10}'.format('case', 'parameters', 'median s', 'peak MiB'))
+    for case in CASES:
+        if case.name not in names:
+            continue
+        for parameters in parameter_sets(case, base, scales):
+            result = run_case(networktools, case, parameters, args.repeat, args.seed)
+            report['results'].append(result)
+            print('{:<30} {:<40} {:>10.3f} {:>10.1f}'.format(
+                case.name, format_parameters(result['parameters']), result['seconds']['median'],
+                result['peak_memory_mb']))
+
+    regressions = []
+    if args.baseline:
+        with open(args.baseline, 'r') as f:
+            regressions = compare(report, json.load(f), args.threshold)
+        report['baseline'] = args.baseline
+        report['regressions'] = regressions
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,194 @@
+"""Synthetic inputs for the networktools functions, shaped like the data the stages read.
+
+The ETM merit order has a column for every electricity key of the categorization of 05_post_processing_tennet,
+so the categorization and regionalization run on the real key set. Substations are named like the network
+models do (station letters followed by the voltage, e.g. ABC150), sites at MV substations are aggregated to the
+150 kV bus of their station, and the networks are namespaces holding the bus, line and trafo tables of a
+pandapower network, with the columns networktools reads. Every generator takes a seed, the same arguments give
+the same frames.
+"""
+import itertools
+import os
+import string
+from types import SimpleNamespace
+
+import numpy as np
+import pandas as pd
+
+REPOSITORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CATEGORIZATION_CSV = os.path.join(REPOSITORY, '05_post_processing_tennet', 'data', 'etm_curves_categorization.csv')
+HOURS_PER_YEAR = 8760
+CARRIER = 'Electricity'
+# ETM node of the ESSIM area, discounted by postprocess_ecurves
+ESSIM_NODE = 'HICxxx'
+MV_VOLTAGES = (10, 20, 50)
+
+
+def categorization():
+    """Categorization of the ETM keys, read like get_static_data does"""
+    return pd.read_csv(CATEGORIZATION_CSV, sep=';', decimal=',', index_col=0)
+
+
+def station_names(count):
+    """count distinct station codes of three letters"""
+    codes = (''.join(letters) for letters in itertools.product(string.ascii_uppercase, repeat=3))
+    return list(itertools.islice(codes, count))
+
+
+def daily_profile(hours, rng, peak_hour):
+    """Load factor per hour between 0.2 and 1, peaking at peak_hour with some noise"""
+    hour = np.arange(hours)
+    daily = 0.6 + 0.3 * np.cos(2 * np.pi * (hour % 24 - peak_hour) / 24)
+    seasonal = 0.1 * np.cos(2 * np.pi * hour / HOURS_PER_YEAR)
+    return np.clip(daily + seasonal + rng.normal(0, 0.05, hours), 0.2, 1)
+
+
+def etm_merit_order(hours=HOURS_PER_YEAR, cat=None, seed=0):
+    """ETM electricity curves in MW with hours in the index and the categorized keys in the columns.
+
+    Like merit_order.csv after helper.electricity_post_processing dropped the Time column. A tenth of the keys
+    are zero all year, as the technologies a scenario does not use are.
+    """
+    rng = np.random.default_rng(seed)
+    cat = categorization() if cat is None else cat
+    keys = cat[cat.carrier == CARRIER].index
+    levels = rng.lognormal(mean=5, sigma=1.5, size=keys.size)
+    levels[rng.random(keys.size) < 0.1] = 0
+    profiles = np.column_stack([daily_profile(hours, rng, rng.integers(24)) for _ in range(keys.size)])
+    return pd.DataFrame(profiles * levels, columns=keys)
+
+
+def regionalization(nodes, cat=None, seed=0):
+    """Share of every sector per node, nodes in the index and sectors in the columns, each column sums to 1.
+
+    The first node is the ESSIM area, the others are named ETM0001, ETM0002, ...
+    """
+    rng = np.random.default_rng(seed)
+    cat = categorization() if cat is None else cat
+    sectors = cat[cat.carrier == CARRIER].sector.unique()
+    index = [ESSIM_NODE] + ['ETM{:04d}'.format(number) for number in range(1, nodes)]
+    shares = rng.dirichlet(np.ones(nodes), size=sectors.size).T
+    return pd.DataFrame(shares, index=index, columns=sectors)
+
+
+def network(stations, seed=0):
+    """Network with a 150 kV bus per station, a 380 kV bus and trafo at every fifth and a line per bus pair.
+
+    The buses form a ring with a chord every tenth bus, like a meshed transmission grid.
+    """
+    rng = np.random.default_rng(seed)
+    names = station_names(stations)
+    ehv = names[::5]
+    bus = pd.DataFrame({
+        'name': [name + ' 150kV' for name in names] + [name + ' 380kV' for name in ehv],
+        'sShort': [name + '150' for name in names] + [name + '380' for name in ehv],
+        'vn_kv': [150.0] * len(names) + [380.0] * len(ehv),
+    })
+
+    hv_buses = np.arange(len(names))
+    from_bus = np.concatenate([hv_buses, hv_buses[::10]])
+    to_bus = np.concatenate([np.roll(hv_buses, -1), np.roll(hv_buses, -len(names) // 2)[::10]])
+    line = pd.DataFrame({
+        'name': ['{}-{} {}'.format(names[a], names[b], number)
+                 for number, (a, b) in enumerate(zip(from_bus, to_bus))],
+        'from_bus': from_bus,
+        'to_bus': to_bus,
+        'length_km': rng.uniform(2, 60, from_bus.size).round(1),
+        'max_i_ka': rng.choice([0.9, 1.3, 2.0, 2.6], from_bus.size),
+    })
+
+    ehv_buses = np.arange(len(names), len(bus))
+    trafo = pd.DataFrame({
+        'name': [name + ' 380/150' for name in ehv],
+        'hv_bus': ehv_buses,
+        'lv_bus': hv_buses[::5],
+        'sn_mva': rng.choice([500.0, 750.0, 1000.0], ehv_buses.size),
+    })
+    return SimpleNamespace(bus=bus, line=line, trafo=trafo)
+
+
+def sites(count, stations, cat=None, mv_share=0.6, seed=0):
+    """Site configurations with sites in the index and substation, sector and capacity in the columns.
+
+    A share mv_share of the sites is connected to an MV substation of its station, the others to the 150 kV
+    substation, so every site can be aggregated onto a bus of network(stations). Sites both consume and produce,
+    so their sectors are the ones the categorization has demand and supply keys for.
+    """
+    rng = np.random.default_rng(seed)
+    cat = categorization() if cat is None else cat
+    names = np.array(station_names(stations))
+    electricity = cat[cat.carrier == CARRIER]
+    products = electricity.groupby('sector')['product'].nunique()
+    sectors = products[products == electricity['product'].nunique()].index
+    voltages = np.where(rng.random(count) < mv_share, rng.choice(MV_VOLTAGES, count), 150)
+    substation = np.char.add(rng.choice(names, count), voltages.astype(str))
+    return pd.DataFrame({
+        'substation': substation,
+        'sector': rng.choice(sectors, count),
+        'capacity': rng.uniform(1, 100, count).round(1),
+    }, index=pd.Index(['site{:05d}'.format(number) for number in range(count)], name='site'))
+
+
+def essim_curves(sites, hours=HOURS_PER_YEAR, seed=0):
+    """ESSIM power curves in MW with hours in the index and sites in the columns.
+
+    Positive values are demand and negative values supply, a third of the sites mostly supplies.
+    """
+    rng = np.random.default_rng(seed)
+    count = len(sites)
+    sign = np.where(rng.random(count) < 1 / 3, -1, 1)
+    profiles = np.column_stack([daily_profile(hours, rng, rng.integers(24)) for _ in range(count)])
+    # Sites swing around their mean, so supplying sites have some hours of demand as well
+    swing = rng.normal(0, 0.25, (hours, count))
+    values = (profiles + swing) * sign * sites.capacity.to_numpy()
+    return pd.DataFrame(values, columns=sites.index)
+
+
+def gas_sites(count, nodes, balancing, seed=0):
+    """Methane or hydrogen sites with substation (their gas node) and capacity in the columns.
+
+    Like essim_msites.csv and essim_hsites.csv, the last site is the balancing site (BAL_M or BAL_H) the GasUnie
+    post processing adds.
+    """
+    rng = np.random.default_rng(seed)
+    node_names = ['{}{:03d}'.format(balancing[-1], number) for number in range(nodes)]
+    index = ['{}_site{:05d}'.format(balancing, number) for number in range(count - 1)] + [balancing]
+    return pd.DataFrame({
+        'substation': list(rng.choice(node_names, count - 1)) + [balancing],
+        'capacity': rng.uniform(1, 100, count).round(1),
+    }, index=index)
+
+
+def flows(network, hours=HOURS_PER_YEAR, loading=0.8, seed=0):
+    """Loadflow results in MVA with hours in the index and (element, index) in the columns.
+
+    The flows follow a daily profile scaled to loading times the element capacity, so the elements loaded
+    most overload in some hours.
+    """
+    rng = np.random.default_rng(seed)
+    frames = {}
+    line_kv = network.line.from_bus.map(network.bus.vn_kv)
+    capacities = {
+        'line': line_kv * network.line.max_i_ka * np.sqrt(3),
+        'trafo': network.trafo.sn_mva,
+    }
+    for element, capacity in capacities.items():
+        scale = capacity.to_numpy() * rng.uniform(0.3, 1.2, capacity.size) * loading
+        profiles = np.column_stack([daily_profile(hours, rng, rng.integers(24)) for _ in range(capacity.size)])
+        direction = np.where(rng.random(capacity.size) < 0.5, -1, 1)
+        frames[element] = pd.DataFrame(profiles * scale * direction, columns=capacity.index)
+    return pd.concat(frames, axis=1)
+
+
+def substations(sites, seed=0):
+    """Substations with capacity in MVA and the number of trafos, indexed by node like essim_substations.csv.
+
+    Every substation of the sites gets two to four trafos sized to roughly the sum of its site capacities.
+    """
+    rng = np.random.default_rng(seed)
+    nodes = np.sort(sites.substation.unique())
+    connected = sites.groupby('substation').capacity.sum().reindex(nodes).to_numpy()
+    return pd.DataFrame({
+        'trafos': rng.integers(2, 5, nodes.size),
+        'capacity': (connected * rng.uniform(0.7, 1.3, nodes.size)).round(1),
+    }, index=pd.Index(nodes, name='node'))
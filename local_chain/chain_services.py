@@ -0,0 +1,118 @@
+"""Stand-ins for the services outside this repository: the ETM API and the containers of the chain.
+
+The ETM API is a local HTTP server returning an electricity price curve for every scenario id. The containers
+(ESDL generator, ETM, ESSIM and the GasUnie loadflow) are replaced by handlers that copy a fixture file to the
+location the container would write, optionally wait to mimic its run time, and pass the message on to the next
+queue, like the containers do.
+"""
+import json
+import logging
+import math
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+HOURS_PER_YEAR = 8760
+
+
+def synthetic_price_curve(seed=0):
+    """Hourly electricity prices with a daily and a seasonal cycle, in the csv layout of the ETM curve API"""
+    rng = random.Random(seed)
+    lines = ['Time,Price (Euros)']
+    for hour in range(HOURS_PER_YEAR):
+        price = (55 + 15 * math.sin(2 * math.pi * (hour % 24 - 6) / 24)
+                 + 10 * math.cos(2 * math.pi * hour / HOURS_PER_YEAR) + rng.gauss(0, 5))
+        lines.append('{}-{:02d}:00,{:.2f}'.format(hour // 24 + 1, hour % 24, max(price, 0)))
+    return '\n'.join(lines) + '\n'
+
+
+class EtmServer:
+    """ETM curve API on a free local port, every scenario gets the same curve after latency seconds"""
+
+    def __init__(self, curve_csv, latency=0.0):
+        self.curve = curve_csv.encode('utf-8')
+        self.latency = latency
+        self.requests = 0
+        self.lock = threading.Lock()
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), self.request_handler())
+        self.server.daemon_threads = True
+
+    @property
+    def url(self):
+        return 'http://127.0.0.1:{}/api/v3'.format(self.server.server_address[1])
+
+    def request_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                parts = self.path.strip('/').split('/')
+                # api/v3/scenarios/<id>/curves/<name>
+                if len(parts) != 6 or parts[2] != 'scenarios' or parts[4] != 'curves':
+                    self.send_error(404)
+                    return
+                with server.lock:
+                    server.requests += 1
+                time.sleep(server.latency)
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/csv')
+                self.send_header('Content-Length', str(len(server.curve)))
+                self.end_headers()
+                self.wfile.write(server.curve)
+
+            def log_message(self, format, *args):
+                logging.debug('ETM stand-in: ' + format % args)
+
+        return Handler
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def in_scenario_folder(name):
+    return lambda body: body['bucketFolder'] + name
+
+
+def next_to(field, name):
+    """Key of name in the folder of the object another field of the message points to"""
+    return lambda body: body[field].rsplit('/', 1)[0] + '/' + name
+
+
+class ContainerStub:
+    """Handler standing in for a container consuming a queue.
+
+    outputs maps a message field to (fixture file name, key function). The fixture is written to the key the
+    field already holds, or to the key function of the message when it is empty, and the field is set to it.
+    """
+
+    def __init__(self, name, outputs, next_queue_url, sqs_client, s3_client, bucket, fixtures, seconds=0.0):
+        self.name = name
+        self.outputs = outputs
+        self.next_queue_url = next_queue_url
+        self.sqs_client = sqs_client
+        self.s3_client = s3_client
+        self.bucket = bucket
+        self.fixtures = fixtures
+        self.seconds = seconds
+        self.content = {}
+
+    def fixture(self, file_name):
+        if file_name not in self.content:
+            with open(self.fixtures + '/' + file_name, 'rb') as f:
+                self.content[file_name] = f.read()
+        return self.content[file_name]
+
+    def __call__(self, event, context):
+        for record in event['Records']:
+            body = json.loads(record['body'])
+            for field, (file_name, key) in self.outputs.items():
+                body[field] = body.get(field) or key(body)
+                self.s3_client.put_object(Bucket=self.bucket, Key=body[field], Body=self.fixture(file_name))
+            time.sleep(self.seconds)
+            self.sqs_client.send_message(QueueUrl=self.next_queue_url, MessageBody=json.dumps(body))
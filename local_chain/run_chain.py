@@ -0,0 +1,549 @@
+"""Runs the lambda chain end to end on one machine, without AWS, to measure throughput and stage latency.
+
+Every stage is imported from its own directory and its lambda_handler is called with SQS events, like the event
+source mappings of template.yaml do. boto3 and pymysql are replaced by the in-process stand-ins of standins.py
+and scenario_db.py, the ETM API and the containers by those of chain_services.py. Synthetic scenarios are
+created in the scenario database and driven through kick-off, ESDL update, ESSIM export, the post processing
+fanout, TenneT/GasUnie/Stedin post processing and loadflows, the GasUnie metrics and the state writer until
+every queue is empty.
+
+Install the requirements.txt of every stage in one environment and run from this directory:
+
+    python run_chain.py --fixtures ~/gridmaster-fixtures --scenarios 20
+    python run_chain.py --fixtures ~/gridmaster-fixtures --scenarios 50 --container-seconds essim=5 --report run.json
+
+The confidential network data removed from this repository (the networks and the investment model data of the
+stages) is needed as well, without it the TenneT stages fail their messages. The fixtures directory holds what
+the services outside this repository would produce:
+
+    scenario/                  copied below the bucketFolder of every scenario when it is created, e.g.
+                               tennetInvestmentModels/<path>/essim_sites.csv.gz,
+                               gasunieInvestmentModels/<model>_<networkId>/essim_msites.csv.gz and
+                               stedinDesigns/<design>/essim_sites.csv.gz
+    baseEsdl.esdl              written by the ESDL generator stand-in
+    etmResults.tar.gz          written by the ETM container stand-in (merit_order.csv, network_gas.csv, ...)
+    essimResults.tar.gz        written by the ESSIM stand-in
+    gasunieLoadFlow.tar.gz     written by the GasUnie loadflow stand-in (faal*.csv)
+    networks/<networkId>.sqlite  network bucket of the TenneT stages
+    electricity_price.csv      optional, served by the ETM API stand-in, a synthetic curve otherwise
+
+Stages run one invocation at a time, so the report measures the work of the chain per scenario rather than the
+concurrency of the deployment. Reported are the throughput in scenarios per hour, per stage the invocations,
+handler time, queue wait, CPU time, S3 bytes and phase times (from the metric lines the stages print), and per
+scenario the time from kick-off to the end of its last message. Stage settings the runner does not set, like
+KICK_OFF_MAX_ADMIT or SKIP_COMPLETED_STAGES, are taken from the environment.
+"""
+import argparse
+import contextlib
+import csv
+import hashlib
+import importlib
+import io
+import json
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+import uuid
+from collections import namedtuple, defaultdict
+
+import scenario_db
+from chain_services import EtmServer, ContainerStub, synthetic_price_curve, in_scenario_folder, next_to
+from standins import LocalAws, REGION_NAME
+
+REPOSITORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BUCKET_NAME = 'gridmaster-local'
+# 07_loadflow_tennet reads the networks from this bucket by name
+NETWORK_BUCKET_NAME = 'gridmaster-networks'
+DATABASE_SECRET_NAME = 'gridmaster/local/database'
+DATABASE_SECRET = {'host': '127.0.0.1', 'port': 3306, 'username': 'local', 'password': 'local'}
+FANOUT_TOPIC = 'GridmasterPostProcessingFanout'
+# Synthetic scenarios wait in this state, no stage writes it so the kick-off claims every scenario once
+NEW_STATE = 'new'
+INVESTMENT_MODEL_MAPPING = os.path.join(REPOSITORY, '04_post_processing_fanout', 'data',
+                                        'investments_investments_model_mapping.csv')
+FIXTURES = ['scenario', 'baseEsdl.esdl', 'etmResults.tar.gz', 'essimResults.tar.gz', 'gasunieLoadFlow.tar.gz',
+            'networks']
+
+# Queues of template.yaml and the environment variable holding their url, if a stage needs it
+QUEUES = {
+    'GridmasterEsdlGeneratorQueue': 'ESDL_QUEUE_URL',
+    'GridmasterInitQueue': 'INIT_QUEUE_URL',
+    'GridmasterEtmApiQueue': 'ETM_QUEUE_URL',
+    'GridmasterESDLUpdaterQueue': 'ESDL_UPDATER_QUEUE_URL',
+    'GridmasterESSIMQueue': 'ESSIM_QUEUE_URL',
+    'GridmasterESSIMExportQueue': 'ESSIM_EXPORT_QUEUE_URL',
+    'GridmasterTennetPostProcessingFanoutQueue': None,
+    'GridmasterTennetPostProcessingQueue': 'TENNET_POST_PROCESSING_QUEUE_URL',
+    'GridmasterTennetLoadflowQueue': 'TENNET_LOADFLOW_QUEUE_URL',
+    'GridmasterGasuniePostProcessingQueue': 'GASUNIE_POST_PROCESSING_QUEUE_URL',
+    'GridmasterGasunieLoadflowQueue': 'GASUNIE_LOADFLOW_QUEUE_URL',
+    'GridmasterGasunieMetrics': None,
+    'GridmasterStedinLoadflowQueue': 'STEDIN_LOADFLOW_QUEUE_URL',
+    'GridmasterStateUpdateQueue': 'STATE_UPDATE_QUEUE_URL',
+}
+FANOUT_SUBSCRIBERS = ['GridmasterGasuniePostProcessingQueue', 'GridmasterStedinLoadflowQueue',
+                      'GridmasterTennetPostProcessingFanoutQueue']
+
+# Consumer of a queue, directory is the stage of a Lambda function and None for a container stand-in. Batch
+# sizes are those of the event source mappings in template.yaml, in chain order
+Consumer = namedtuple('Consumer', ['name', 'queue', 'batch_size', 'directory'])
+CONSUMERS = [
+    Consumer('esdlGenerator', 'GridmasterEsdlGeneratorQueue', 1, None),
+    Consumer('etm', 'GridmasterEtmApiQueue', 1, None),
+    Consumer('esdlUpdater', 'GridmasterESDLUpdaterQueue', 3, '02_esdl_updater'),
+    Consumer('essim', 'GridmasterESSIMQueue', 1, None),
+    Consumer('essimExport', 'GridmasterESSIMExportQueue', 1, '03_essim_export'),
+    Consumer('postProcessingFanout', 'GridmasterTennetPostProcessingFanoutQueue', 10, '04_post_processing_fanout'),
+    Consumer('tennetPostProcessing', 'GridmasterTennetPostProcessingQueue', 5, '05_post_processing_tennet'),
+    Consumer('gasuniePostProcessing', 'GridmasterGasuniePostProcessingQueue', 1, '06_post_processing_gasunie'),
+    Consumer('stedinLoadflow', 'GridmasterStedinLoadflowQueue', 1, '08_loadflow_stedin'),
+    Consumer('tennetLoadflow', 'GridmasterTennetLoadflowQueue', 5, '07_loadflow_tennet'),
+    Consumer('gasunieLoadflow', 'GridmasterGasunieLoadflowQueue', 1, None),
+    Consumer('gasunieMetrics', 'GridmasterGasunieMetrics', 1, '09_gasunie_metrics'),
+    Consumer('stateWriter', 'GridmasterStateUpdateQueue', 10, '10_state_writer'),
+]
+KICK_OFF = Consumer('kickOff', None, 0, '01_kick_off')
+
+
+@contextlib.contextmanager
+def stage_context(directory):
+    """Working directory and import path of a stage.
+
+    Stages share module names (config, helper, s3_io, ...), so the modules imported from the stage directory
+    are dropped from sys.modules afterwards. The handler keeps its own references to them.
+    """
+    directory = os.path.join(REPOSITORY, directory)
+    previous = os.getcwd()
+    os.chdir(directory)
+    sys.path.insert(0, directory)
+    try:
+        yield
+    finally:
+        sys.path.remove(directory)
+        os.chdir(previous)
+        for name, module in list(sys.modules.items()):
+            if (getattr(module, '__file__', None) or '').startswith(directory + os.sep):
+                del sys.modules[name]
+
+
+def load_handler(directory):
+    with stage_context(directory):
+        importlib.invalidate_caches()
+        return importlib.import_module('app').lambda_handler
+
+
+class LambdaContext:
+    def __init__(self, function_name, timeout_seconds=900):
+        self.function_name = function_name
+        self.aws_request_id = str(uuid.uuid4())
+        self.deadline = time.time() + timeout_seconds
+
+    def get_remaining_time_in_millis(self):
+        return max(int((self.deadline - time.time()) * 1000), 0)
+
+
+def sqs_event(queue, messages):
+    records = []
+    for message in messages:
+        attributes = {
+            'ApproximateReceiveCount': str(message['ReceiveCount']),
+            'SentTimestamp': str(int(message['SentTimestamp'] * 1000)),
+        }
+        if message['MessageGroupId'] is not None:
+            attributes['MessageGroupId'] = message['MessageGroupId']
+        records.append({
+            'messageId': message['MessageId'],
+            'receiptHandle': message['MessageId'],
+            'body': message['Body'],
+            'attributes': attributes,
+            'messageAttributes': {},
+            'md5OfBody': hashlib.md5(message['Body'].encode('utf-8')).hexdigest(),
+            'eventSource': 'aws:sqs',
+            'eventSourceARN': queue.arn,
+            'awsRegion': REGION_NAME,
+        })
+    return {'Records': records}
+
+
+def scheduled_event():
+    return {'version': '0', 'id': str(uuid.uuid4()), 'detail-type': 'Scheduled Event', 'source': 'aws.events',
+            'time': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()), 'region': REGION_NAME, 'resources': [],
+            'detail': {}}
+
+
+def scenario_id(message_body):
+    """scenarioId of a message, an SNS notification or a state update, None when it has none"""
+    try:
+        body = json.loads(message_body)
+        if 'scenarioId' not in body and 'Message' in body:
+            body = json.loads(body['Message'])
+        if 'scenarioId' not in body and 'params' in body:
+            body = body['params']
+        return body.get('scenarioId')
+    except (AttributeError, TypeError, ValueError):
+        return None
+
+
+def summary(values):
+    if not values:
+        return {'count': 0}
+    values = sorted(values)
+
+    def percentile(fraction):
+        return values[min(int(fraction * len(values)), len(values) - 1)]
+
+    return {'count': len(values), 'mean': round(sum(values) / len(values), 3), 'p50': round(percentile(0.5), 3),
+            'p95': round(percentile(0.95), 3), 'max': round(values[-1], 3)}
+
+
+class StageStats:
+    def __init__(self):
+        self.invocations = 0
+        self.messages = 0
+        self.failed = 0
+        self.dead = 0
+        self.durations = []
+        self.waits = []
+        self.cpu = 0.0
+        self.bytes_read = 0
+        self.bytes_written = 0
+        self.phases = defaultdict(float)
+
+    def add_metric_line(self, document):
+        """Sum the metrics of an instrumentation line of the stage, see instrumentation.py"""
+        if 'Phase' in document:
+            self.phases[document['Phase']] += document.get('WallTime', 0) / 1000
+        else:
+            self.cpu += document.get('CpuTime', 0) / 1000
+            self.bytes_read += document.get('BytesRead', 0)
+            self.bytes_written += document.get('BytesWritten', 0)
+
+    def report(self):
+        return {
+            'invocations': self.invocations,
+            'messages': self.messages,
+            'failedMessages': self.failed,
+            'deadLetters': self.dead,
+            'handlerSeconds': summary(self.durations),
+            'queueWaitSeconds': summary(self.waits),
+            'cpuSeconds': round(self.cpu, 3),
+            'bytesRead': self.bytes_read,
+            'bytesWritten': self.bytes_written,
+            'phaseSeconds': {phase: round(seconds, 3) for phase, seconds in self.phases.items()},
+        }
+
+
+class ChainRunner:
+    def __init__(self, aws, database, handlers, max_receives):
+        self.aws = aws
+        self.database = database
+        self.handlers = handlers
+        self.max_receives = max_receives
+        self.stats = defaultdict(StageStats)
+        self.kicked_off = {}
+        self.finished = {}
+        self.failed = set()
+
+    def claimable(self):
+        return self.database.execute('SELECT COUNT(*) FROM scenario_overview WHERE calculationState = ?',
+                                     (NEW_STATE,)).fetchone()[0]
+
+    def invoke(self, consumer, event, messages=()):
+        stats = self.stats[consumer.name]
+        stats.invocations += 1
+        stats.messages += len(messages)
+        started = time.time()
+        stats.waits.extend(started - message['SentTimestamp'] for message in messages)
+        output = io.StringIO()
+        directory_context = stage_context(consumer.directory) if consumer.directory else contextlib.nullcontext()
+        try:
+            with directory_context, contextlib.redirect_stdout(output):
+                response = self.handlers[consumer.name](event, LambdaContext(consumer.name))
+            failed = {item['itemIdentifier'] for item in response.get('batchItemFailures', [])} \
+                if isinstance(response, dict) else set()
+        except Exception:
+            logging.exception('{} failed, its {} messages will be redelivered'.format(consumer.name, len(messages)))
+            failed = {message['MessageId'] for message in messages}
+        finished = time.time()
+        stats.durations.append(finished - started)
+
+        for line in output.getvalue().splitlines():
+            try:
+                document = json.loads(line)
+            except ValueError:
+                document = None
+            if isinstance(document, dict) and '_aws' in document:
+                stats.add_metric_line(document)
+            else:
+                print(line)
+
+        queue_url = self.aws.sqs.queues[consumer.queue].url if consumer.queue else None
+        for message in messages:
+            scenario = scenario_id(message['Body'])
+            if message['MessageId'] in failed:
+                stats.failed += 1
+                if not self.aws.sqs.release(queue_url, message, self.max_receives):
+                    logging.error('{} gave up on message {} of scenario {}'.format(
+                        consumer.name, message['MessageId'], scenario))
+                    stats.dead += 1
+                    if scenario is not None:
+                        self.failed.add(scenario)
+                continue
+            self.aws.sqs.delete(queue_url, message)
+            if scenario is not None:
+                self.kicked_off.setdefault(scenario, message['SentTimestamp'])
+                self.finished[scenario] = max(self.finished.get(scenario, 0), finished)
+
+    def run(self, kick_off_interval, idle_timeout):
+        """Invoke the consumers until every scenario went through the chain, False when the chain got stuck"""
+        last_kick_off = idle_since = None
+        while True:
+            busy = False
+            if self.claimable() and (last_kick_off is None or time.time() - last_kick_off >= kick_off_interval):
+                self.invoke(KICK_OFF, scheduled_event())
+                last_kick_off = time.time()
+            for consumer in CONSUMERS:
+                if consumer.name not in self.handlers:
+                    continue
+                messages = self.aws.sqs.receive(self.aws.sqs.queues[consumer.queue].url, consumer.batch_size)
+                if messages:
+                    self.invoke(consumer, sqs_event(self.aws.sqs.queues[consumer.queue], messages), messages)
+                    busy = True
+            if busy:
+                idle_since = None
+                continue
+            if not self.claimable() and not self.aws.sqs.pending():
+                return True
+            idle_since = idle_since or time.time()
+            if time.time() - idle_since > idle_timeout:
+                logging.error('Nothing to do for {} seconds while scenarios are left, stopping'.format(idle_timeout))
+                return False
+            time.sleep(0.1)
+
+
+def investment_mapping():
+    """Scenario years and the number of TenneT investment paths per scenario of the fanout"""
+    with open(INVESTMENT_MODEL_MAPPING, 'r') as f:
+        rows = list(csv.reader(f, delimiter=';'))
+    return [int(year) for year in rows[0][1:]], len(rows) - 1
+
+
+def seed_scenarios(aws, database, fixtures, count, years, etm_scenarios, rng):
+    """Create count scenarios waiting for the kick-off, with the scenario fixtures in their bucketFolder"""
+    scenario_root = os.path.join(fixtures, 'scenario')
+    scenario_files = {}
+    for path, dirs, files in os.walk(scenario_root):
+        for name in files:
+            with open(os.path.join(path, name), 'rb') as f:
+                scenario_files[os.path.relpath(os.path.join(path, name), scenario_root).replace(os.sep, '/')] = f.read()
+
+    # New ETM scenario ids every run, so the curve cache of the ESDL updater starts cold
+    first_etm_scenario = int(time.time())
+    scenarios = []
+    for number in range(count):
+        scenario_uuid, year = str(uuid.uuid4()), rng.choice(years)
+        folder = 'scenarios/{}/{}/'.format(scenario_uuid, year)
+        for key, content in scenario_files.items():
+            aws.s3.put_object(Bucket=BUCKET_NAME, Key=folder + key, Body=content)
+        context_scenario = {'contextScenario': first_etm_scenario + rng.randrange(etm_scenarios)}
+        aws.s3.put_object(Bucket=BUCKET_NAME, Key=folder + 'contextScenario.json',
+                          Body=json.dumps(context_scenario).encode('utf-8'))
+        scenarios.append({
+            'scenarioId': number + 1,
+            'scenarioUuid': scenario_uuid,
+            'scenarioYear': year,
+            'calculationState': NEW_STATE,
+            'bucketName': BUCKET_NAME,
+            'bucketFolder': folder,
+            'contextScenarioLocation': folder + 'contextScenario.json',
+            'baseEsdlLocation': folder + 'baseEsdl.esdl',
+            'etmResultLocation': folder + 'etmResults.tar.gz',
+            'essimResultLocation': folder + 'essimResults.tar.gz',
+        })
+    scenario_db.insert_scenarios(database, scenarios)
+
+    networks = os.path.join(fixtures, 'networks')
+    for name in os.listdir(networks):
+        with open(os.path.join(networks, name), 'rb') as f:
+            aws.s3.put_object(Bucket=NETWORK_BUCKET_NAME, Key=name, Body=f.read())
+
+
+def container_stubs(aws, urls, fixtures, seconds):
+    def stub(name, outputs, next_queue):
+        return ContainerStub(name, outputs, urls[next_queue], aws.sqs, aws.s3, BUCKET_NAME, fixtures,
+                             seconds.get(name, 0.0))
+
+    return {
+        'esdlGenerator': stub('esdlGenerator', {'baseEsdlLocation': ('baseEsdl.esdl', in_scenario_folder(
+            'baseEsdl.esdl'))}, 'GridmasterEtmApiQueue'),
+        'etm': stub('etm', {'etmResultLocation': ('etmResults.tar.gz', in_scenario_folder('etmResults.tar.gz'))},
+                    'GridmasterESDLUpdaterQueue'),
+        'essim': stub('essim', {'essimResultLocation': ('essimResults.tar.gz', in_scenario_folder(
+            'essimResults.tar.gz'))}, 'GridmasterESSIMExportQueue'),
+        # The GasUnie metrics read the investment model and network from the folder of the loadflow results
+        'gasunieLoadflow': stub('gasunieLoadflow', {'gasunieLoadFlowLocation': ('gasunieLoadFlow.tar.gz', next_to(
+            'postProcessingGasunieLocation', 'loadFlowGasunie.tar.gz'))}, 'GridmasterGasunieMetrics'),
+    }
+
+
+def stage_environment(urls, topic_arn, etm_url, networks_per_scenario, args):
+    environment = {
+        'ENVIRONMENT': 'localChain',
+        'AWS_DEFAULT_REGION': REGION_NAME,
+        # Makes the stages use /tmp for scratch files, like on Lambda
+        'AWS_LAMBDA_FUNCTION_NAME': 'gridmaster-local-chain',
+        'BUCKET_NAME': BUCKET_NAME,
+        'NETWORK_BUCKET_NAME': NETWORK_BUCKET_NAME,
+        'DATABASE_SECRET_NAME': DATABASE_SECRET_NAME,
+        'DATABASE_SCHEMA_NAME': 'scenario_db',
+        'INFLUX_DB_IP': '127.0.0.1',
+        'POST_PROCESSING_FANOUT_ARN': topic_arn,
+        'ETM_API_URL': etm_url,
+        'ETM_REQUEST_LIMIT_PER_MINUTE': str(args.etm_requests_per_minute),
+        'KICK_OFF_CLAIM_STATE': NEW_STATE,
+        'KICK_OFF_INTERVAL_MINUTES': str(args.kick_off_interval / 60),
+        'TENNET_NETWORKS_PER_SCENARIO': str(networks_per_scenario),
+    }
+    for name, variable in QUEUES.items():
+        if variable:
+            environment[variable] = urls[name]
+    if args.direct_state_updates:
+        environment['STATE_UPDATE_QUEUE_URL'] = ''
+    if args.profile:
+        environment['PROFILE_HANDLER'] = 'true'
+    return environment
+
+
+def print_report(report):
+    scenarios = report['scenarios']
+    print('\nScenarios: {} seeded, {} kicked off, {} completed, {} failed in {:.1f} s, {:.1f} scenarios/hour'.format(
+        scenarios['seeded'], scenarios['kickedOff'], scenarios['completed'], scenarios['failed'],
+        report['elapsedSeconds'], report['scenariosPerHour']))
+    latency = report['scenarioLatencySeconds']
+    if latency['count']:
+        print('Scenario latency: mean {mean:.1f} s, p50 {p50:.1f} s, p95 {p95:.1f} s, max {max:.1f} s'.format(
+            **latency))
+    print('\n{:<24}{:>8}{:>9}{:>8}{:>10}{:>9}{:>9}{:>9}{:>11}{:>9}'.format(
+        'Stage', 'calls', 'messages', 'failed', 'total s', 'mean s', 'p95 s', 'max s', 'wait p95 s', 'cpu s'))
+    for name, stage in report['stages'].items():
+        handler, wait = stage['handlerSeconds'], stage['queueWaitSeconds']
+        print('{:<24}{:>8}{:>9}{:>8}{:>10.1f}{:>9.2f}{:>9.2f}{:>9.2f}{:>11.2f}{:>9.1f}'.format(
+            name, stage['invocations'], stage['messages'], stage['failedMessages'],
+            handler['mean'] * handler['count'], handler['mean'], handler['p95'], handler['max'],
+            wait.get('p95', 0.0), stage['cpuSeconds']))
+        for phase, seconds in sorted(stage['phaseSeconds'].items(), key=lambda item: -item[1]):
+            print('    {:<20}{:>10.1f} s'.format(phase, seconds))
+
+
+def parse_container_seconds(text):
+    seconds = {}
+    for item in filter(None, text.split(',')):
+        name, value = item.split('=')
+        seconds[name.strip()] = float(value)
+    return seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--fixtures', required=True, help='Directory with the fixtures, see the module docstring')
+    parser.add_argument('--scenarios', type=int, default=10)
+    parser.add_argument('--years', help='Comma separated scenario years, default every year of the fanout mapping')
+    parser.add_argument('--etm-scenarios', type=int, default=5,
+                        help='Distinct ETM scenarios the scenarios are spread over, each is one ETM request')
+    parser.add_argument('--etm-latency', type=float, default=0.0, help='Seconds per ETM curve request')
+    parser.add_argument('--etm-requests-per-minute', type=int, default=30)
+    parser.add_argument('--container-seconds', type=parse_container_seconds, default={},
+                        help='Run time per message of the container stand-ins, e.g. essim=30,etm=2')
+    parser.add_argument('--kick-off-interval', type=float, default=5.0, help='Seconds between kick-offs')
+    parser.add_argument('--max-receives', type=int, default=3,
+                        help='Deliveries of a failing message before it is set aside as a dead letter')
+    parser.add_argument('--idle-timeout', type=float, default=120.0)
+    parser.add_argument('--direct-state-updates', action='store_true',
+                        help='Write state changes from the stages instead of through the state writer')
+    parser.add_argument('--profile', action='store_true', help='Profile every invocation of the data stages')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workdir', help='Empty directory for the buckets and the database, default a new one')
+    parser.add_argument('--report', help='Also write the report as json to this file')
+    parser.add_argument('--log-level', default='WARNING')
+    args = parser.parse_args()
+
+    fixtures = os.path.abspath(os.path.expanduser(args.fixtures))
+    missing = [name for name in FIXTURES if not os.path.exists(os.path.join(fixtures, name))]
+    if missing:
+        parser.error('missing fixtures in {}: {}'.format(fixtures, ', '.join(missing)))
+    workdir = os.path.abspath(args.workdir) if args.workdir else tempfile.mkdtemp(prefix='gridmaster-chain-')
+    os.makedirs(workdir, exist_ok=True)
+    if os.listdir(workdir):
+        parser.error('workdir {} is not empty'.format(workdir))
+    logging.basicConfig(level=args.log_level)
+
+    years, networks_per_scenario = investment_mapping()
+    if args.years:
+        years = [int(year) for year in args.years.split(',')]
+    rng = random.Random(args.seed)
+
+    aws = LocalAws(os.path.join(workdir, 's3'), {DATABASE_SECRET_NAME: DATABASE_SECRET})
+    urls = {name: aws.sqs.create_queue(QueueName=name)['QueueUrl'] for name in QUEUES}
+    topic_arn = aws.sns.create_topic(Name=FANOUT_TOPIC)['TopicArn']
+    for name in FANOUT_SUBSCRIBERS:
+        aws.sns.subscribe(TopicArn=topic_arn, Protocol='sqs', Endpoint=urls[name])
+    aws.install()
+
+    database_path = os.path.join(workdir, 'scenario_db.sqlite')
+    database = scenario_db.create(database_path)
+    scenario_db.install(database_path)
+
+    price_curve_path = os.path.join(fixtures, 'electricity_price.csv')
+    if os.path.exists(price_curve_path):
+        with open(price_curve_path, 'r') as f:
+            price_curve = f.read()
+    else:
+        price_curve = synthetic_price_curve(args.seed)
+    etm = EtmServer(price_curve, args.etm_latency).start()
+
+    os.environ.update(stage_environment(urls, topic_arn, etm.url, networks_per_scenario, args))
+    handlers = container_stubs(aws, urls, fixtures, args.container_seconds)
+    for consumer in [KICK_OFF] + CONSUMERS:
+        if consumer.directory is None or (consumer.name == 'stateWriter' and args.direct_state_updates):
+            continue
+        handlers[consumer.name] = load_handler(consumer.directory)
+    # The stages configure logging on import
+    logging.getLogger().setLevel(args.log_level)
+
+    seed_scenarios(aws, database, fixtures, args.scenarios, years, args.etm_scenarios, rng)
+    logging.warning('Running {} scenarios in {}'.format(args.scenarios, workdir))
+
+    runner = ChainRunner(aws, database, handlers, args.max_receives)
+    started = time.time()
+    drained = runner.run(args.kick_off_interval, args.idle_timeout)
+    elapsed = time.time() - started
+    etm.stop()
+
+    completed = [scenario for scenario in runner.finished if scenario not in runner.failed]
+    report = {
+        'drained': drained,
+        'workdir': workdir,
+        'elapsedSeconds': round(elapsed, 3),
+        'scenarios': {'seeded': args.scenarios, 'kickedOff': len(runner.kicked_off), 'completed': len(completed),
+                      'failed': len(runner.failed)},
+        'scenariosPerHour': round(len(completed) / elapsed * 3600, 3) if elapsed else 0.0,
+        'scenarioLatencySeconds': summary([runner.finished[scenario] - runner.kicked_off[scenario]
+                                           for scenario in completed]),
+        'stages': {consumer.name: runner.stats[consumer.name].report() for consumer in [KICK_OFF] + CONSUMERS
+                   if consumer.name in runner.stats},
+        'etmRequests': etm.requests,
+        'database': scenario_db.state_counts(database),
+        'settings': {name: value for name, value in vars(args).items()},
+    }
+    print_report(report)
+    if args.report:
+        with open(args.report, 'w') as f:
+            json.dump(report, f, indent=2)
+    return 0 if drained and not runner.failed else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
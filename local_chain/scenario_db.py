@@ -0,0 +1,182 @@
+"""SQLite stand-in for the MySQL scenario database, installed by replacing pymysql.connect.
+
+The statements of the stages are translated on the fly: pyformat parameters become named parameters, the row
+locks of the kick-off claim are dropped (a single process never claims concurrently) and MySQL upserts become
+SQLite upserts on the key columns of the table. Cursors return rows as dicts, like the DictCursor the stages
+ask for.
+"""
+import os
+import re
+import sqlite3
+
+import pymysql
+
+REPOSITORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+INDEXES_SQL = os.path.join(REPOSITORY, '01_kick_off', 'sql', 'scenario_overview_indexes.sql')
+
+# Key columns of every table, the conflict target of the translated upserts. Same keys as 10_state_writer uses
+TABLE_KEYS = {
+    'scenario_overview': ('scenarioId',),
+    'loadflow_tennet': ('scenarioId', 'investmentPlan', 'networkId'),
+    'loadflow_gasunie': ('scenarioId', 'networkId', 'gasunieInvestmentModel'),
+    'loadflow_stedin': ('scenarioId', 'stedinDesign'),
+}
+
+# Columns the stages read and write, the scenario generation fills more of them in production
+SCHEMA = """
+CREATE TABLE scenario_overview (
+    scenarioId INTEGER PRIMARY KEY,
+    scenarioUuid TEXT NOT NULL,
+    scenarioYear INTEGER NOT NULL,
+    calculationState TEXT NOT NULL,
+    bucketName TEXT,
+    bucketFolder TEXT,
+    contextScenarioLocation TEXT,
+    baseEsdlLocation TEXT,
+    etmResultLocation TEXT,
+    essimResultLocation TEXT,
+    updatedEsdlLocation TEXT,
+    essimExportTennetLocation TEXT,
+    essimExportGasunieLocation TEXT
+);
+CREATE TABLE loadflow_tennet (
+    scenarioId INTEGER NOT NULL,
+    investmentPlan TEXT NOT NULL,
+    networkId TEXT NOT NULL,
+    calculationState TEXT,
+    postProcessingTennetLocation TEXT,
+    tennetLoadFlowLocation TEXT,
+    tennetMetricslocation TEXT,
+    PRIMARY KEY (scenarioId, investmentPlan, networkId)
+);
+CREATE TABLE loadflow_gasunie (
+    scenarioId INTEGER NOT NULL,
+    networkId TEXT NOT NULL,
+    gasunieInvestmentModel TEXT NOT NULL,
+    calculationState TEXT,
+    postProcessingGasunieLocation TEXT,
+    postProcessingGasunieAssignmentLocation TEXT,
+    gasunieLoadFlowLocation TEXT,
+    gasunieMetricsLocationH2 TEXT,
+    gasunieMetricsLocationCH4 TEXT,
+    PRIMARY KEY (scenarioId, networkId, gasunieInvestmentModel)
+);
+CREATE TABLE loadflow_stedin (
+    scenarioId INTEGER NOT NULL,
+    stedinDesign TEXT NOT NULL,
+    calculationState TEXT,
+    stedinLoadFlowLocation TEXT,
+    stedinOverloadLocation TEXT,
+    PRIMARY KEY (scenarioId, stedinDesign)
+);
+"""
+
+PARAMETER_PATTERN = re.compile(r'%\((\w+)\)s')
+ROW_LOCK_PATTERN = re.compile(r'\s+FOR\s+UPDATE(\s+SKIP\s+LOCKED|\s+NOWAIT)?\s*$', re.IGNORECASE)
+UPSERT_PATTERN = re.compile(r'ON\s+DUPLICATE\s+KEY\s+UPDATE(.*)$', re.IGNORECASE | re.DOTALL)
+INSERT_TABLE_PATTERN = re.compile(r'INSERT\s+INTO\s+(\w+)', re.IGNORECASE)
+VALUES_PATTERN = re.compile(r'VALUES\((\w+)\)', re.IGNORECASE)
+
+
+def translate(statement):
+    """SQLite version of a MySQL statement of the stages"""
+    sql = ROW_LOCK_PATTERN.sub('', statement.strip().rstrip(';'))
+    upsert = UPSERT_PATTERN.search(sql)
+    if upsert:
+        table = INSERT_TABLE_PATTERN.search(sql).group(1)
+        assignments = VALUES_PATTERN.sub(r'excluded.\1', upsert.group(1).strip())
+        sql = '{} ON CONFLICT ({}) DO UPDATE SET {}'.format(sql[:upsert.start()].rstrip(),
+                                                            ', '.join(TABLE_KEYS[table]), assignments)
+    return PARAMETER_PATTERN.sub(r':\1', sql)
+
+
+class Cursor:
+    def __init__(self, connection):
+        self.cursor = connection.cursor()
+
+    @property
+    def rowcount(self):
+        return self.cursor.rowcount
+
+    def execute(self, statement, parameters=None):
+        self.cursor.execute(translate(statement), parameters or {})
+        return self.cursor.rowcount
+
+    def executemany(self, statement, rows):
+        self.cursor.executemany(translate(statement), list(rows))
+        return self.cursor.rowcount
+
+    def fetchone(self):
+        row = self.cursor.fetchone()
+        return None if row is None else dict(row)
+
+    def fetchall(self):
+        return [dict(row) for row in self.cursor.fetchall()]
+
+    def close(self):
+        self.cursor.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+
+class Connection:
+    """The part of a pymysql connection the stages use"""
+
+    def __init__(self, path):
+        self.connection = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.connection.row_factory = sqlite3.Row
+
+    def cursor(self):
+        return Cursor(self.connection)
+
+    def begin(self):
+        # sqlite3 opens the transaction with the first write
+        pass
+
+    def commit(self):
+        self.connection.commit()
+
+    def rollback(self):
+        self.connection.rollback()
+
+    def ping(self, reconnect=True):
+        pass
+
+    def close(self):
+        self.connection.close()
+
+
+def create(path):
+    """New database with the tables and the indexes of the kick-off claim"""
+    connection = sqlite3.connect(path)
+    connection.executescript(SCHEMA)
+    with open(INDEXES_SQL, 'r') as f:
+        connection.executescript(f.read())
+    connection.commit()
+    return connection
+
+
+def insert_scenarios(connection, scenarios):
+    columns = list(scenarios[0])
+    connection.executemany('INSERT INTO scenario_overview ({}) VALUES ({})'.format(
+        ', '.join(columns), ', '.join(':' + column for column in columns)), scenarios)
+    connection.commit()
+
+
+def install(path):
+    """Make pymysql.connect open the SQLite database at path, whatever host or schema is asked for"""
+    pymysql.connect = lambda *args, **kwargs: Connection(path)
+
+
+def state_counts(connection):
+    """Number of rows per calculationState of every table"""
+    counts = {}
+    for table in TABLE_KEYS:
+        rows = connection.execute('SELECT calculationState, COUNT(*) FROM {} GROUP BY calculationState'.format(table))
+        counts[table] = {state: count for state, count in rows}
+    return counts
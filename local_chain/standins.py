@@ -0,0 +1,387 @@
+"""In-process stand-ins for the AWS services the stages call, installed by replacing boto3.client.
+
+Only the operations the stages and the kick-off use are implemented, with the same request and response shapes
+and the same error codes as botocore raises:
+
+- LocalS3, objects are files below root/<bucket>/<key>, with ranged and conditional GETs, multipart uploads and
+  list paginators with CommonPrefixes
+- LocalSqs, queues held in memory. The runner receives, deletes and releases messages itself, like the
+  Lambda event source mapping does
+- LocalSns, publish delivers an SNS notification envelope to every subscribed queue
+- LocalSecretsManager, secrets from a dict
+- LocalCloudWatch, the SQS metrics the rate controller queries, computed from the local queues
+"""
+import hashlib
+import io
+import json
+import os
+import threading
+import time
+import uuid
+from collections import deque
+
+import boto3
+from botocore.exceptions import ClientError
+
+REGION_NAME = 'eu-central-1'
+ACCOUNT_ID = '000000000000'
+
+
+def client_error(code, message, operation, status=400):
+    return ClientError({'Error': {'Code': code, 'Message': message},
+                        'ResponseMetadata': {'HTTPStatusCode': status}}, operation)
+
+
+def as_bytes(body):
+    if hasattr(body, 'read'):
+        body = body.read()
+    if isinstance(body, str):
+        body = body.encode('utf-8')
+    return bytes(body)
+
+
+class LocalS3:
+    def __init__(self, root):
+        self.root = root
+        self.etags = {}
+        self.uploads = {}
+        self.lock = threading.Lock()
+
+    def path(self, bucket, key):
+        return os.path.join(self.root, bucket, *key.split('/'))
+
+    def etag(self, path):
+        """Quoted md5 of the content like S3 returns for single part objects, cached per file version"""
+        stat = os.stat(path)
+        version = (stat.st_mtime_ns, stat.st_size)
+        with self.lock:
+            cached = self.etags.get(path)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+        with open(path, 'rb') as f:
+            etag = '"{}"'.format(hashlib.md5(f.read()).hexdigest())
+        with self.lock:
+            self.etags[path] = (version, etag)
+        return etag
+
+    def write(self, bucket, key, content):
+        path = self.path(bucket, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Readers never see a partially written object
+        temporary = '{}.{}.tmp'.format(path, uuid.uuid4().hex)
+        with open(temporary, 'wb') as f:
+            f.write(content)
+        os.replace(temporary, path)
+        return self.etag(path)
+
+    def existing(self, bucket, key, operation):
+        path = self.path(bucket, key)
+        if not os.path.isfile(path):
+            if operation == 'HeadObject':
+                raise client_error('404', 'Not Found', operation, 404)
+            raise client_error('NoSuchKey', 'The specified key does not exist.', operation, 404)
+        return path
+
+    def get_object(self, Bucket, Key, Range=None, IfMatch=None, **kwargs):
+        path = self.existing(Bucket, Key, 'GetObject')
+        etag = self.etag(path)
+        if IfMatch is not None and IfMatch != etag:
+            raise client_error('PreconditionFailed', 'At least one of the preconditions you specified did not hold.',
+                               'GetObject', 412)
+        size = os.path.getsize(path)
+        with open(path, 'rb') as f:
+            if Range is None:
+                content = f.read()
+                return {'Body': io.BytesIO(content), 'ContentLength': size, 'ETag': etag}
+            start, end = Range.replace('bytes=', '').split('-')
+            start = int(start)
+            end = min(int(end) if end else size - 1, size - 1)
+            if start >= size:
+                raise client_error('InvalidRange', 'The requested range is not satisfiable', 'GetObject', 416)
+            f.seek(start)
+            content = f.read(end - start + 1)
+        return {'Body': io.BytesIO(content), 'ContentLength': len(content), 'ETag': etag,
+                'ContentRange': 'bytes {}-{}/{}'.format(start, end, size)}
+
+    def head_object(self, Bucket, Key, **kwargs):
+        path = self.existing(Bucket, Key, 'HeadObject')
+        return {'ContentLength': os.path.getsize(path), 'ETag': self.etag(path)}
+
+    def put_object(self, Bucket, Key, Body=b'', **kwargs):
+        return {'ETag': self.write(Bucket, Key, as_bytes(Body))}
+
+    def upload_fileobj(self, Fileobj, Bucket, Key, ExtraArgs=None, Callback=None, Config=None):
+        self.write(Bucket, Key, as_bytes(Fileobj))
+
+    def create_multipart_upload(self, Bucket, Key, **kwargs):
+        upload_id = uuid.uuid4().hex
+        with self.lock:
+            self.uploads[upload_id] = {}
+        return {'Bucket': Bucket, 'Key': Key, 'UploadId': upload_id}
+
+    def upload_part(self, Bucket, Key, PartNumber, UploadId, Body, **kwargs):
+        content = as_bytes(Body)
+        with self.lock:
+            if UploadId not in self.uploads:
+                raise client_error('NoSuchUpload', 'The specified upload does not exist.', 'UploadPart', 404)
+            self.uploads[UploadId][PartNumber] = content
+        return {'ETag': '"{}"'.format(hashlib.md5(content).hexdigest())}
+
+    def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload, **kwargs):
+        with self.lock:
+            parts = self.uploads.pop(UploadId, None)
+        if parts is None:
+            raise client_error('NoSuchUpload', 'The specified upload does not exist.', 'CompleteMultipartUpload', 404)
+        content = b''.join(parts[part['PartNumber']] for part in sorted(MultipartUpload['Parts'],
+                                                                        key=lambda part: part['PartNumber']))
+        return {'Bucket': Bucket, 'Key': Key, 'ETag': self.write(Bucket, Key, content)}
+
+    def abort_multipart_upload(self, Bucket, Key, UploadId, **kwargs):
+        with self.lock:
+            self.uploads.pop(UploadId, None)
+        return {}
+
+    def list_objects_v2(self, Bucket, Prefix='', Delimiter=None, **kwargs):
+        top = os.path.join(self.root, Bucket)
+        contents, prefixes = [], set()
+        # Only walk the folder the prefix points into
+        for path, dirs, files in os.walk(os.path.join(top, *Prefix.split('/')[:-1])):
+            for name in files:
+                if name.endswith('.tmp'):
+                    continue
+                key = os.path.relpath(os.path.join(path, name), top).replace(os.sep, '/')
+                if not key.startswith(Prefix):
+                    continue
+                rest = key[len(Prefix):]
+                if Delimiter and Delimiter in rest:
+                    prefixes.add(Prefix + rest.split(Delimiter, 1)[0] + Delimiter)
+                else:
+                    contents.append({'Key': key, 'Size': os.path.getsize(os.path.join(path, name))})
+        response = {'Name': Bucket, 'Prefix': Prefix, 'IsTruncated': False, 'KeyCount': len(contents),
+                    'Contents': sorted(contents, key=lambda item: item['Key'])}
+        if prefixes:
+            response['CommonPrefixes'] = [{'Prefix': prefix} for prefix in sorted(prefixes)]
+        return response
+
+    list_objects = list_objects_v2
+
+    def get_paginator(self, operation_name):
+        return LocalPaginator(getattr(self, operation_name))
+
+
+class LocalPaginator:
+    """Single page paginator, search only supports plain top level keys like 'CommonPrefixes'"""
+
+    def __init__(self, operation):
+        self.operation = operation
+
+    def paginate(self, **kwargs):
+        return LocalPages([self.operation(**kwargs)])
+
+
+class LocalPages:
+    def __init__(self, pages):
+        self.pages = pages
+
+    def __iter__(self):
+        return iter(self.pages)
+
+    def search(self, expression):
+        for page in self.pages:
+            for item in page.get(expression, []):
+                yield item
+
+
+class LocalQueue:
+    def __init__(self, name):
+        self.name = name
+        self.url = 'https://sqs.{}.amazonaws.com/{}/{}'.format(REGION_NAME, ACCOUNT_ID, name)
+        self.arn = 'arn:aws:sqs:{}:{}:{}'.format(REGION_NAME, ACCOUNT_ID, name)
+        self.visible = deque()
+        self.in_flight = {}
+        # Delete times, for the NumberOfMessagesDeleted metric
+        self.deleted = deque()
+        self.dead = []
+
+
+class LocalSqs:
+    def __init__(self):
+        self.queues = {}
+        self.lock = threading.Lock()
+
+    def create_queue(self, QueueName, **kwargs):
+        with self.lock:
+            queue = self.queues.setdefault(QueueName, LocalQueue(QueueName))
+        return {'QueueUrl': queue.url}
+
+    def queue(self, queue_url):
+        queue = self.queues.get(queue_url.rstrip('/').split('/')[-1])
+        if queue is None or queue.url != queue_url:
+            raise client_error('AWS.SimpleQueueService.NonExistentQueue', 'The specified queue does not exist.',
+                               'SendMessage')
+        return queue
+
+    def send_message(self, QueueUrl, MessageBody, MessageGroupId=None, **kwargs):
+        queue = self.queue(QueueUrl)
+        message = {
+            'MessageId': str(uuid.uuid4()),
+            'Body': MessageBody,
+            'SentTimestamp': time.time(),
+            'ReceiveCount': 0,
+            'MessageGroupId': MessageGroupId,
+        }
+        with self.lock:
+            queue.visible.append(message)
+        return {'MessageId': message['MessageId'], 'MD5OfMessageBody': hashlib.md5(
+            MessageBody.encode('utf-8')).hexdigest()}
+
+    def send_message_batch(self, QueueUrl, Entries):
+        successful = []
+        for entry in Entries:
+            response = self.send_message(QueueUrl, entry['MessageBody'], entry.get('MessageGroupId'))
+            successful.append(dict(response, Id=entry['Id']))
+        return {'Successful': successful, 'Failed': []}
+
+    def get_queue_attributes(self, QueueUrl, AttributeNames=None):
+        queue = self.queue(QueueUrl)
+        with self.lock:
+            return {'Attributes': {
+                'ApproximateNumberOfMessages': str(len(queue.visible)),
+                'ApproximateNumberOfMessagesNotVisible': str(len(queue.in_flight)),
+                'ApproximateNumberOfMessagesDelayed': '0',
+            }}
+
+    # Used by the runner in place of the Lambda event source mapping
+
+    def receive(self, queue_url, max_messages):
+        queue = self.queue(queue_url)
+        with self.lock:
+            messages = []
+            while queue.visible and len(messages) < max_messages:
+                message = queue.visible.popleft()
+                message['ReceiveCount'] += 1
+                queue.in_flight[message['MessageId']] = message
+                messages.append(message)
+        return messages
+
+    def delete(self, queue_url, message):
+        queue = self.queue(queue_url)
+        with self.lock:
+            queue.in_flight.pop(message['MessageId'], None)
+            queue.deleted.append(time.time())
+
+    def release(self, queue_url, message, max_receives):
+        """Make a failed message visible again, or move it to the dead letters after max_receives attempts"""
+        queue = self.queue(queue_url)
+        with self.lock:
+            queue.in_flight.pop(message['MessageId'], None)
+            if message['ReceiveCount'] >= max_receives:
+                queue.dead.append(message)
+                return False
+            queue.visible.append(message)
+            return True
+
+    def pending(self):
+        with self.lock:
+            return sum(len(queue.visible) + len(queue.in_flight) for queue in self.queues.values())
+
+
+class LocalSns:
+    def __init__(self, sqs):
+        self.sqs = sqs
+        self.subscriptions = {}
+
+    def create_topic(self, Name, **kwargs):
+        arn = 'arn:aws:sns:{}:{}:{}'.format(REGION_NAME, ACCOUNT_ID, Name)
+        self.subscriptions.setdefault(arn, [])
+        return {'TopicArn': arn}
+
+    def subscribe(self, TopicArn, Protocol, Endpoint, **kwargs):
+        # Endpoint is the queue url here, not its arn
+        self.subscriptions[TopicArn].append(Endpoint)
+        return {'SubscriptionArn': '{}:{}'.format(TopicArn, uuid.uuid4())}
+
+    def publish(self, TopicArn, Message, Subject=None, **kwargs):
+        if TopicArn not in self.subscriptions:
+            raise client_error('NotFound', 'Topic does not exist', 'Publish', 404)
+        message_id = str(uuid.uuid4())
+        # Without raw message delivery the queues receive the notification envelope
+        envelope = json.dumps({
+            'Type': 'Notification',
+            'MessageId': message_id,
+            'TopicArn': TopicArn,
+            'Subject': Subject,
+            'Message': Message,
+            'Timestamp': time.strftime('%Y-%m-%dT%H:%M:%S.000Z', time.gmtime()),
+        })
+        for queue_url in self.subscriptions[TopicArn]:
+            self.sqs.send_message(queue_url, envelope)
+        return {'MessageId': message_id}
+
+
+class LocalSecretsManager:
+    def __init__(self, secrets=None):
+        self.secrets = dict(secrets or {})
+
+    def get_secret_value(self, SecretId, **kwargs):
+        if SecretId not in self.secrets:
+            raise client_error('ResourceNotFoundException', "Secrets Manager can't find the specified secret.",
+                               'GetSecretValue')
+        return {'Name': SecretId, 'SecretString': json.dumps(self.secrets[SecretId])}
+
+
+class LocalCloudWatch:
+    """The ApproximateAgeOfOldestMessage and NumberOfMessagesDeleted queue metrics, newest period first"""
+
+    def __init__(self, sqs):
+        self.sqs = sqs
+
+    def get_metric_data(self, MetricDataQueries, StartTime, EndTime, **kwargs):
+        now = time.time()
+        window = (EndTime - StartTime).total_seconds()
+        results = []
+        for query in MetricDataQueries:
+            stat = query['MetricStat']
+            dimensions = {item['Name']: item['Value'] for item in stat['Metric']['Dimensions']}
+            queue = self.sqs.queues.get(dimensions.get('QueueName'))
+            values = []
+            if queue is not None:
+                with self.sqs.lock:
+                    if stat['Metric']['MetricName'] == 'ApproximateAgeOfOldestMessage':
+                        if queue.visible:
+                            values = [now - queue.visible[0]['SentTimestamp']]
+                    elif stat['Metric']['MetricName'] == 'NumberOfMessagesDeleted':
+                        periods = {}
+                        for deleted in queue.deleted:
+                            age = now - deleted
+                            if age < window:
+                                period = int(age // stat['Period'])
+                                periods[period] = periods.get(period, 0) + 1
+                        values = [periods[period] for period in sorted(periods)]
+            results.append({'Id': query['Id'], 'Label': query['Id'], 'Values': values, 'StatusCode': 'Complete'})
+        return {'MetricDataResults': results}
+
+    def put_metric_data(self, **kwargs):
+        return {}
+
+
+class LocalAws:
+    """Every stand-in of one local run"""
+
+    def __init__(self, s3_root, secrets=None):
+        self.s3 = LocalS3(s3_root)
+        self.sqs = LocalSqs()
+        self.sns = LocalSns(self.sqs)
+        self.secretsmanager = LocalSecretsManager(secrets)
+        self.cloudwatch = LocalCloudWatch(self.sqs)
+
+    def client(self, service_name, *args, **kwargs):
+        services = {'s3': self.s3, 'sqs': self.sqs, 'sns': self.sns, 'secretsmanager': self.secretsmanager,
+                    'cloudwatch': self.cloudwatch}
+        if service_name not in services:
+            raise ValueError('No local stand-in for AWS service {}'.format(service_name))
+        return services[service_name]
+
+    def install(self):
+        """Make boto3.client return the stand-ins, call before importing a stage"""
+        boto3.client = self.client